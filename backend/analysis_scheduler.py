@@ -0,0 +1,239 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from measurement_service import MeasurementService
+from metrics import increment, observe_stage
+
+
+class CameraBusyError(Exception):
+    def __init__(self, camera_id, retry_after):
+        """
+        A câmera está ocupada e a fila de espera está cheia (ou a espera
+        excedeu o limite).
+
+        Args:
+            camera_id: Índice da câmera
+            retry_after: Sugestão de espera (s) antes de tentar de novo
+        """
+        super().__init__(f'Câmera {camera_id} ocupada; tente novamente em {retry_after} s')
+        self.camera_id = camera_id
+        self.retry_after = retry_after
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.queued_at = time.monotonic()
+        self.started_at = None
+
+
+class _CameraState:
+    def __init__(self):
+        self.busy = False
+        self.queue = deque()
+        self.calls = {}
+        self.durations = deque(maxlen=20)
+
+
+class AnalysisScheduler:
+    def __init__(self, max_queue=None, wait_timeout=None, default_duration=2.0):
+        """
+        Serializa as análises de cada câmera e une pedidos idênticos.
+
+        Cada câmera tem uma concessão exclusiva e uma fila de espera limitada
+        (FIFO). Um pedido idêntico a outro ainda em andamento (na fila ou em
+        execução) não gera nova captura: aguarda e recebe o mesmo resultado.
+
+        Args:
+            max_queue: Pedidos aguardando por câmera (padrão:
+                ANALYSIS_QUEUE_SIZE ou 4)
+            wait_timeout: Espera máxima (s) por um resultado (padrão:
+                ANALYSIS_WAIT_TIMEOUT ou 30)
+            default_duration: Duração estimada (s) de uma análise antes de
+                haver histórico
+        """
+        self.max_queue = max_queue if max_queue is not None else int(
+            os.getenv('ANALYSIS_QUEUE_SIZE', 4))
+        self.wait_timeout = wait_timeout if wait_timeout is not None else float(
+            os.getenv('ANALYSIS_WAIT_TIMEOUT', 30))
+        self.default_duration = default_duration
+        self._cameras = {}
+        self._cond = threading.Condition()
+
+    def _expected_duration(self, camera):
+        # Deve ser chamado com self._cond adquirido
+        durations = camera.durations
+        return sum(durations) / len(durations) if durations else self.default_duration
+
+    def _retry_after(self, camera):
+        # Deve ser chamado com self._cond adquirido
+        return max(1, math.ceil(self._expected_duration(camera) * (len(camera.queue) + 1)))
+
+    def run(self, camera_id, key, func):
+        """
+        Executa func() com a câmera reservada.
+
+        Args:
+            camera_id: Índice da câmera
+            key: Identificação (hashable) dos parâmetros do pedido; pedidos
+                com a mesma chave são unidos
+            func: Função sem argumentos que executa a análise
+
+        Returns:
+            Tupla (resultado, True se o resultado veio de outro pedido)
+
+        Raises:
+            CameraBusyError: Fila cheia, espera na fila acima de
+                wait_timeout ou pedido unido cuja análise passou muito do
+                tempo esperado
+        """
+        with self._cond:
+            camera = self._cameras.setdefault(camera_id, _CameraState())
+            call = camera.calls.get(key)
+            owner = call is None
+            if owner:
+                if camera.busy and len(camera.queue) >= self.max_queue:
+                    increment('macrovision_analyses_busy_total',
+                              'Pedidos de análise recusados por câmera ocupada')
+                    raise CameraBusyError(camera_id, self._retry_after(camera))
+                call = _Call()
+                camera.calls[key] = call
+                camera.queue.append(call)
+
+        if not owner:
+            increment('macrovision_analyses_coalesced_total',
+                      'Pedidos de análise unidos a um idêntico em andamento')
+            self._wait_for(camera_id, camera, call)
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        self._acquire(camera_id, camera, key, call)
+        start = time.monotonic()
+        try:
+            call.result = func()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._cond:
+                camera.busy = False
+                camera.calls.pop(key, None)
+                camera.durations.append(time.monotonic() - start)
+                self._cond.notify_all()
+            call.done.set()
+
+    def _wait_for(self, camera_id, camera, call):
+        # A espera acompanha o pedido original, não o momento em que este
+        # chegou: enquanto ele está na fila, vale o prazo dele (ao expirar,
+        # ele mesmo falha e o erro é repassado); em execução, espera o tempo
+        # que ainda falta pela duração média, com folga
+        while True:
+            with self._cond:
+                if call.started_at is None:
+                    deadline = call.queued_at + self.wait_timeout + 1
+                else:
+                    deadline = call.started_at + 3 * self._expected_duration(camera)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 and not call.done.is_set():
+                    if call.started_at is not None:
+                        raise CameraBusyError(camera_id, self._retry_after(camera))
+                    remaining = 0.1
+            if call.done.wait(max(remaining, 0)):
+                return
+
+    def _acquire(self, camera_id, camera, key, call):
+        start = call.queued_at
+        deadline = start + self.wait_timeout
+        with self._cond:
+            while camera.busy or camera.queue[0] is not call:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not camera.busy and camera.queue[0] is call:
+                        break
+                    camera.queue.remove(call)
+                    camera.calls.pop(key, None)
+                    call.error = CameraBusyError(camera_id, self._retry_after(camera))
+                    call.done.set()
+                    self._cond.notify_all()
+                    increment('macrovision_analyses_busy_total',
+                              'Pedidos de análise recusados por câmera ocupada')
+                    raise call.error
+            camera.queue.popleft()
+            camera.busy = True
+            call.started_at = time.monotonic()
+        observe_stage('camera_lease_wait', time.monotonic() - start)
+
+    def status(self, camera_id):
+        """
+        Situação de uma câmera no agendador.
+
+        Returns:
+            dict com busy, queued e retry_after
+        """
+        with self._cond:
+            camera = self._cameras.get(camera_id)
+            if camera is None:
+                return {'busy': False, 'queued': 0, 'retry_after': 0}
+            return {
+                'busy': camera.busy,
+                'queued': len(camera.queue),
+                'retry_after': self._retry_after(camera) if camera.busy else 0
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_analysis_scheduler():
+    """Retorna o agendador de análises compartilhado pelo processo."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = AnalysisScheduler()
+        return _scheduler
+
+
+def scheduled_analysis(camera_id, save_to_s3=True, async_upload=True,
+                       include_timings=False, **options):
+    """
+    Executa MeasurementService.perform_analysis pelo agendador.
+
+    Pedidos com os mesmos parâmetros para a mesma câmera, feitos enquanto
+    outro ainda está em andamento, recebem o mesmo resultado (com
+    coalesced=True).
+
+    Args:
+        camera_id: Índice da câmera
+        save_to_s3, async_upload, include_timings: Repassados a perform_analysis
+        **options: Argumentos de MeasurementService
+
+    Returns:
+        dict com resultados da análise
+
+    Raises:
+        CameraBusyError: A câmera está ocupada e a fila de espera cheia
+    """
+    key = json.dumps(
+        {'options': options, 'save_to_s3': save_to_s3, 'async_upload': async_upload,
+         'include_timings': include_timings},
+        sort_keys=True, default=str
+    )
+    result, coalesced = get_analysis_scheduler().run(
+        camera_id,
+        key,
+        lambda: MeasurementService(camera_id=camera_id, **options).perform_analysis(
+            save_to_s3=save_to_s3,
+            async_upload=async_upload,
+            include_timings=include_timings
+        )
+    )
+    return dict(result, coalesced=True) if coalesced else result
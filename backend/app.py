@@ -1,11 +1,23 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
 import os
+import tempfile
+import uuid
 from dotenv import load_dotenv
+from werkzeug.utils import secure_filename
 
-from camera_service import get_available_cameras, test_camera_connection
-from measurement_service import MeasurementService
-from s3_service import S3Service
+from background_jobs import DEFAULT_RESULTS_DIR, get_job_registry
+from calibration_service import get_calibration_store
+from image_index import get_image_index, parse_date_filter
+from measurement_store import get_measurement_store
+from metrics import get_metrics_registry
+from s3_service import get_s3_service
+from upload_queue import get_upload_queue
+
+# Módulos que usam câmeras e OpenCV (analysis_scheduler, camera_service,
+# live_stream, multi_camera, offline_analysis) são importados nas próprias
+# rotas: o servidor sobe sem carregar o cv2, e as rotas só de leitura não
+# dependem dele
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -13,9 +25,6 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Permite requisições do React
 
-# Inicializa serviço S3
-s3_service = S3Service()
-
 @app.route('/api/status', methods=['GET'])
 def status():
     """Health check do servidor."""
@@ -25,11 +34,22 @@ def status():
         's3_configured': bool(os.getenv('AWS_BUCKET_NAME'))
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Métricas de latência e falhas no formato do Prometheus."""
+    return Response(
+        get_metrics_registry().render(),
+        mimetype='text/plain; version=0.0.4'
+    )
+
 @app.route('/api/cameras', methods=['GET'])
 def list_cameras():
     """Lista todas as câmeras disponíveis no sistema."""
+    from camera_service import get_available_cameras
+    
     try:
-        cameras = get_available_cameras()
+        force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+        cameras = get_available_cameras(force_refresh=force_refresh)
         return jsonify({
             'success': True,
             'cameras': cameras,
@@ -46,6 +66,8 @@ def list_cameras():
 def test_camera(camera_id):
     """Testa conexão com uma câmera específica."""
     try:
+        from camera_service import test_camera_connection
+        
         result = test_camera_connection(camera_id)
         return jsonify(result)
     except Exception as e:
@@ -54,9 +76,49 @@ def test_camera(camera_id):
             'message': f'Erro ao testar câmera: {str(e)}'
         }), 500
 
+@app.route('/api/cameras/<int:camera_id>/calibration', methods=['GET'])
+def get_calibration(camera_id):
+    """Retorna a calibração salva de uma câmera."""
+    calibration = get_calibration_store().get(camera_id)
+    if calibration is None:
+        return jsonify({
+            'success': False,
+            'message': f'Câmera {camera_id} ainda não foi calibrada'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'calibration': calibration
+    })
+
+@app.route('/api/cameras/<int:camera_id>/calibration', methods=['DELETE'])
+def reset_calibration(camera_id):
+    """Descarta a calibração de uma câmera (recalibra na próxima análise)."""
+    removed = get_calibration_store().delete(camera_id)
+    return jsonify({
+        'success': True,
+        'message': 'Calibração removida' if removed else 'Câmera não estava calibrada'
+    })
+
+def _busy_response(error):
+    """Resposta 429 com Retry-After para câmera ocupada."""
+    response = jsonify({
+        'success': False,
+        'busy': True,
+        'message': str(error),
+        'retry_after': error.retry_after,
+        'measurements': None,
+        'images': []
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
     """Executa análise dimensional e salva imagens no S3."""
+    from analysis_scheduler import CameraBusyError, scheduled_analysis
+    
     try:
         data = request.get_json()
         camera_id = data.get('camera_id')
@@ -70,19 +132,34 @@ def analyze():
         # Parâmetros opcionais
         reference_width = data.get('reference_width', 10.0)
         num_captures = data.get('num_captures', 8)
+        processing_mode = data.get('processing_mode')
+        adaptive = data.get('adaptive', False)
+        tolerance = data.get('tolerance', 0.05)
+        max_captures = data.get('max_captures', 32)
+        quality_gate = data.get('quality_gate')
+        multi_object = data.get('multi_object', False)
+        include_timings = data.get('timings', False)
         
-        # Cria serviço de medição e executa análise
-        service = MeasurementService(
-            camera_id=camera_id,
+        # Executa análise com upload para S3; pedidos iguais simultâneos
+        # compartilham a mesma captura
+        result = scheduled_analysis(
+            camera_id,
+            save_to_s3=True,
+            include_timings=include_timings,
             reference_width_cm=reference_width,
-            num_captures=num_captures
+            num_captures=num_captures,
+            processing_mode=processing_mode,
+            adaptive=adaptive,
+            tolerance_cm=tolerance,
+            max_captures=max_captures,
+            quality_gate=quality_gate,
+            multi_object=multi_object
         )
         
-        # Executa análise com upload para S3
-        result = service.perform_analysis(save_to_s3=True)
-        
         return jsonify(result)
         
+    except CameraBusyError as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -91,15 +168,355 @@ def analyze():
             'images': []
         }), 500
 
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Analisa a mesma peça com várias câmeras simultaneamente."""
+    from multi_camera import analyze_cameras
+    
+    try:
+        data = request.get_json() or {}
+        cameras = data.get('cameras') or []
+        
+        if not cameras or any(c.get('camera_id') is None for c in cameras):
+            return jsonify({
+                'success': False,
+                'message': 'Informe a lista de câmeras (camera_id e reference_width)'
+            }), 400
+        
+        camera_ids = [c['camera_id'] for c in cameras]
+        if len(set(camera_ids)) != len(camera_ids):
+            return jsonify({
+                'success': False,
+                'message': 'Câmeras repetidas na lista'
+            }), 400
+        
+        result = analyze_cameras(
+            cameras,
+            save_to_s3=True,
+            include_timings=data.get('timings', False),
+            num_captures=data.get('num_captures', 8),
+            processing_mode=data.get('processing_mode'),
+            adaptive=data.get('adaptive', False),
+            tolerance_cm=data.get('tolerance', 0.05),
+            max_captures=data.get('max_captures', 32),
+            quality_gate=data.get('quality_gate')
+        )
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro durante análise: {str(e)}',
+            'measurements': None,
+            'cameras': []
+        }), 500
+
+@app.route('/api/live/<int:camera_id>/video', methods=['GET'])
+def live_video(camera_id):
+    """Frames anotados ao vivo em MJPEG (multipart/x-mixed-replace)."""
+    from live_stream import get_live_stream
+    
+    reference_width = request.args.get('reference_width', 10.0, type=float)
+    stream = get_live_stream(camera_id, reference_width)
+    return Response(
+        stream.mjpeg(),
+        mimetype='multipart/x-mixed-replace; boundary=frame',
+        headers={'Cache-Control': 'no-cache'}
+    )
+
+@app.route('/api/live/<int:camera_id>/events', methods=['GET'])
+def live_events(camera_id):
+    """Medições ao vivo via Server-Sent Events."""
+    from live_stream import get_live_stream
+    
+    reference_width = request.args.get('reference_width', 10.0, type=float)
+    stream = get_live_stream(camera_id, reference_width)
+    return Response(
+        stream.events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/live/<int:camera_id>/commit', methods=['POST'])
+def live_commit(camera_id):
+    """Registra a medição ao vivo atual e salva a imagem no S3."""
+    from live_stream import find_live_stream
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        stream = find_live_stream(camera_id, data.get('reference_width'))
+        if stream is None:
+            return jsonify({
+                'success': False,
+                'message': 'Nenhum fluxo ao vivo ativo para esta câmera'
+            }), 404
+        
+        result = stream.commit()
+        return jsonify(result), 200 if result['success'] else 409
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao registrar medição: {str(e)}'
+        }), 500
+
+@app.route('/api/offline/analyze', methods=['POST'])
+def offline_analyze():
+    """
+    Mede imagens e vídeos enviados (multipart, campo "files") em segundo plano.
+    
+    Os resultados de cada frame são gravados em JSONL ou CSV ("format") e
+    podem ser baixados em /api/offline/results/<arquivo>.
+    """
+    from offline_analysis import analyze_uploaded
+    
+    try:
+        files = [f for f in request.files.getlist('files') if f.filename]
+        if not files:
+            return jsonify({
+                'success': False,
+                'message': 'Envie ao menos um arquivo no campo "files"'
+            }), 400
+        
+        output_format = request.form.get('format', 'jsonl')
+        if output_format not in ('jsonl', 'csv'):
+            return jsonify({
+                'success': False,
+                'message': 'Formato deve ser "jsonl" ou "csv"'
+            }), 400
+        
+        upload_dir = tempfile.mkdtemp(prefix='macrovision_offline_')
+        for i, file in enumerate(files):
+            name = secure_filename(file.filename) or f'arquivo_{i}'
+            file.save(os.path.join(upload_dir, f'{i:04d}_{name}'))
+        
+        results_dir = os.getenv('OFFLINE_RESULTS_DIR', DEFAULT_RESULTS_DIR)
+        os.makedirs(results_dir, exist_ok=True)
+        filename = f'offline_{uuid.uuid4().hex}.{output_format}'
+        
+        job = get_job_registry().submit(
+            f'Análise offline de {len(files)} arquivos',
+            analyze_uploaded,
+            upload_dir,
+            os.path.join(results_dir, filename),
+            output_format,
+            reference_width_cm=request.form.get('reference_width', 10.0, type=float),
+            frame_step=request.form.get('frame_step', 1, type=int)
+        )
+        return jsonify({
+            'success': True,
+            'message': 'Análise iniciada em segundo plano',
+            'job': job,
+            'results_url': f'/api/offline/results/{filename}'
+        }), 202
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao iniciar análise offline: {str(e)}'
+        }), 500
+
+@app.route('/api/offline/results/<filename>', methods=['GET'])
+def offline_results(filename):
+    """Baixa o arquivo de resultados de uma análise offline."""
+    return send_from_directory(
+        os.getenv('OFFLINE_RESULTS_DIR', DEFAULT_RESULTS_DIR),
+        filename,
+        as_attachment=True
+    )
+
+def _history_filters():
+    """Filtros comuns das consultas ao histórico: camera_id, start_date e end_date."""
+    return {
+        'camera_id': request.args.get('camera_id', type=int),
+        'start': parse_date_filter(request.args.get('start_date')),
+        'end': parse_date_filter(request.args.get('end_date'), end=True)
+    }
+
+def _invalid_date_response():
+    return jsonify({
+        'success': False,
+        'message': 'Data inválida (use o formato ISO 8601, ex.: 2025-01-18)'
+    }), 400
+
+@app.route('/api/measurements', methods=['GET'])
+def list_measurements():
+    """
+    Lista o histórico de medições, das mais recentes para as mais antigas.
+    
+    Parâmetros de query (opcionais): camera_id, start_date, end_date,
+    limit (máx. 1000) e offset.
+    """
+    try:
+        filters = _history_filters()
+    except ValueError:
+        return _invalid_date_response()
+    
+    try:
+        page = get_measurement_store().list(
+            limit=min(request.args.get('limit', 100, type=int), 1000),
+            offset=request.args.get('offset', 0, type=int),
+            **filters
+        )
+        return jsonify({
+            'success': True,
+            'measurements': page['items'],
+            'count': len(page['items']),
+            'total': page['total']
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao consultar histórico: {str(e)}',
+            'measurements': []
+        }), 500
+
+@app.route('/api/measurements/daily', methods=['GET'])
+def daily_measurements():
+    """Médias diárias das medições (camera_id, start_date, end_date opcionais)."""
+    try:
+        filters = _history_filters()
+    except ValueError:
+        return _invalid_date_response()
+    
+    try:
+        return jsonify({
+            'success': True,
+            'days': get_measurement_store().daily(**filters)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao consultar histórico: {str(e)}'
+        }), 500
+
+@app.route('/api/measurements/percentiles', methods=['GET'])
+def measurement_percentiles():
+    """
+    Percentis das medidas no período.
+    
+    Parâmetros de query (opcionais): camera_id, start_date, end_date e p
+    (lista separada por vírgulas, padrão 50,90,95,99).
+    """
+    try:
+        filters = _history_filters()
+        percentiles = [float(p) for p in request.args.get('p', '50,90,95,99').split(',')]
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Parâmetros inválidos (datas em ISO 8601, percentis numéricos)'
+        }), 400
+    
+    if any(not 0 < p <= 100 for p in percentiles):
+        return jsonify({
+            'success': False,
+            'message': 'Percentis devem estar entre 0 e 100'
+        }), 400
+    
+    try:
+        return jsonify({
+            'success': True,
+            **get_measurement_store().percentiles(percentiles=percentiles, **filters)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao consultar histórico: {str(e)}'
+        }), 500
+
+@app.route('/api/measurements/out-of-tolerance', methods=['GET'])
+def measurements_out_of_tolerance():
+    """
+    Conta medições fora da tolerância.
+    
+    Parâmetros de query: width e/ou length (medidas nominais em cm),
+    tolerance (cm, padrão 0.1) e os filtros camera_id, start_date e end_date.
+    """
+    width = request.args.get('width', type=float)
+    length = request.args.get('length', type=float)
+    if width is None and length is None:
+        return jsonify({
+            'success': False,
+            'message': 'Informe a medida nominal (width e/ou length)'
+        }), 400
+    
+    try:
+        filters = _history_filters()
+    except ValueError:
+        return _invalid_date_response()
+    
+    try:
+        return jsonify({
+            'success': True,
+            **get_measurement_store().out_of_tolerance(
+                width=width,
+                length=length,
+                tolerance=request.args.get('tolerance', 0.1, type=float),
+                **filters
+            )
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao consultar histórico: {str(e)}'
+        }), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Consulta o status de um upload em segundo plano."""
+    status = get_upload_queue().get_status(upload_id)
+    if status is None:
+        return jsonify({
+            'success': False,
+            'message': 'Upload não encontrado'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'upload': status
+    })
+
 @app.route('/api/images', methods=['GET'])
 def list_images():
-    """Lista todas as imagens armazenadas no S3."""
+    """
+    Lista as imagens armazenadas no S3, com paginação.
+    
+    Cada item traz a URL da imagem e a da miniatura (None se não houver);
+    as miniaturas não aparecem como itens próprios.
+    
+    Parâmetros de query (opcionais): prefix, start_date, end_date (ISO 8601),
+    page_size (máx. 1000), continuation_token e order ('asc' ou 'desc').
+    """
+    try:
+        start = parse_date_filter(request.args.get('start_date'))
+        end = parse_date_filter(request.args.get('end_date'), end=True)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Data inválida (use o formato ISO 8601, ex.: 2025-01-18)',
+            'images': []
+        }), 400
+    
     try:
-        images = s3_service.list_images()
+        page = get_image_index().query(
+            prefix=request.args.get('prefix'),
+            start=start,
+            end=end,
+            continuation_token=request.args.get('continuation_token'),
+            page_size=request.args.get('page_size', 100, type=int),
+            descending=request.args.get('order', 'asc') == 'desc'
+        )
+        s3_service = get_s3_service()
+        for item in page['items']:
+            item['url'] = s3_service.build_url(item['key'])
+            item['thumbnail_url'] = (
+                s3_service.build_url(item['thumbnail_key']) if item['thumbnail_key'] else None
+            )
         return jsonify({
             'success': True,
-            'images': images,
-            'count': len(images)
+            'images': page['items'],
+            'count': len(page['items']),
+            'next_token': page['next_token']
         })
     except Exception as e:
         return jsonify({
@@ -108,11 +525,27 @@ def list_images():
             'images': []
         }), 500
 
+@app.route('/api/storage/<path:s3_key>', methods=['GET'])
+def serve_stored_image(s3_key):
+    """
+    Serve um arquivo do armazenamento local (STORAGE_BACKEND=local).
+    
+    Cada chave recebe um único arquivo (o nome traz data, hora e câmera),
+    então o arquivo pode ficar em cache no navegador.
+    """
+    s3_service = get_s3_service()
+    if s3_service.storage_backend != 'local':
+        return jsonify({
+            'success': False,
+            'message': 'Armazenamento local desativado'
+        }), 404
+    return send_from_directory(s3_service.s3_client.root, s3_key, max_age=86400)
+
 @app.route('/api/images/<path:s3_key>', methods=['DELETE'])
 def delete_image(s3_key):
     """Remove uma imagem específica do S3."""
     try:
-        result = s3_service.delete_image(s3_key)
+        result = get_s3_service().delete_image(s3_key)
         return jsonify(result)
     except Exception as e:
         return jsonify({
@@ -122,20 +555,29 @@ def delete_image(s3_key):
 
 @app.route('/api/images/clear', methods=['DELETE'])
 def clear_images():
-    """Remove todas as imagens do S3 (usar com cuidado)."""
+    """
+    Remove todas as imagens do S3 (usar com cuidado).
+    
+    Com ?background=true a remoção roda em segundo plano e a resposta traz o
+    job_id para acompanhar o progresso em /api/jobs/<job_id>.
+    """
     try:
-        images = s3_service.list_images()
-        deleted_count = 0
+        def clear_all(progress_callback=None):
+            s3_service = get_s3_service()
+            return s3_service.delete_images(
+                s3_service.list_images(),
+                progress_callback=progress_callback
+            )
         
-        for s3_key in images:
-            result = s3_service.delete_image(s3_key)
-            if result['success']:
-                deleted_count += 1
+        if request.args.get('background', 'false').lower() == 'true':
+            job = get_job_registry().submit('Remoção de todas as imagens', clear_all)
+            return jsonify({
+                'success': True,
+                'message': 'Remoção iniciada em segundo plano',
+                'job': job
+            }), 202
         
-        return jsonify({
-            'success': True,
-            'message': f'{deleted_count} imagens removidas'
-        })
+        return jsonify(clear_all())
     except Exception as e:
         return jsonify({
             'success': False,
@@ -144,12 +586,28 @@ def clear_images():
 
 @app.route('/api/images/cleanup', methods=['POST'])
 def cleanup_old_images():
-    """Remove imagens antigas do S3."""
+    """
+    Remove imagens antigas do S3.
+    
+    Com "background": true no corpo, a remoção roda em segundo plano.
+    """
     try:
         data = request.get_json()
         days = data.get('days', 30)
         
-        result = s3_service.clear_old_images(days=days)
+        if data.get('background', False):
+            job = get_job_registry().submit(
+                f'Remoção de imagens com mais de {days} dias',
+                get_s3_service().clear_old_images,
+                days=days
+            )
+            return jsonify({
+                'success': True,
+                'message': 'Remoção iniciada em segundo plano',
+                'job': job
+            }), 202
+        
+        result = get_s3_service().clear_old_images(days=days)
         return jsonify(result)
     except Exception as e:
         return jsonify({
@@ -157,11 +615,26 @@ def cleanup_old_images():
             'message': f'Erro ao limpar imagens antigas: {str(e)}'
         }), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Consulta o progresso de uma tarefa em segundo plano."""
+    job = get_job_registry().get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': 'Tarefa não encontrada'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
 @app.route('/api/images/presigned/<path:s3_key>', methods=['GET'])
 def get_presigned_url(s3_key):
     """Gera URL assinada temporária para uma imagem."""
     try:
-        url = s3_service.generate_presigned_url(s3_key)
+        url = get_s3_service().generate_presigned_url(s3_key)
         if url:
             return jsonify({
                 'success': True,
@@ -178,6 +651,32 @@ def get_presigned_url(s3_key):
             'message': f'Erro: {str(e)}'
         }), 500
 
+@app.route('/api/images/presigned', methods=['POST'])
+def get_presigned_urls():
+    """Gera URLs assinadas para uma lista de imagens em uma única chamada."""
+    try:
+        data = request.get_json()
+        s3_keys = data.get('keys', [])
+        expiration = data.get('expiration', 3600)
+        
+        if not isinstance(s3_keys, list) or len(s3_keys) > 1000:
+            return jsonify({
+                'success': False,
+                'message': 'Envie uma lista "keys" com até 1000 chaves'
+            }), 400
+        
+        urls = get_s3_service().generate_presigned_urls(s3_keys, expiration=expiration)
+        return jsonify({
+            'success': True,
+            'urls': urls,
+            'expiration': expiration
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro: {str(e)}'
+        }), 500
+
 if __name__ == '__main__':
     print("=" * 50)
     print("Backend MacroVision iniciado!")
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Onde as tarefas de análise offline gravam os resultados. Fica aqui, e não em
+# offline_analysis, para que a rota de download não precise carregar o cv2
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offline_results')
+
+
+class JobRegistry:
+    def __init__(self, max_tracked=200):
+        """
+        Executa tarefas longas em segundo plano e acompanha o progresso.
+
+        Args:
+            max_tracked: Número de tarefas mantidas para consulta de status
+        """
+        self.max_tracked = max_tracked
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def submit(self, description, func, *args, **kwargs):
+        """
+        Inicia uma tarefa em segundo plano.
+
+        A função recebe o argumento nomeado progress_callback(processados, total)
+        e deve retornar um dict com o resultado.
+
+        Args:
+            description: Descrição da tarefa
+            func: Função a executar
+            *args, **kwargs: Argumentos repassados a func
+
+        Returns:
+            dict com o status inicial da tarefa
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'description': description,
+                'status': 'running',
+                'processed': 0,
+                'total': None,
+                'result': None,
+                'started_at': time.time(),
+                'finished_at': None
+            }
+            while len(self._jobs) > self.max_tracked:
+                self._jobs.popitem(last=False)
+
+        def progress(processed, total):
+            self._update(job_id, processed=processed, total=total)
+
+        def run():
+            try:
+                result = func(*args, progress_callback=progress, **kwargs)
+                status = 'completed' if result.get('success', True) else 'failed'
+            except Exception as e:
+                result = {'success': False, 'message': str(e)}
+                status = 'failed'
+            self._update(job_id, status=status, result=result, finished_at=time.time())
+
+        threading.Thread(target=run, name=f'job-{job_id[:8]}', daemon=True).start()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """
+        Consulta uma tarefa.
+
+        Returns:
+            dict com status ('running', 'completed' ou 'failed'), progresso e
+            resultado, ou None se a tarefa não for conhecida
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+
+_registry = JobRegistry()
+
+
+def get_job_registry():
+    """Retorna o registro de tarefas compartilhado pelo processo."""
+    return _registry
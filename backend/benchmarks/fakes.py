@@ -0,0 +1,191 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+from botocore.exceptions import ClientError
+
+
+class FakeVideoCapture:
+    def __init__(self, frames, fps=30.0):
+        """
+        Fonte de captura simulada com a interface de cv2.VideoCapture usada
+        pelo CameraSession.
+
+        Os frames informados são entregues em ciclo. Com fps > 0, grab e read
+        respeitam o intervalo entre frames, como uma câmera real.
+
+        Args:
+            frames: Lista de frames (arrays BGR de mesmo formato)
+            fps: Taxa de quadros simulada (0 entrega o mais rápido possível)
+        """
+        self.frames = frames
+        self.fps = fps
+        self._index = -1
+        self._opened = True
+        self._next_frame_at = time.monotonic()
+
+    def isOpened(self):
+        return self._opened
+
+    def get(self, prop):
+        height, width = self.frames[0].shape[:2]
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def grab(self):
+        if not self._opened:
+            return False
+        if self.fps:
+            now = time.monotonic()
+            if self._next_frame_at > now:
+                time.sleep(self._next_frame_at - now)
+            self._next_frame_at = max(self._next_frame_at, now) + 1.0 / self.fps
+        self._index = (self._index + 1) % len(self.frames)
+        return True
+
+    def retrieve(self, image=None):
+        if not self._opened or self._index < 0:
+            return False, None
+        frame = self.frames[self._index]
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def release(self):
+        self._opened = False
+
+
+class _ListObjectsPaginator:
+    def __init__(self, client):
+        self._client = client
+
+    def paginate(self, Bucket, Prefix='', PaginationConfig=None):
+        page_size = (PaginationConfig or {}).get('PageSize', 1000)
+        keys = self._client.keys(Bucket, Prefix)
+        for start in range(0, len(keys), page_size):
+            with self._client._lock:
+                contents = [
+                    {
+                        'Key': key,
+                        'Size': len(obj['Body']),
+                        'LastModified': obj['LastModified']
+                    }
+                    for key in keys[start:start + page_size]
+                    for obj in [self._client.objects.get((Bucket, key))]
+                    if obj is not None
+                ]
+            yield {'Contents': contents, 'KeyCount': len(contents)}
+
+
+class InMemoryS3Client:
+    def __init__(self, latency=0.0):
+        """
+        Substituto em memória do cliente boto3, com as operações usadas pelo
+        S3Service.
+
+        Args:
+            latency: Atraso (s) simulado em cada chamada, como a ida e volta
+                até o S3
+        """
+        self.latency = latency
+        self.objects = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def keys(self, bucket, prefix=''):
+        """Chaves de um bucket com o prefixo informado, em ordem."""
+        with self._lock:
+            return sorted(
+                key for b, key in self.objects if b == bucket and key.startswith(prefix)
+            )
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        self._call()
+        if isinstance(Body, (bytes, bytearray)):
+            data = bytes(Body)
+        else:
+            data = Body.read()
+        with self._lock:
+            self.objects[(Bucket, Key)] = {
+                'Body': data,
+                'ContentType': ContentType,
+                'LastModified': datetime.now(timezone.utc)
+            }
+        return {'ETag': f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket, Key, f.read(), **(ExtraArgs or {}))
+
+    def head_object(self, Bucket, Key):
+        self._call()
+        with self._lock:
+            obj = self.objects.get((Bucket, Key))
+        if obj is None:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': len(obj['Body']), 'LastModified': obj['LastModified']}
+
+    def get_object(self, Bucket, Key):
+        self._call()
+        with self._lock:
+            obj = self.objects.get((Bucket, Key))
+        if obj is None:
+            raise ClientError(
+                {'Error': {'Code': 'NoSuchKey', 'Message': 'The specified key does not exist.'}},
+                'GetObject'
+            )
+        return {'Body': _Body(obj['Body']), 'ContentType': obj['ContentType']}
+
+    def delete_object(self, Bucket, Key):
+        self._call()
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        self._call()
+        deleted = []
+        with self._lock:
+            for item in Delete['Objects']:
+                self.objects.pop((Bucket, item['Key']), None)
+                deleted.append({'Key': item['Key']})
+        return {} if Delete.get('Quiet') else {'Deleted': deleted}
+
+    def get_paginator(self, operation_name):
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(operation_name)
+        return _ListObjectsPaginator(self)
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"memory://{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
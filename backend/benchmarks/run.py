@@ -0,0 +1,357 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.fakes import FakeVideoCapture, InMemoryS3Client
+from benchmarks.scenes import RESOLUTIONS, make_scene, make_tray_scene, measurement_error
+
+
+def _percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3) if values else None
+
+
+def measure(func, items, memory_samples=3):
+    """
+    Mede uma etapa do pipeline.
+
+    Os tempos vêm de uma passada sem tracemalloc (que deixaria tudo mais
+    lento); o pico de memória, de uma segunda passada curta com tracemalloc.
+    Só alocações visíveis ao Python (incluindo arrays numpy) são contadas,
+    não buffers internos do OpenCV.
+
+    Args:
+        func: Função aplicada a cada item; o retorno é repassado ao chamador
+        items: Lista de itens
+        memory_samples: Itens usados na medição de memória
+
+    Returns:
+        Tupla (lista de retornos, dict com n, fps, p50_ms, p99_ms e peak_mb)
+    """
+    outputs = []
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        outputs.append(func(item))
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        for item in items[:memory_samples]:
+            func(item)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = sum(latencies)
+    return outputs, {
+        'n': len(latencies),
+        'fps': round(len(latencies) / total, 2) if total > 0 else None,
+        'p50_ms': _percentile(latencies, 50),
+        'p99_ms': _percentile(latencies, 99),
+        'peak_mb': round(peak / 2 ** 20, 2)
+    }
+
+
+def accuracy(results, truth):
+    """
+    Compara resultados de process_frame com o gabarito da cena.
+
+    Returns:
+        dict com taxa de sucesso e erros médio e máximo (cm)
+    """
+    errors = [
+        measurement_error(r['dimensions'], truth) for r in results if r['success']
+    ]
+    return {
+        'success_rate': round(len(errors) / len(results), 3) if results else None,
+        'mean_error_cm': round(float(np.mean(errors)), 4) if errors else None,
+        'max_error_cm': round(float(np.max(errors)), 4) if errors else None
+    }
+
+
+def bench_stages(scene, iterations, pyramid_max_width):
+    """
+    Mede cada etapa do processamento de frames isoladamente.
+
+    Returns:
+        dict etapa -> métricas (desempenho e, quando aplicável, acurácia)
+    """
+    from frame_quality import FrameQualityGate
+    from image_encoding import get_image_encoder
+    from measurement_service import process_frame, render_annotation
+    from s3_service import S3Service
+
+    frames = [scene['frames'][i % len(scene['frames'])] for i in range(iterations)]
+    reference_width_cm = scene['reference_width_cm']
+    truth = scene['truth']
+    stages = {}
+
+    gate = FrameQualityGate()
+    reasons, stats = measure(gate.check, frames)
+    stats['rejected'] = sum(1 for reason in reasons if reason is not None)
+    stages['quality_gate'] = stats
+
+    full, stats = measure(
+        lambda img: process_frame(img, reference_width_cm, pyramid_max_width=0), frames
+    )
+    stages['detect_full'] = {**stats, **accuracy(full, truth)}
+
+    if pyramid_max_width and scene['resolution'][0] >= 1.5 * pyramid_max_width:
+        results, stats = measure(
+            lambda img: process_frame(
+                img, reference_width_cm, pyramid_max_width=pyramid_max_width
+            ),
+            frames
+        )
+        stages['detect_pyramid'] = {**stats, **accuracy(results, truth)}
+
+    seed = next((r for r in full if r['success']), None)
+    if seed is None:
+        return stages
+
+    results, stats = measure(
+        lambda img: process_frame(
+            img, reference_width_cm, roi=seed['reference_box'], pyramid_max_width=0
+        ),
+        frames
+    )
+    stages['detect_roi'] = {**stats, **accuracy(results, truth)}
+
+    # Mesmo formato gravado pelo CalibrationStore
+    calibration = {
+        'reference_box': list(seed['reference_box']),
+        'frame_size': list(seed['frame_size']),
+        'reference_width_cm': reference_width_cm,
+        'pixels_por_cm': seed['reference_box'][2] / reference_width_cm
+    }
+    results, stats = measure(
+        lambda img: process_frame(img, reference_width_cm, calibration), frames
+    )
+    stages['detect_calibrated'] = {**stats, **accuracy(results, truth)}
+
+    encoder = get_image_encoder()
+    encoded, stats = measure(
+        lambda img: encoder.encode_image(render_annotation(img, seed)), frames
+    )
+    stats['size_kb'] = round(len(encoded[0]) / 1024, 1)
+    stages['annotate_encode'] = stats
+
+    thumbs, stats = measure(encoder.encode_thumbnail, frames)
+    if thumbs[0] is not None:
+        stats['size_kb'] = round(len(thumbs[0]) / 1024, 1)
+    stages['thumbnail'] = stats
+
+    _, stats = measure(lambda img: encoder.content_key(img), frames)
+    stages['content_hash'] = stats
+
+    s3_service = S3Service(InMemoryS3Client())
+    _, stats = measure(
+        lambda data: s3_service.upload_image_data(data, 'benchmark.jpg'), encoded
+    )
+    stages['upload'] = stats
+
+    return stages
+
+
+def bench_multi(scene, iterations):
+    """
+    Mede a detecção de vários objetos num frame (bandeja de make_tray_scene).
+
+    Um frame só conta como sucesso se todos os objetos forem encontrados;
+    cada objeto é comparado com o gabarito mais próximo.
+
+    Returns:
+        dict com desempenho, objetos por frame e acurácia
+    """
+    from measurement_service import process_frame
+
+    frames = [scene['frames'][i % len(scene['frames'])] for i in range(iterations)]
+    results, stats = measure(
+        lambda img: process_frame(
+            img, scene['reference_width_cm'], pyramid_max_width=0, max_objects=None
+        ),
+        frames
+    )
+    centers = np.array([(x + w / 2, y + h / 2) for x, y, w, h in scene['object_boxes']])
+
+    errors = []
+    found = 0
+    for result in results:
+        if not result['success'] or len(result['objects']) != len(scene['truths']):
+            continue
+        found += 1
+        for obj in result['objects']:
+            x, y, w, h = obj['box']
+            nearest = int(np.argmin(np.linalg.norm(centers - (x + w / 2, y + h / 2), axis=1)))
+            errors.append(measurement_error(obj['dimensions'], scene['truths'][nearest]))
+
+    stats['objects'] = len(scene['truths'])
+    stats.update({
+        'success_rate': round(found / len(results), 3) if results else None,
+        'mean_error_cm': round(float(np.mean(errors)), 4) if errors else None,
+        'max_error_cm': round(float(np.max(errors)), 4) if errors else None
+    })
+    return stats
+
+
+def bench_analysis(scene, camera_id, runs, num_captures, processing_mode,
+                   camera_fps, warm):
+    """
+    Mede perform_analysis de ponta a ponta com câmera simulada e S3 em memória.
+
+    Args:
+        scene: Cena gerada por make_scene
+        camera_id: Índice da câmera simulada
+        runs: Número de análises
+        num_captures: Frames por análise
+        processing_mode: Modo do FrameProcessingEngine
+        camera_fps: Taxa de quadros simulada
+        warm: Se False, a calibração é apagada antes de cada análise
+
+    Returns:
+        dict com métricas por análise, frames por segundo e acurácia
+    """
+    from calibration_service import get_calibration_store
+    from camera_manager import CameraManager, set_camera_manager
+    from measurement_service import MeasurementService
+
+    manager = set_camera_manager(CameraManager(
+        warmup_frames=2,
+        capture_factory=lambda _: FakeVideoCapture(scene['frames'], fps=camera_fps)
+    ))
+    store = get_calibration_store()
+    service = MeasurementService(
+        camera_id,
+        reference_width_cm=scene['reference_width_cm'],
+        num_captures=num_captures,
+        processing_mode=processing_mode
+    )
+
+    def analyze(_):
+        if not warm:
+            store.delete(camera_id)
+        return service.perform_analysis(save_to_s3=True, async_upload=False)
+
+    try:
+        # Abre a câmera e, no modo quente, grava a calibração
+        analyze(None)
+        results, stats = measure(analyze, list(range(runs)), memory_samples=1)
+    finally:
+        manager.close_all()
+
+    frames = sum(r.get('processing', {}).get('frames', 0) for r in results)
+    wall = sum(r.get('processing', {}).get('wall_time_ms', 0) for r in results) / 1000
+    stats['frames_per_analysis'] = round(frames / len(results), 1) if results else None
+    stats['frame_fps'] = round(frames / wall, 2) if wall else None
+    stats.update(accuracy(
+        [
+            {'success': r['success'], 'dimensions': r['measurements']}
+            for r in results
+        ],
+        scene['truth']
+    ))
+    return stats
+
+
+def _print_report(report):
+    columns = ('fps', 'p50_ms', 'p99_ms', 'peak_mb', 'success_rate', 'max_error_cm')
+    for scene in report['scenes']:
+        print(f"\n{scene['resolution']}  ruído={scene['noise']}  "
+              f"gabarito={scene['truth']['width']:.3f} x {scene['truth']['length']:.3f} cm")
+        print(f"  {'etapa':<20}" + ''.join(f'{c:>14}' for c in columns))
+        for name, stats in scene['stages'].items():
+            # Nas análises completas, fps conta frames; latências são por análise
+            stats = dict(stats, fps=stats.get('frame_fps', stats['fps']))
+            values = ''.join(
+                f"{'-' if stats.get(c) is None else stats[c]:>14}" for c in columns
+            )
+            print(f'  {name:<20}{values}')
+
+
+def _configure_environment(workdir):
+    # Precisa acontecer antes dos serviços criarem seus singletons
+    os.environ['CALIBRATION_FILE'] = os.path.join(workdir, 'calibration.json')
+    os.environ['UPLOAD_SPOOL_DIR'] = os.path.join(workdir, 'upload_spool')
+    os.environ['MEASUREMENTS_DB'] = os.path.join(workdir, 'measurements.db')
+    os.environ['AWS_BUCKET_NAME'] = 'benchmark'
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+
+    from s3_service import set_s3_client
+    set_s3_client(InMemoryS3Client())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark offline do pipeline de medição com cenas sintéticas.'
+    )
+    parser.add_argument('--resolutions', nargs='+', default=['480p', '720p', '1080p'],
+                        choices=sorted(RESOLUTIONS))
+    parser.add_argument('--noise', nargs='+', type=float, default=[0.0, 8.0])
+    parser.add_argument('--iterations', type=int, default=30,
+                        help='Frames medidos por etapa')
+    parser.add_argument('--analyses', type=int, default=3,
+                        help='Análises completas por cena (0 desativa)')
+    parser.add_argument('--num-captures', type=int, default=8)
+    parser.add_argument('--processing-mode', default='thread',
+                        choices=['sequential', 'thread', 'process'])
+    parser.add_argument('--camera-fps', type=float, default=30.0,
+                        help='Taxa de quadros da câmera simulada (0 = sem limite)')
+    parser.add_argument('--pyramid-width', type=int, default=640)
+    parser.add_argument('--max-error', type=float, default=0.1,
+                        help='Erro máximo aceito (cm); acima disso o código de saída é 1')
+    parser.add_argument('--output', help='Grava o relatório completo em JSON')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='macrovision-bench-') as workdir:
+        _configure_environment(workdir)
+
+        report = {'config': vars(args), 'scenes': []}
+        camera_id = 0
+        for resolution in args.resolutions:
+            width, height = RESOLUTIONS[resolution]
+            for noise in args.noise:
+                scene = make_scene(width, height, noise=noise, seed=camera_id)
+                stages = bench_stages(scene, args.iterations, args.pyramid_width)
+                stages['detect_multi'] = bench_multi(
+                    make_tray_scene(width, height, noise=noise, seed=camera_id),
+                    args.iterations
+                )
+                if args.analyses > 0:
+                    for warm in (False, True):
+                        stages['analysis_warm' if warm else 'analysis_cold'] = bench_analysis(
+                            scene, camera_id, args.analyses, args.num_captures,
+                            args.processing_mode, args.camera_fps, warm
+                        )
+                report['scenes'].append({
+                    'resolution': resolution,
+                    'noise': noise,
+                    'truth': scene['truth'],
+                    'stages': stages
+                })
+                camera_id += 1
+
+    _print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    failures = [
+        (scene['resolution'], scene['noise'], name)
+        for scene in report['scenes']
+        for name, stats in scene['stages'].items()
+        if stats.get('max_error_cm') is not None and stats['max_error_cm'] > args.max_error
+    ]
+    for resolution, noise, name in failures:
+        print(f'Erro acima de {args.max_error} cm: {resolution} ruído={noise} {name}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import cv2
+import numpy as np
+
+RESOLUTIONS = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160)
+}
+
+BACKGROUND_COLOR = (45, 45, 45)
+REFERENCE_COLOR = (215, 215, 210)
+OBJECT_COLOR = (60, 70, 90)
+
+
+def make_scene(width, height, noise=0.0, reference_width_cm=10.0,
+               object_size_cm=(4.0, 2.5), variants=4, seed=0):
+    """
+    Gera uma cena sintética: folha de referência sobre fundo escuro com o
+    objeto medido dentro dela.
+
+    As medidas reais do objeto são calculadas a partir dos pixels desenhados,
+    então o gabarito não depende de arredondamentos da cena.
+
+    Args:
+        width: Largura do frame em pixels
+        height: Altura do frame em pixels
+        noise: Desvio padrão do ruído gaussiano adicionado a cada frame
+        reference_width_cm: Largura real da referência em cm
+        object_size_cm: (largura, comprimento) nominais do objeto em cm
+        variants: Número de frames com ruído independente
+        seed: Semente do gerador aleatório
+
+    Returns:
+        dict com frames, reference_width_cm, truth (width e length em cm),
+        reference_box, object_box, noise e resolution
+    """
+    rng = np.random.default_rng(seed)
+
+    # Referência ocupa metade da largura, deslocada levemente do centro
+    w_ref = int(round(width * 0.5))
+    h_ref = min(int(round(w_ref * 0.7)), int(height * 0.8))
+    x_ref = (width - w_ref) // 2 + int(rng.integers(-width // 20, width // 20 + 1))
+    y_ref = (height - h_ref) // 2 + int(rng.integers(-height // 20, height // 20 + 1))
+    pixels_per_cm = w_ref / reference_width_cm
+
+    w_obj = int(round(object_size_cm[0] * pixels_per_cm))
+    h_obj = int(round(object_size_cm[1] * pixels_per_cm))
+    x_obj = x_ref + (w_ref - w_obj) // 3
+    y_obj = y_ref + (h_ref - h_obj) // 2
+
+    base = np.full((height, width, 3), BACKGROUND_COLOR, dtype=np.uint8)
+    cv2.rectangle(base, (x_ref, y_ref), (x_ref + w_ref - 1, y_ref + h_ref - 1),
+                  REFERENCE_COLOR, -1)
+    cv2.rectangle(base, (x_obj, y_obj), (x_obj + w_obj - 1, y_obj + h_obj - 1),
+                  OBJECT_COLOR, -1)
+    # Bordas suaves, como numa lente real
+    base = cv2.GaussianBlur(base, (3, 3), 0)
+
+    frames = []
+    for _ in range(max(1, variants)):
+        if noise > 0:
+            grain = rng.standard_normal(base.shape, dtype=np.float32) * noise
+            frame = np.clip(base + grain, 0, 255).astype(np.uint8)
+        else:
+            frame = base.copy()
+        frames.append(frame)
+
+    return {
+        'frames': frames,
+        'reference_width_cm': reference_width_cm,
+        'truth': {
+            'width': w_obj / pixels_per_cm,
+            'length': h_obj / pixels_per_cm
+        },
+        'reference_box': (x_ref, y_ref, w_ref, h_ref),
+        'object_box': (x_obj, y_obj, w_obj, h_obj),
+        'noise': noise,
+        'resolution': (width, height)
+    }
+
+
+def make_tray_scene(width, height, noise=0.0, reference_width_cm=10.0,
+                    object_sizes_cm=((2.0, 1.2), (1.5, 1.5), (2.4, 1.0),
+                                     (1.2, 2.0), (1.8, 1.4), (1.0, 1.0)),
+                    columns=3, variants=4, seed=0):
+    """
+    Gera uma bandeja: vários objetos em grade sobre a folha de referência.
+
+    Args:
+        width, height, noise, reference_width_cm, variants, seed: Como em
+            make_scene
+        object_sizes_cm: (largura, comprimento) nominais de cada objeto, em
+            ordem de leitura (linhas de cima para baixo)
+        columns: Objetos por linha
+
+    Returns:
+        dict como o de make_scene, com truths e object_boxes (listas, em
+        ordem de leitura) no lugar de truth e object_box
+    """
+    rng = np.random.default_rng(seed)
+
+    w_ref = int(round(width * 0.5))
+    h_ref = min(int(round(w_ref * 0.7)), int(height * 0.8))
+    x_ref = (width - w_ref) // 2
+    y_ref = (height - h_ref) // 2
+    pixels_per_cm = w_ref / reference_width_cm
+
+    rows = -(-len(object_sizes_cm) // columns)
+    cell_w = w_ref / columns
+    cell_h = h_ref / rows
+
+    base = np.full((height, width, 3), BACKGROUND_COLOR, dtype=np.uint8)
+    cv2.rectangle(base, (x_ref, y_ref), (x_ref + w_ref - 1, y_ref + h_ref - 1),
+                  REFERENCE_COLOR, -1)
+
+    truths, boxes = [], []
+    for i, (width_cm, length_cm) in enumerate(object_sizes_cm):
+        w_obj = int(round(width_cm * pixels_per_cm))
+        h_obj = int(round(length_cm * pixels_per_cm))
+        row, column = divmod(i, columns)
+        x_obj = int(x_ref + column * cell_w + (cell_w - w_obj) / 2)
+        y_obj = int(y_ref + row * cell_h + (cell_h - h_obj) / 2)
+        cv2.rectangle(base, (x_obj, y_obj), (x_obj + w_obj - 1, y_obj + h_obj - 1),
+                      OBJECT_COLOR, -1)
+        truths.append({'width': w_obj / pixels_per_cm, 'length': h_obj / pixels_per_cm})
+        boxes.append((x_obj, y_obj, w_obj, h_obj))
+    base = cv2.GaussianBlur(base, (3, 3), 0)
+
+    frames = []
+    for _ in range(max(1, variants)):
+        if noise > 0:
+            grain = rng.standard_normal(base.shape, dtype=np.float32) * noise
+            frames.append(np.clip(base + grain, 0, 255).astype(np.uint8))
+        else:
+            frames.append(base.copy())
+
+    return {
+        'frames': frames,
+        'reference_width_cm': reference_width_cm,
+        'truths': truths,
+        'reference_box': (x_ref, y_ref, w_ref, h_ref),
+        'object_boxes': boxes,
+        'noise': noise,
+        'resolution': (width, height)
+    }
+
+
+def measurement_error(dimensions, truth):
+    """
+    Maior erro absoluto (cm) entre as dimensões medidas e o gabarito.
+    """
+    return max(
+        abs(dimensions['width'] - truth['width']),
+        abs(dimensions['length'] - truth['length'])
+    )
@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+import time
+
+DEFAULT_CALIBRATION_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'calibration.json'
+)
+
+
+def reference_matches(calibration, reference_box, frame_size, tolerance=0.02):
+    """
+    Verifica se a referência encontrada num frame confere com a calibração.
+
+    Args:
+        calibration: dict de calibração da câmera
+        reference_box: Bounding box (x, y, w, h) encontrada no frame
+        frame_size: (largura, altura) do frame
+        tolerance: Desvio máximo aceito, como fração da largura da referência
+
+    Returns:
+        True se a referência não se moveu além da tolerância
+    """
+    if calibration is None or list(frame_size) != list(calibration['frame_size']):
+        return False
+    max_shift = max(2.0, tolerance * calibration['reference_box'][2])
+    return all(
+        abs(found - expected) <= max_shift
+        for found, expected in zip(reference_box, calibration['reference_box'])
+    )
+
+
+class CalibrationStore:
+    def __init__(self, path=DEFAULT_CALIBRATION_FILE):
+        """
+        Calibrações por câmera (referência e pixels por cm), persistidas em disco.
+
+        Args:
+            path: Arquivo JSON onde as calibrações são gravadas
+        """
+        self.path = path
+        self._calibrations = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._calibrations is not None:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._calibrations = json.load(f)
+        except FileNotFoundError:
+            self._calibrations = {}
+        except (OSError, ValueError) as e:
+            print(f'Erro ao carregar calibrações: {str(e)}')
+            self._calibrations = {}
+
+    def _persist(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._calibrations, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, camera_id):
+        """
+        Retorna a calibração de uma câmera.
+
+        Returns:
+            dict com reference_box, frame_size, reference_width_cm e
+            pixels_por_cm, ou None se a câmera não estiver calibrada
+        """
+        with self._lock:
+            self._load()
+            calibration = self._calibrations.get(str(camera_id))
+            return dict(calibration) if calibration is not None else None
+
+    def save(self, camera_id, reference_box, frame_size, reference_width_cm):
+        """
+        Grava a calibração de uma câmera.
+
+        Args:
+            camera_id: Índice da câmera
+            reference_box: Bounding box (x, y, w, h) do objeto de referência
+            frame_size: (largura, altura) do frame
+            reference_width_cm: Largura real do objeto de referência em cm
+
+        Returns:
+            dict de calibração gravado
+        """
+        calibration = {
+            'camera_id': camera_id,
+            'reference_box': [int(v) for v in reference_box],
+            'frame_size': [int(v) for v in frame_size],
+            'reference_width_cm': reference_width_cm,
+            'pixels_por_cm': reference_box[2] / reference_width_cm,
+            'updated_at': time.time()
+        }
+        with self._lock:
+            self._load()
+            self._calibrations[str(camera_id)] = calibration
+            try:
+                self._persist()
+            except OSError as e:
+                print(f'Erro ao gravar calibrações: {str(e)}')
+        return dict(calibration)
+
+    def delete(self, camera_id):
+        """
+        Remove a calibração de uma câmera.
+
+        Returns:
+            True se havia calibração
+        """
+        with self._lock:
+            self._load()
+            removed = self._calibrations.pop(str(camera_id), None) is not None
+            if removed:
+                try:
+                    self._persist()
+                except OSError as e:
+                    print(f'Erro ao gravar calibrações: {str(e)}')
+            return removed
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_calibration_store():
+    """Retorna o armazenamento de calibrações (arquivo em CALIBRATION_FILE)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CalibrationStore(os.getenv('CALIBRATION_FILE', DEFAULT_CALIBRATION_FILE))
+        return _store
@@ -0,0 +1,595 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from metrics import increment, observe_stage
+
+
+class FrameGrabber:
+    def __init__(self, session, buffer_size=16):
+        """
+        Thread que lê continuamente uma câmera para um buffer circular.
+
+        Args:
+            session: CameraSession de onde os frames são lidos
+            buffer_size: Número de frames pré-alocados no buffer circular
+        """
+        self.session = session
+        self.buffer_size = buffer_size
+        self._slots = None
+        self._slot_seq = [-1] * buffer_size
+        self._slot_time = [0.0] * buffer_size
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_frame_at = None
+
+    def start(self):
+        """Inicia a thread de captura, se ainda não estiver rodando."""
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f'frame-grabber-{self.session.camera_id}',
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Interrompe a captura e aguarda a thread terminar."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def is_running(self):
+        """Indica se a thread de captura está ativa."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_healthy(self, max_silence=2.0):
+        """Indica se a câmera entregou frames recentemente."""
+        return (
+            self.is_running() and self.last_frame_at is not None
+            and time.monotonic() - self.last_frame_at < max_silence
+        )
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._slots is None:
+                ret, frame = self.session.read_device()
+                if not ret:
+                    continue
+                # Pré-aloca o buffer com o formato do primeiro frame
+                slots = np.empty((self.buffer_size,) + frame.shape, dtype=frame.dtype)
+                slots[0] = frame
+                with self._cond:
+                    self._slots = slots
+                self._publish(0)
+                continue
+
+            slot = self._seq % self.buffer_size
+            with self._cond:
+                # Invalida o slot antes de sobrescrever; leitores nunca copiam
+                # um slot em escrita
+                self._slot_seq[slot] = -1
+
+            ret, frame = self.session.read_device(self._slots[slot])
+            if not ret:
+                continue
+            if frame is not self._slots[slot]:
+                if frame.shape != self._slots[slot].shape:
+                    # Resolução mudou (reconexão): realoca o buffer. Slots e
+                    # sequências são trocados juntos, sob o lock dos leitores
+                    with self._cond:
+                        self._slots = None
+                        self._slot_seq = [-1] * self.buffer_size
+                    continue
+                self._slots[slot] = frame
+            self._publish(slot)
+
+    def _publish(self, slot):
+        now = time.monotonic()
+        with self._cond:
+            self._slot_seq[slot] = self._seq
+            self._slot_time[slot] = now
+            self._seq += 1
+            self.last_frame_at = now
+            self._cond.notify_all()
+
+    def _copy_newest(self, after_seq):
+        # Deve ser chamado com self._cond adquirido
+        candidates = [
+            (seq, i) for i, seq in enumerate(self._slot_seq) if seq > after_seq
+        ]
+        if not candidates:
+            return None, None, None
+        seq, slot = max(candidates)
+        return seq, self._slot_time[slot], self._slots[slot].copy()
+
+    def read_latest(self, timeout=2.0):
+        """
+        Retorna o frame mais recente ainda não visto por esta chamada.
+
+        Returns:
+            Tupla (ret, frame) no formato do cv2.VideoCapture.read
+        """
+        with self._cond:
+            after_seq = self._seq - 1
+        for frame in self.iter_frames(1, after_seq=after_seq, timeout=timeout):
+            return True, frame
+        return False, None
+
+    def iter_frames(self, count, max_age=0.5, after_seq=None, timeout=2.0):
+        """
+        Gera os frames mais recentes do buffer, à medida que ficam disponíveis.
+
+        Frames já no buffer com menos de max_age segundos são entregues
+        imediatamente; os demais são aguardados. Quando o consumidor é mais
+        lento que a câmera, frames intermediários são descartados em favor
+        do mais recente.
+
+        Args:
+            count: Número de frames desejados
+            max_age: Idade máxima (s) de um frame já presente no buffer
+            after_seq: Entrega apenas frames com sequência maior que esta
+            timeout: Tempo máximo de espera (s) por cada novo frame
+
+        Yields:
+            Cópias dos frames, em ordem de captura
+        """
+        with self._cond:
+            if after_seq is None:
+                oldest_allowed = time.monotonic() - max_age
+                buffered = sorted(
+                    (seq, i) for i, seq in enumerate(self._slot_seq)
+                    if seq >= 0 and self._slot_time[i] >= oldest_allowed
+                )[-count:]
+                after_seq = (buffered[0][0] - 1) if buffered else self._seq - 1
+            else:
+                buffered = []
+
+        delivered = 0
+        for seq, slot in buffered:
+            with self._cond:
+                if self._slot_seq[slot] != seq:
+                    continue
+                frame = self._slots[slot].copy()
+            after_seq = seq
+            delivered += 1
+            yield frame
+
+        while delivered < count:
+            with self._cond:
+                if not self._cond.wait_for(
+                    lambda: self._stop.is_set() or any(
+                        seq > after_seq for seq in self._slot_seq
+                    ),
+                    timeout=timeout
+                ):
+                    return
+                if self._stop.is_set():
+                    return
+                seq, _, frame = self._copy_newest(after_seq)
+            after_seq = seq
+            delivered += 1
+            yield frame
+
+
+class CameraSession:
+    def __init__(self, camera_id, warmup_frames=5, max_read_failures=3,
+                 buffer_size=16, capture_factory=None):
+        """
+        Mantém um dispositivo de captura aberto e pronto para uso.
+
+        Args:
+            camera_id: Índice da câmera
+            warmup_frames: Frames descartados após abrir (estabiliza auto-exposição)
+            max_read_failures: Falhas consecutivas de leitura antes de reconectar
+            buffer_size: Tamanho do buffer circular da thread de captura
+            capture_factory: Função capture_factory(camera_id) que abre o
+                dispositivo (padrão: cv2.VideoCapture)
+        """
+        self.camera_id = camera_id
+        self.warmup_frames = warmup_frames
+        self.max_read_failures = max_read_failures
+        self.buffer_size = buffer_size
+        self.capture_factory = capture_factory or cv2.VideoCapture
+        self.grabber = None
+        self.cap = None
+        self.lock = threading.RLock()
+        self.watchers = 0
+        self.warmed = False
+        self.read_failures = 0
+        self.opened_at = None
+        self.last_used = time.monotonic()
+        self.width = None
+        self.height = None
+
+    def is_open(self):
+        """Indica se o dispositivo está aberto."""
+        return self.cap is not None and self.cap.isOpened()
+
+    def open(self):
+        """
+        Abre o dispositivo de captura.
+
+        Returns:
+            True se a câmera foi aberta com sucesso
+        """
+        self._release_device()
+
+        start = time.perf_counter()
+        cap = self.capture_factory(self.camera_id)
+        opened = cap.isOpened()
+        observe_stage('camera_open', time.perf_counter() - start)
+        if not opened:
+            cap.release()
+            increment('macrovision_camera_open_failures_total',
+                      'Falhas ao abrir câmeras', camera=self.camera_id)
+            return False
+
+        self.cap = cap
+        self.warmed = False
+        self.read_failures = 0
+        self.opened_at = time.monotonic()
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        return True
+
+    def warmup(self):
+        """Descarta os primeiros frames para estabilizar exposição e foco."""
+        if self.warmed or not self.is_open():
+            return
+        if self.grabber is not None and self.grabber.is_running():
+            # A captura contínua já mantém a câmera estabilizada
+            return
+        for _ in range(self.warmup_frames):
+            self.cap.grab()
+        self.warmed = True
+
+    def check_health(self):
+        """
+        Verifica se o dispositivo ainda entrega frames.
+
+        Returns:
+            True se a câmera respondeu a um grab
+        """
+        if self.grabber is not None and self.grabber.is_running():
+            return self.grabber.is_healthy()
+        return self.is_open() and self.cap.grab()
+
+    def reconnect(self):
+        """Fecha e reabre o dispositivo."""
+        self.stop_grabber()
+        return self.open()
+
+    def start_grabber(self):
+        """
+        Inicia (se necessário) a thread de captura contínua desta câmera.
+
+        Returns:
+            FrameGrabber associado à sessão
+        """
+        if self.grabber is None:
+            self.grabber = FrameGrabber(self, buffer_size=self.buffer_size)
+        if not self.grabber.is_running():
+            self.warmup()
+            self.grabber.start()
+        return self.grabber
+
+    def stop_grabber(self):
+        """Interrompe a thread de captura contínua, se houver."""
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber = None
+
+    def read(self):
+        """
+        Lê um frame, reconectando após falhas consecutivas.
+
+        Com a thread de captura ativa, retorna o próximo frame do buffer.
+
+        Returns:
+            Tupla (ret, frame) no formato do cv2.VideoCapture.read
+        """
+        if self.grabber is not None and self.grabber.is_running():
+            return self.grabber.read_latest()
+        return self.read_device()
+
+    def read_device(self, image=None):
+        """
+        Lê diretamente do dispositivo, reconectando após falhas consecutivas.
+
+        Args:
+            image: Array opcional onde o frame é escrito, evitando alocação
+
+        Returns:
+            Tupla (ret, frame) no formato do cv2.VideoCapture.read
+        """
+        if not self.is_open():
+            if not self.open():
+                time.sleep(0.5)
+                return False, None
+            self.warmup()
+
+        start = time.perf_counter()
+        ret, frame = self.cap.read(image)
+        observe_stage('camera_read', time.perf_counter() - start)
+        if ret:
+            self.read_failures = 0
+            return ret, frame
+
+        increment('macrovision_camera_read_failures_total',
+                  'Leituras de frame que falharam', camera=self.camera_id)
+        self.read_failures += 1
+        if self.read_failures >= self.max_read_failures and self.open():
+            self.warmup()
+            return self.cap.read(image)
+
+        return False, None
+
+    def info(self):
+        """Retorna informações básicas do dispositivo aberto."""
+        return {
+            'id': self.camera_id,
+            'name': f'Camera {self.camera_id}',
+            'resolution': f'{self.width}x{self.height}'
+        }
+
+    def close(self):
+        """Interrompe a captura contínua e libera o dispositivo."""
+        self.stop_grabber()
+        self._release_device()
+
+    def _release_device(self):
+        if self.cap is not None:
+            self.cap.release()
+        self.cap = None
+        self.warmed = False
+
+
+class CameraManager:
+    def __init__(self, idle_timeout=60.0, health_check_interval=10.0,
+                 warmup_frames=5, max_read_failures=3, buffer_size=16,
+                 capture_factory=None):
+        """
+        Gerencia sessões de câmera compartilhadas pelo processo.
+
+        Args:
+            idle_timeout: Segundos sem uso antes de liberar o dispositivo
+            health_check_interval: Segundos sem uso após os quais o dispositivo
+                é verificado antes de ser emprestado
+            warmup_frames: Frames descartados após abrir a câmera
+            max_read_failures: Falhas consecutivas de leitura antes de reconectar
+            buffer_size: Tamanho do buffer circular de cada câmera
+            capture_factory: Função capture_factory(camera_id) que abre o
+                dispositivo (padrão: cv2.VideoCapture)
+        """
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.warmup_frames = warmup_frames
+        self.max_read_failures = max_read_failures
+        self.buffer_size = buffer_size
+        self.capture_factory = capture_factory
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = None
+
+    def _get_session(self, camera_id):
+        with self._lock:
+            session = self._sessions.get(camera_id)
+            if session is None:
+                session = CameraSession(
+                    camera_id,
+                    warmup_frames=self.warmup_frames,
+                    max_read_failures=self.max_read_failures,
+                    buffer_size=self.buffer_size,
+                    capture_factory=self.capture_factory
+                )
+                self._sessions[camera_id] = session
+            self._ensure_reaper()
+            return session
+
+    def _ensure_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():
+            self._stop.clear()
+            self._reaper = threading.Thread(
+                target=self._reap_idle_sessions,
+                name='camera-reaper',
+                daemon=True
+            )
+            self._reaper.start()
+
+    def _reap_idle_sessions(self):
+        interval = max(1.0, min(self.idle_timeout / 2, 10.0))
+        while not self._stop.wait(interval):
+            now = time.monotonic()
+            with self._lock:
+                sessions = list(self._sessions.values())
+            for session in sessions:
+                if session.watchers or now - session.last_used < self.idle_timeout:
+                    continue
+                # Só libera sessões que não estão emprestadas no momento
+                if session.lock.acquire(blocking=False):
+                    try:
+                        session.close()
+                    finally:
+                        session.lock.release()
+
+    def _prepare(self, session, warmup):
+        idle_for = time.monotonic() - session.last_used
+        if not session.is_open():
+            if not session.open():
+                return False
+        elif idle_for > self.health_check_interval and not session.check_health():
+            if not session.reconnect():
+                return False
+
+        if warmup:
+            session.warmup()
+        return True
+
+    @contextmanager
+    def borrow(self, camera_id, warmup=True, timeout=None):
+        """
+        Empresta uma câmera aberta para uso exclusivo dentro do bloco with.
+
+        Args:
+            camera_id: Índice da câmera
+            warmup: Se True, garante que a câmera já passou pelo aquecimento
+            timeout: Tempo máximo de espera pela câmera (None espera indefinidamente)
+
+        Yields:
+            CameraSession pronta para leitura, ou None se a câmera não pôde
+            ser aberta ou não ficou livre dentro do timeout
+        """
+        start = time.perf_counter()
+        session = self._get_session(camera_id)
+        acquired = session.lock.acquire(timeout=-1 if timeout is None else timeout)
+        if not acquired:
+            yield None
+            return
+
+        try:
+            ready = self._prepare(session, warmup)
+            # Espera pela câmera + abertura, verificação e aquecimento
+            observe_stage('camera_borrow', time.perf_counter() - start)
+            yield session if ready else None
+        finally:
+            session.last_used = time.monotonic()
+            session.lock.release()
+            if not session.is_open():
+                self._discard(session)
+
+    @contextmanager
+    def watch(self, camera_id, timeout=None):
+        """
+        Acompanha a captura contínua de uma câmera sem mantê-la emprestada.
+
+        A câmera é aberta (se necessário) e a thread de captura iniciada; em
+        seguida o empréstimo é devolvido, de modo que vários observadores e as
+        análises leem o mesmo buffer circular sem novas aberturas do
+        dispositivo. Enquanto houver observadores, a sessão não é liberada
+        por inatividade.
+
+        Args:
+            camera_id: Índice da câmera
+            timeout: Tempo máximo de espera para abrir a câmera
+
+        Yields:
+            FrameGrabber da câmera, ou None se ela não pôde ser aberta
+        """
+        grabber = None
+        with self.borrow(camera_id, timeout=timeout) as session:
+            if session is not None:
+                grabber = session.start_grabber()
+                with self._lock:
+                    session.watchers += 1
+
+        if grabber is None:
+            yield None
+            return
+
+        try:
+            yield grabber
+        finally:
+            with self._lock:
+                session.watchers -= 1
+            session.last_used = time.monotonic()
+
+    def _discard(self, session):
+        # Sessões que falharam ao abrir não ficam registradas
+        with self._lock:
+            if self._sessions.get(session.camera_id) is session:
+                del self._sessions[session.camera_id]
+
+    def is_in_use(self, camera_id):
+        """Indica se a câmera está emprestada neste momento."""
+        with self._lock:
+            session = self._sessions.get(camera_id)
+        if session is None:
+            return False
+        if session.lock.acquire(blocking=False):
+            session.lock.release()
+            return False
+        return True
+
+    def open_session_info(self, camera_id):
+        """
+        Retorna informações de uma câmera já aberta, sem tocar no dispositivo.
+
+        Returns:
+            dict com informações da câmera ou None se ela não estiver aberta
+        """
+        with self._lock:
+            session = self._sessions.get(camera_id)
+        if session is None or not session.is_open():
+            return None
+        return session.info()
+
+    def close(self, camera_id):
+        """Libera uma câmera específica."""
+        with self._lock:
+            session = self._sessions.pop(camera_id, None)
+        if session is not None:
+            with session.lock:
+                session.close()
+
+    def close_all(self):
+        """Libera todas as câmeras e encerra a thread de limpeza."""
+        self._stop.set()
+        with self._lock:
+            camera_ids = list(self._sessions.keys())
+        for camera_id in camera_ids:
+            self.close(camera_id)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_camera_manager():
+    """
+    Retorna o gerenciador de câmeras compartilhado pelo processo.
+
+    Configurável pelas variáveis CAMERA_IDLE_TIMEOUT, CAMERA_HEALTH_CHECK_INTERVAL,
+    CAMERA_WARMUP_FRAMES, CAMERA_MAX_READ_FAILURES e CAMERA_BUFFER_SIZE.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = CameraManager(
+                idle_timeout=float(os.getenv('CAMERA_IDLE_TIMEOUT', 60)),
+                health_check_interval=float(os.getenv('CAMERA_HEALTH_CHECK_INTERVAL', 10)),
+                warmup_frames=int(os.getenv('CAMERA_WARMUP_FRAMES', 5)),
+                max_read_failures=int(os.getenv('CAMERA_MAX_READ_FAILURES', 3)),
+                buffer_size=int(os.getenv('CAMERA_BUFFER_SIZE', 16))
+            )
+            atexit.register(_manager.close_all)
+        return _manager
+
+
+def set_camera_manager(manager):
+    """
+    Substitui o gerenciador compartilhado (por exemplo, por um com fontes de
+    captura simuladas), encerrando as sessões do anterior.
+
+    Returns:
+        O novo gerenciador
+    """
+    global _manager
+    with _manager_lock:
+        previous, _manager = _manager, manager
+    if previous is not None and previous is not manager:
+        previous.close_all()
+    return manager
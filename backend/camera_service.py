@@ -1,35 +1,226 @@
-import cv2
+import os
+import threading
+import time
+from concurrent.futures import Future, wait
 
-def get_available_cameras(max_test=10):
+from camera_manager import get_camera_manager
+from metrics import timed
+
+try:
+    import pyudev
+except ImportError:  # Hotplug é opcional (apenas Linux com pyudev instalado)
+    pyudev = None
+
+
+def probe_camera(camera_id):
+    """
+    Verifica se um índice de câmera está disponível.
+    
+    Câmeras já abertas pelo gerenciador (inclusive as em uso por uma análise)
+    são reportadas sem tocar no dispositivo.
+    
+    Args:
+        camera_id: Índice da câmera
+        
+    Returns:
+        dict com informações da câmera ou None se indisponível
+    """
+    manager = get_camera_manager()
+    
+    info = manager.open_session_info(camera_id)
+    if info is not None or manager.is_in_use(camera_id):
+        return info
+    
+    # timeout=0: nunca espera por uma câmera ocupada
+    with timed('camera_probe'), manager.borrow(camera_id, warmup=False, timeout=0) as session:
+        if session is None:
+            return None
+        
+        # Tenta ler um frame para confirmar que funciona
+        ret, _ = session.read()
+        return session.info() if ret else None
+
+
+class CameraDiscovery:
+    def __init__(self, max_test=10, ttl=30.0, probe_timeout=3.0):
+        """
+        Descoberta de câmeras com sondagem paralela e cache.
+        
+        Args:
+            max_test: Número máximo de índices para testar
+            ttl: Tempo (s) em que a lista em cache é considerada atual
+            probe_timeout: Tempo máximo (s) de espera por cada sondagem
+        """
+        self.max_test = max_test
+        self.ttl = ttl
+        self.probe_timeout = probe_timeout
+        self._cameras = None
+        self._updated_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._probing = {}
+        self._monitor = None
+    
+    def _scan(self):
+        with timed('camera_discovery'):
+            return self._probe_all()
+    
+    def _probe_all(self):
+        futures = {}
+        with self._lock:
+            cached = {camera['id']: camera for camera in self._cameras or []}
+            for i in range(self.max_test):
+                # Sondagens anteriores ainda travadas no driver não são repetidas
+                future = self._probing.get(i)
+                if future is None or future.done():
+                    future = self._probing[i] = self._start_probe(i)
+                futures[i] = future
+        
+        wait(futures.values(), timeout=self.probe_timeout)
+        
+        cameras = []
+        for i, future in sorted(futures.items()):
+            if future.done():
+                info = future.result() if future.exception() is None else None
+            else:
+                # Sondagem ainda em andamento: mantém o que se sabia da câmera
+                info = cached.get(i)
+            if info is not None:
+                cameras.append(info)
+        return cameras
+    
+    def _start_probe(self, camera_id):
+        # Uma thread por sondagem (o driver pode travar indefinidamente); o
+        # resultado só é lido pelo Future, depois de pronto
+        future = Future()
+        
+        def probe():
+            try:
+                future.set_result(probe_camera(camera_id))
+            except Exception as e:
+                future.set_exception(e)
+        
+        threading.Thread(target=probe, name=f'camera-probe-{camera_id}', daemon=True).start()
+        return future
+    
+    def refresh(self):
+        """
+        Sonda todos os índices em paralelo e atualiza o cache.
+        
+        Returns:
+            Lista de câmeras disponíveis
+        """
+        cameras = self._scan()
+        with self._lock:
+            self._cameras = cameras
+            self._updated_at = time.monotonic()
+        return cameras
+    
+    def refresh_async(self):
+        """Atualiza o cache em segundo plano (no máximo uma atualização por vez)."""
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return
+            self._refreshing = threading.Thread(
+                target=self.refresh, name='camera-discovery', daemon=True
+            )
+            self._refreshing.start()
+    
+    def invalidate(self):
+        """Marca o cache como expirado."""
+        with self._lock:
+            self._updated_at = 0.0
+    
+    def get_cameras(self, force_refresh=False):
+        """
+        Retorna a lista de câmeras, usando o cache quando possível.
+        
+        Um cache expirado é devolvido imediatamente e atualizado em segundo
+        plano; apenas a primeira chamada (sem cache) espera pela sondagem.
+        
+        Args:
+            force_refresh: Se True, sonda as câmeras antes de responder
+            
+        Returns:
+            Lista de câmeras disponíveis
+        """
+        self.start_hotplug_monitor()
+        
+        with self._lock:
+            cameras = self._cameras
+            age = time.monotonic() - self._updated_at
+        
+        if cameras is None or force_refresh:
+            return self.refresh()
+        if age > self.ttl:
+            self.refresh_async()
+        return cameras
+    
+    def start_hotplug_monitor(self):
+        """
+        Atualiza o cache quando câmeras são conectadas ou removidas (udev).
+        
+        Não faz nada se pyudev não estiver disponível.
+        """
+        if pyudev is None or self._monitor is not None:
+            return
+        
+        try:
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by(subsystem='video4linux')
+        except Exception as e:
+            print(f'Monitor de hotplug indisponível: {str(e)}')
+            self._monitor = False
+            return
+        
+        def on_event(action, device):
+            if action in ('add', 'remove'):
+                self.invalidate()
+                self.refresh_async()
+        
+        self._monitor = pyudev.MonitorObserver(monitor, on_event, name='camera-hotplug')
+        self._monitor.daemon = True
+        self._monitor.start()
+
+
+_discovery = None
+_discovery_lock = threading.Lock()
+
+
+def get_camera_discovery():
+    """
+    Retorna o serviço de descoberta compartilhado pelo processo.
+    
+    Configurável pelas variáveis CAMERA_DISCOVERY_MAX_TEST, CAMERA_DISCOVERY_TTL
+    e CAMERA_PROBE_TIMEOUT.
+    """
+    global _discovery
+    with _discovery_lock:
+        if _discovery is None:
+            _discovery = CameraDiscovery(
+                max_test=int(os.getenv('CAMERA_DISCOVERY_MAX_TEST', 10)),
+                ttl=float(os.getenv('CAMERA_DISCOVERY_TTL', 30)),
+                probe_timeout=float(os.getenv('CAMERA_PROBE_TIMEOUT', 3))
+            )
+        return _discovery
+
+
+def get_available_cameras(max_test=None, force_refresh=False):
     """
     Detecta todas as câmeras disponíveis no sistema.
     
     Args:
-        max_test: Número máximo de índices para testar
+        max_test: Número máximo de índices para testar (None usa a configuração
+            do serviço de descoberta, com cache)
+        force_refresh: Se True, ignora o cache
         
     Returns:
         Lista de dicionários com informações das câmeras disponíveis
     """
-    available_cameras = []
-    
-    for i in range(max_test):
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            # Tenta ler um frame para confirmar que funciona
-            ret, _ = cap.read()
-            if ret:
-                # Obtém informações da câmera
-                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                
-                available_cameras.append({
-                    'id': i,
-                    'name': f'Camera {i}',
-                    'resolution': f'{width}x{height}'
-                })
-            cap.release()
-    
-    return available_cameras
+    if max_test is not None:
+        return CameraDiscovery(max_test=max_test).refresh()
+    return get_camera_discovery().get_cameras(force_refresh=force_refresh)
 
 def test_camera_connection(camera_id):
     """
@@ -41,16 +232,14 @@ def test_camera_connection(camera_id):
     Returns:
         dict com status de sucesso e mensagem
     """
-    cap = cv2.VideoCapture(camera_id)
-    
-    if not cap.isOpened():
-        return {
-            'success': False,
-            'message': f'Não foi possível acessar a câmera {camera_id}'
-        }
-    
-    ret, frame = cap.read()
-    cap.release()
+    with get_camera_manager().borrow(camera_id, warmup=False) as session:
+        if session is None:
+            return {
+                'success': False,
+                'message': f'Não foi possível acessar a câmera {camera_id}'
+            }
+        
+        ret, frame = session.read()
     
     if not ret:
         return {
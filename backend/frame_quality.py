@@ -0,0 +1,129 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from metrics import increment, observe_stage
+
+
+class FrameQualityGate:
+    def __init__(self, min_sharpness=None, min_brightness=None, max_brightness=None,
+                 max_clipped=None, max_motion=None, sample_width=320):
+        """
+        Filtro rápido que descarta frames ruins antes do Canny/contornos.
+
+        As verificações rodam sobre uma cópia reduzida do frame em tons de
+        cinza. Valores não informados vêm das variáveis de ambiente
+        QUALITY_MIN_SHARPNESS, QUALITY_MIN_BRIGHTNESS, QUALITY_MAX_BRIGHTNESS,
+        QUALITY_MAX_CLIPPED e QUALITY_MAX_MOTION.
+
+        Args:
+            min_sharpness: Variância mínima do Laplaciano (foco / borrão)
+            min_brightness: Brilho médio mínimo (0-255)
+            max_brightness: Brilho médio máximo (0-255)
+            max_clipped: Fração máxima de pixels saturados (pretos ou brancos)
+            max_motion: Diferença média máxima em relação ao frame anterior
+            sample_width: Largura da cópia reduzida usada nas verificações
+        """
+        self.min_sharpness = min_sharpness if min_sharpness is not None else float(
+            os.getenv('QUALITY_MIN_SHARPNESS', 15))
+        self.min_brightness = min_brightness if min_brightness is not None else float(
+            os.getenv('QUALITY_MIN_BRIGHTNESS', 20))
+        self.max_brightness = max_brightness if max_brightness is not None else float(
+            os.getenv('QUALITY_MAX_BRIGHTNESS', 235))
+        self.max_clipped = max_clipped if max_clipped is not None else float(
+            os.getenv('QUALITY_MAX_CLIPPED', 0.5))
+        self.max_motion = max_motion if max_motion is not None else float(
+            os.getenv('QUALITY_MAX_MOTION', 12))
+        self.sample_width = sample_width
+        self.checked = 0
+        self.rejected = {'blur': 0, 'exposure': 0, 'motion': 0}
+        self.fallback = False
+        self._previous = None
+
+    def _sample(self, img):
+        height, width = img.shape[:2]
+        if width > self.sample_width:
+            size = (self.sample_width, max(1, int(height * self.sample_width / width)))
+            img = cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return img
+
+    def check(self, img):
+        """
+        Avalia um frame.
+
+        Frames devem ser avaliados na ordem de captura, pois a detecção de
+        movimento compara cada frame com o anterior.
+
+        Returns:
+            None se o frame passou, ou o motivo da rejeição
+            ('blur', 'exposure' ou 'motion')
+        """
+        self.checked += 1
+        small = self._sample(img)
+        previous, self._previous = self._previous, small
+
+        hist = cv2.calcHist([small], [0], None, [256], [0, 256]).ravel()
+        total = hist.sum()
+        brightness = float(np.dot(hist, np.arange(256)) / total)
+        clipped = float((hist[:6].sum() + hist[250:].sum()) / total)
+        if (brightness < self.min_brightness or brightness > self.max_brightness
+                or clipped > self.max_clipped):
+            return self._reject('exposure')
+
+        if cv2.Laplacian(small, cv2.CV_64F).var() < self.min_sharpness:
+            return self._reject('blur')
+
+        if (previous is not None and previous.shape == small.shape
+                and float(cv2.absdiff(small, previous).mean()) > self.max_motion):
+            return self._reject('motion')
+
+        return None
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        increment('macrovision_frames_rejected_total',
+                  'Frames descartados pelo filtro de qualidade', reason=reason)
+        return reason
+
+    def filter(self, frames, fallback=0):
+        """
+        Gera apenas os frames aprovados.
+
+        Com fallback > 0, se nenhum frame for aprovado, até fallback frames
+        reprovados são gerados ao final, na ordem de captura: limiares que
+        não servem para a cena (fundo branco, pouca textura) não impedem a
+        medição. summary() indica quando isso aconteceu.
+        """
+        held = []
+        passed = False
+        for img in frames:
+            start = time.perf_counter()
+            reason = self.check(img)
+            observe_stage('quality_gate', time.perf_counter() - start)
+            if reason is None:
+                passed = True
+                held = []
+                yield img
+            elif not passed and len(held) < fallback:
+                held.append(img)
+        if not passed and held:
+            self.fallback = True
+            increment('macrovision_quality_gate_fallback_total',
+                      'Análises em que todos os frames foram reprovados e o filtro foi ignorado')
+            yield from held
+
+    def summary(self):
+        """
+        Contadores de frames avaliados e rejeitados por motivo, e se os
+        frames reprovados foram usados por falta de aprovados (fallback).
+        """
+        return {
+            'checked': self.checked,
+            'rejected': dict(self.rejected),
+            'rejected_total': sum(self.rejected.values()),
+            'fallback': self.fallback
+        }
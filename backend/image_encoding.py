@@ -0,0 +1,167 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_index import thumbnail_key
+from metrics import increment, timed
+
+# Formato -> (extensão, tipo MIME, parâmetro de qualidade do OpenCV)
+IMAGE_FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+class ImageEncoder:
+    def __init__(self, image_format='jpeg', quality=90, thumbnail_width=320,
+                 thumbnail_quality=70, num_workers=2):
+        """
+        Codifica as imagens anotadas e suas miniaturas.
+
+        A codificação pode rodar em threads próprias (submit), fora da
+        thread da requisição; cv2.imencode libera o GIL.
+
+        Args:
+            image_format: 'jpeg' ou 'webp'
+            quality: Qualidade da imagem completa (1 a 100)
+            thumbnail_width: Largura máxima da miniatura em pixels
+                (0 desativa as miniaturas)
+            thumbnail_quality: Qualidade da miniatura (1 a 100)
+            num_workers: Threads de codificação em segundo plano
+        """
+        image_format = image_format.lower()
+        if image_format == 'jpg':
+            image_format = 'jpeg'
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f'Formato de imagem inválido: {image_format}')
+        self.image_format = image_format
+        self.extension, self.content_type, self._quality_flag = IMAGE_FORMATS[image_format]
+        self.quality = max(1, min(int(quality), 100))
+        self.thumbnail_width = max(0, int(thumbnail_width))
+        self.thumbnail_quality = max(1, min(int(thumbnail_quality), 100))
+        self.num_workers = max(1, int(num_workers))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def encode(self, img, quality=None):
+        """
+        Codifica uma imagem no formato configurado.
+
+        Returns:
+            Dados da imagem em bytes
+        """
+        quality = self.quality if quality is None else quality
+        ok, buffer = cv2.imencode(self.extension, img, [self._quality_flag, int(quality)])
+        if not ok:
+            raise ValueError(f'Falha ao codificar imagem em {self.image_format}')
+        return buffer.tobytes()
+
+    def make_thumbnail(self, img):
+        """
+        Reduz a imagem para a largura da miniatura, mantendo a proporção.
+
+        Imagens mais estreitas que a miniatura não são ampliadas.
+
+        Returns:
+            Imagem reduzida, ou None se as miniaturas estiverem desativadas
+        """
+        if not self.thumbnail_width:
+            return None
+        height, width = img.shape[:2]
+        if width <= self.thumbnail_width:
+            return img
+        thumb_height = max(1, round(height * self.thumbnail_width / width))
+        return cv2.resize(img, (self.thumbnail_width, thumb_height), interpolation=cv2.INTER_AREA)
+
+    def encode_image(self, img):
+        """Codifica a imagem completa, em bytes."""
+        with timed('encode'):
+            return self.encode(img)
+
+    def encode_thumbnail(self, img):
+        """Codifica a miniatura, em bytes (None se desativadas)."""
+        with timed('thumbnail'):
+            thumb = self.make_thumbnail(img)
+            return self.encode(thumb, self.thumbnail_quality) if thumb is not None else None
+
+    def filename(self, stem):
+        """Nome do arquivo de uma imagem no formato configurado."""
+        return f'{stem}{self.extension}'
+
+    def content_key(self, img):
+        """
+        Identificação do conteúdo de uma imagem, para save_image(...,
+        content_key=...).
+
+        O hash cobre os pixels e as opções de codificação, então só imagens
+        idênticas bit a bit (reenvios do mesmo arquivo) têm a mesma
+        identificação; frames da câmera nunca se repetem.
+
+        Returns:
+            32 caracteres hexadecimais
+        """
+        with timed('hash'):
+            # sha256 tem aceleração em hardware na maioria das CPUs
+            digest = hashlib.sha256()
+            digest.update(
+                f'{self.image_format}:{self.quality}:{self.thumbnail_width}:'
+                f'{self.thumbnail_quality}:{img.shape}:{img.dtype}'.encode('utf-8')
+            )
+            digest.update(np.ascontiguousarray(img).data)
+        return digest.hexdigest()[:32]
+
+    def thumbnail_key(self, s3_key):
+        """Chave da miniatura de uma imagem, ou None se desativadas."""
+        return thumbnail_key(s3_key) if self.thumbnail_width else None
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Executa func(*args, **kwargs) numa thread de codificação.
+
+        Returns:
+            Future da execução
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.num_workers, thread_name_prefix='image-encode'
+                )
+            executor = self._executor
+        increment('macrovision_image_encode_jobs_total',
+                  'Imagens codificadas em segundo plano')
+        return executor.submit(func, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """Encerra as threads de codificação (esperando as pendentes)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_image_encoder = None
+_image_encoder_lock = threading.Lock()
+
+
+def get_image_encoder():
+    """
+    Retorna o codificador de imagens compartilhado pelo processo.
+
+    Configurável pelas variáveis IMAGE_FORMAT, IMAGE_QUALITY,
+    THUMBNAIL_WIDTH, THUMBNAIL_QUALITY e IMAGE_ENCODE_WORKERS.
+    """
+    global _image_encoder
+    with _image_encoder_lock:
+        if _image_encoder is None:
+            _image_encoder = ImageEncoder(
+                image_format=os.getenv('IMAGE_FORMAT', 'jpeg'),
+                quality=int(os.getenv('IMAGE_QUALITY', 90)),
+                thumbnail_width=int(os.getenv('THUMBNAIL_WIDTH', 320)),
+                thumbnail_quality=int(os.getenv('THUMBNAIL_QUALITY', 70)),
+                num_workers=int(os.getenv('IMAGE_ENCODE_WORKERS', 2))
+            )
+        return _image_encoder
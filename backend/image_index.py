@@ -0,0 +1,306 @@
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+MAX_PAGE_SIZE = 1000
+
+# Miniaturas ficam num subdiretório ao lado da imagem completa
+THUMBNAIL_DIR = 'thumbs'
+
+
+def thumbnail_key(key):
+    """
+    Retorna a chave da miniatura de uma imagem.
+
+    A miniatura tem o mesmo nome da imagem, no subdiretório THUMBNAIL_DIR:
+    macrovision/2025/01/18/a.jpg -> macrovision/2025/01/18/thumbs/a.jpg
+    """
+    directory, _, filename = key.rpartition('/')
+    return f'{directory}/{THUMBNAIL_DIR}/{filename}' if directory else f'{THUMBNAIL_DIR}/{filename}'
+
+
+def is_thumbnail_key(key):
+    """Indica se a chave é de uma miniatura."""
+    directory = key.rpartition('/')[0]
+    return directory == THUMBNAIL_DIR or directory.endswith('/' + THUMBNAIL_DIR)
+
+
+def parse_date_filter(value, end=False):
+    """
+    Converte um filtro de data (ISO 8601) em timestamp UTC.
+
+    Datas sem horário ('2025-01-18') cobrem o dia inteiro: como início,
+    valem a partir de 00:00; como fim, até 23:59:59 do mesmo dia.
+
+    Args:
+        value: Data ou data/hora em ISO 8601 (None para sem filtro)
+        end: Se True, interpreta a data como limite final (inclusivo)
+
+    Returns:
+        Timestamp (s) ou None
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+        return parsed.timestamp() - 1e-6
+    return parsed.timestamp()
+
+
+class ImageIndex:
+    def __init__(self, loader, bucket_name=None, prefix='macrovision/', max_age=300.0):
+        """
+        Índice em memória dos metadados das imagens do bucket.
+
+        Carregado por uma listagem completa e mantido atualizado de forma
+        incremental a cada upload e remoção; é recarregado por completo apenas
+        após max_age segundos, para incorporar mudanças feitas fora do backend.
+
+        A listagem roda fora do lock do índice: durante uma recarga as
+        consultas continuam usando o índice atual, e o novo é trocado de uma
+        vez ao final.
+
+        Args:
+            loader: Função loader(prefix) que gera dicts com key, size e
+                last_modified (datetime) de todos os objetos
+            bucket_name: Bucket indexado
+            prefix: Prefixo indexado
+            max_age: Segundos até uma recarga completa
+        """
+        self.loader = loader
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.max_age = max_age
+        self._entries = {}
+        self._keys = []
+        self._loaded_at = None
+        self._lock = threading.RLock()
+        # Só uma listagem por vez; alterações feitas durante ela ficam em
+        # _pending e são reaplicadas no índice novo
+        self._load_lock = threading.Lock()
+        self._pending = None
+        self._generation = 0
+
+    def is_loaded(self):
+        """Indica se o índice já foi carregado."""
+        return self._loaded_at is not None
+
+    def _is_fresh(self):
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.max_age
+
+    def ensure_loaded(self):
+        """
+        Carrega (ou recarrega, se expirado) o índice a partir do bucket.
+
+        Se o índice ainda não foi carregado, espera a listagem. Se apenas
+        expirou e outra thread já está recarregando, segue com o atual.
+        """
+        if self._is_fresh():
+            return
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._is_fresh():
+                return
+            with self._lock:
+                self._pending = []
+                generation = self._generation
+            try:
+                entries = {}
+                for obj in self.loader(self.prefix):
+                    entries[obj['key']] = self._make_entry(obj['key'], obj['size'], obj['last_modified'])
+                keys = sorted(entries)
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+
+            with self._lock:
+                for key, entry in self._pending:
+                    if entry is None:
+                        if entries.pop(key, None) is not None:
+                            del keys[bisect.bisect_left(keys, key)]
+                    else:
+                        if key not in entries:
+                            bisect.insort(keys, key)
+                        entries[key] = entry
+                self._pending = None
+                self._entries = entries
+                self._keys = keys
+                # Uma invalidação durante a listagem pede outra recarga
+                if generation == self._generation:
+                    self._loaded_at = time.monotonic()
+        finally:
+            self._load_lock.release()
+
+    def invalidate(self):
+        """Força uma recarga completa no próximo acesso."""
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = None
+
+    def _make_entry(self, key, size, last_modified):
+        if isinstance(last_modified, datetime):
+            last_modified = last_modified.timestamp()
+        return {'key': key, 'size': size, 'last_modified': last_modified}
+
+    def add(self, key, size, last_modified=None):
+        """Registra (ou atualiza) um objeto no índice."""
+        if not key.startswith(self.prefix):
+            return
+        entry = self._make_entry(
+            key, size, last_modified if last_modified is not None else time.time()
+        )
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((key, entry))
+            if self._loaded_at is None:
+                return
+            if key not in self._entries:
+                bisect.insort(self._keys, key)
+            self._entries[key] = entry
+
+    def remove(self, keys):
+        """Remove um ou mais objetos do índice."""
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend((key, None) for key in keys)
+            if self._loaded_at is None:
+                return
+            removed = False
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    removed = True
+            if removed:
+                self._keys = [k for k in self._keys if k in self._entries]
+
+    def get(self, key):
+        """Retorna os metadados de um objeto, ou None."""
+        self.ensure_loaded()
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def iter_entries(self, prefix=None, start=None, end=None):
+        """
+        Gera os objetos indexados, em ordem de chave, com filtros opcionais.
+
+        Args:
+            prefix: Prefixo adicional das chaves
+            start: Timestamp mínimo de LastModified
+            end: Timestamp máximo de LastModified
+        """
+        self.ensure_loaded()
+        with self._lock:
+            keys = list(self._keys)
+            entries = self._entries
+        if prefix:
+            keys = keys[bisect.bisect_left(keys, prefix):]
+        for key in keys:
+            if prefix and not key.startswith(prefix):
+                break
+            entry = entries.get(key)
+            if entry is None:
+                continue
+            if start is not None and entry['last_modified'] < start:
+                continue
+            if end is not None and entry['last_modified'] > end:
+                continue
+            yield entry
+
+    def query(self, prefix=None, start=None, end=None, continuation_token=None,
+              page_size=100, descending=False):
+        """
+        Retorna uma página de imagens indexadas.
+
+        Miniaturas não aparecem como itens próprios: cada item traz
+        thumbnail_key quando a miniatura correspondente existe.
+
+        Args:
+            prefix: Prefixo das chaves
+            start: Timestamp mínimo de LastModified
+            end: Timestamp máximo de LastModified
+            continuation_token: Token devolvido pela página anterior
+            page_size: Itens por página (máximo MAX_PAGE_SIZE)
+            descending: Se True, ordena da chave mais recente para a mais antiga
+
+        Returns:
+            dict com items e next_token (None na última página)
+        """
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        self.ensure_loaded()
+
+        with self._lock:
+            keys = self._keys
+            if descending:
+                stop = bisect.bisect_left(keys, continuation_token) if continuation_token else len(keys)
+                candidates = (keys[i] for i in range(stop - 1, -1, -1))
+            else:
+                begin = bisect.bisect_right(keys, continuation_token) if continuation_token else 0
+                if prefix:
+                    begin = max(begin, bisect.bisect_left(keys, prefix))
+                candidates = (keys[i] for i in range(begin, len(keys)))
+
+            items = []
+            next_token = None
+            for key in candidates:
+                if prefix and not key.startswith(prefix):
+                    if descending and key < prefix:
+                        break
+                    if not descending:
+                        break
+                    continue
+                if is_thumbnail_key(key):
+                    continue
+                entry = self._entries[key]
+                if start is not None and entry['last_modified'] < start:
+                    continue
+                if end is not None and entry['last_modified'] > end:
+                    continue
+                if len(items) == page_size:
+                    next_token = items[-1]['key']
+                    break
+                item = self.format_entry(entry)
+                thumb = thumbnail_key(key)
+                item['thumbnail_key'] = thumb if thumb in self._entries else None
+                items.append(item)
+
+        return {'items': items, 'next_token': next_token}
+
+    @staticmethod
+    def format_entry(entry):
+        """Converte uma entrada do índice para a resposta da API."""
+        return {
+            'key': entry['key'],
+            'size': entry['size'],
+            'last_modified': datetime.fromtimestamp(
+                entry['last_modified'], tz=timezone.utc
+            ).isoformat()
+        }
+
+
+_image_index = None
+_image_index_lock = threading.Lock()
+
+
+def get_image_index():
+    """Retorna o índice de imagens compartilhado pelo processo."""
+    global _image_index
+    with _image_index_lock:
+        if _image_index is None:
+            from s3_service import S3Service
+
+            service = S3Service()
+            _image_index = ImageIndex(service.iter_objects, bucket_name=service.bucket_name)
+        return _image_index
+
+
+def peek_image_index():
+    """Retorna o índice compartilhado apenas se ele já existir."""
+    return _image_index
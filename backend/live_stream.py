@@ -0,0 +1,419 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from calibration_service import get_calibration_store
+from camera_manager import get_camera_manager
+from measurement_service import process_frame, record_history, render_annotation, save_image
+from measurement_stats import MeasurementAccumulator
+from metrics import observe_stage
+
+# Escalas de resolução usadas quando o cliente não acompanha o fluxo
+SCALE_LEVELS = (1.0, 0.75, 0.5, 0.35, 0.25)
+
+
+class BackpressureController:
+    def __init__(self, max_fps, min_fps=1.0, recover_after=30):
+        """
+        Ajusta taxa de quadros e resolução de um cliente conforme o tempo que
+        cada envio leva (o servidor só volta ao gerador depois de escrever o
+        frame no socket, então envios lentos indicam rede ou cliente lentos).
+
+        Args:
+            max_fps: Taxa máxima de quadros
+            min_fps: Taxa mínima de quadros
+            recover_after: Envios rápidos seguidos antes de voltar a subir a
+                qualidade
+        """
+        self.min_interval = 1.0 / max_fps
+        self.max_interval = 1.0 / min_fps
+        self.recover_after = recover_after
+        self.interval = self.min_interval
+        self.level = 0
+        self._fast = 0
+
+    def update(self, send_time):
+        """Registra a duração de um envio e ajusta o próximo intervalo e escala."""
+        if send_time > self.interval:
+            self.level = min(self.level + 1, len(SCALE_LEVELS) - 1)
+            self.interval = min(self.interval * 1.5, self.max_interval)
+            self._fast = 0
+        elif send_time < self.interval / 4:
+            self._fast += 1
+            if self._fast >= self.recover_after:
+                self.level = max(self.level - 1, 0)
+                self.interval = max(self.interval / 1.5, self.min_interval)
+                self._fast = 0
+
+
+class LiveStream:
+    def __init__(self, camera_id, reference_width_cm=10.0, max_fps=None,
+                 window=None, jpeg_quality=None, idle_grace=None,
+                 tolerance_cm=0.05, max_measurement_age=1.0,
+                 pyramid_max_width=None):
+        """
+        Medição ao vivo de uma câmera, compartilhada por todos os clientes.
+
+        Uma única thread lê o buffer da câmera (via CameraManager.watch),
+        mede e anota os frames; os clientes MJPEG e SSE apenas recebem o
+        resultado mais recente. A thread para sozinha quando não há clientes.
+
+        Args:
+            camera_id: Índice da câmera
+            reference_width_cm: Largura real do objeto de referência em cm
+            max_fps: Frames medidos por segundo (padrão: LIVE_MAX_FPS ou 15)
+            window: Medições recentes combinadas (padrão: LIVE_WINDOW ou 8)
+            jpeg_quality: Qualidade JPEG na escala máxima (padrão:
+                LIVE_JPEG_QUALITY ou 80)
+            idle_grace: Segundos sem clientes antes de parar (padrão:
+                LIVE_IDLE_GRACE ou 5)
+            tolerance_cm: Meia largura do intervalo de confiança para
+                considerar a medida estável
+            max_measurement_age: Idade máxima (s) de uma medição na janela
+            pyramid_max_width: Largura do frame reduzido na detecção em pirâmide
+        """
+        self.camera_id = camera_id
+        self.reference_width_cm = reference_width_cm
+        self.max_fps = max_fps or float(os.getenv('LIVE_MAX_FPS', 15))
+        self.jpeg_quality = jpeg_quality or int(os.getenv('LIVE_JPEG_QUALITY', 80))
+        self.idle_grace = idle_grace if idle_grace is not None else float(
+            os.getenv('LIVE_IDLE_GRACE', 5))
+        self.tolerance_cm = tolerance_cm
+        self.max_measurement_age = max_measurement_age
+        if pyramid_max_width is None:
+            pyramid_max_width = int(os.getenv('PYRAMID_MAX_WIDTH', 640))
+        self.pyramid_max_width = pyramid_max_width
+        self._window = deque(maxlen=window or int(os.getenv('LIVE_WINDOW', 8)))
+        self._cond = threading.Condition()
+        self._thread = None
+        self._subscribers = 0
+        self._idle_since = time.monotonic()
+        self._frame = None
+        self._last_detected = None
+        self._seq = 0
+        self.error = None
+        self._placeholder_cache = None
+
+    def subscribe(self):
+        """Registra um cliente e inicia a thread de medição, se necessário."""
+        with self._cond:
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f'live-{self.camera_id}', daemon=True
+                )
+                self._thread.start()
+
+    def unsubscribe(self):
+        """Remove um cliente."""
+        with self._cond:
+            self._subscribers -= 1
+            if self._subscribers == 0:
+                self._idle_since = time.monotonic()
+
+    def is_running(self):
+        """Indica se a thread de medição está ativa."""
+        with self._cond:
+            return self._thread is not None
+
+    def is_idle(self):
+        """Indica se o fluxo está parado e sem clientes há mais de idle_grace."""
+        with self._cond:
+            return self._thread is None and self._should_stop()
+
+    def hold(self):
+        """
+        Adia a parada por idle_grace segundos, para um cliente que vai se
+        registrar em seguida (por exemplo, quando a resposta começar).
+        """
+        with self._cond:
+            if self._subscribers == 0:
+                self._idle_since = time.monotonic()
+
+    def _should_stop(self):
+        # Deve ser chamado com self._cond adquirido
+        return (
+            self._subscribers == 0
+            and time.monotonic() - self._idle_since >= self.idle_grace
+        )
+
+    def _run(self):
+        manager = get_camera_manager()
+        calibration = get_calibration_store().get(self.camera_id)
+        roi = None
+        interval = 1.0 / self.max_fps
+
+        while True:
+            with self._cond:
+                if self._should_stop():
+                    self._thread = None
+                    return
+
+            with manager.watch(self.camera_id, timeout=5.0) as grabber:
+                if grabber is None:
+                    self._set_error('Não foi possível acessar a câmera')
+                    time.sleep(1.0)
+                    continue
+                self._set_error(None)
+
+                next_at = time.monotonic()
+                # A câmera pode ser reconectada por uma análise; nesse caso o
+                # iterador termina e a câmera é observada de novo
+                for img in grabber.iter_frames(sys.maxsize, max_age=0):
+                    with self._cond:
+                        if self._should_stop():
+                            break
+                    result = process_frame(
+                        img, self.reference_width_cm, calibration, roi,
+                        self.pyramid_max_width
+                    )
+                    roi = result['reference_box'] if result['success'] else None
+                    self._publish(img, result)
+
+                    # Mede no máximo max_fps frames; os intermediários são descartados
+                    next_at = max(next_at + interval, time.monotonic())
+                    time.sleep(max(0.0, next_at - time.monotonic()))
+
+    def _set_error(self, message):
+        with self._cond:
+            if self.error != message:
+                self.error = message
+                self._cond.notify_all()
+
+    def _publish(self, img, result):
+        for stage, seconds in result['timings'].items():
+            observe_stage(stage, seconds)
+
+        now = time.monotonic()
+        if result['success']:
+            self._window.append((now, result['dimensions']))
+        while self._window and now - self._window[0][0] > self.max_measurement_age:
+            self._window.popleft()
+
+        image = render_annotation(img, result) if result['success'] else img
+        measurement = self._measurement()
+        with self._cond:
+            self._seq += 1
+            self._frame = {
+                'seq': self._seq,
+                'timestamp': time.time(),
+                'image': image,
+                'detected': result['success'],
+                'detection': result.get('detection'),
+                'measurement': measurement,
+                'encoded': {}
+            }
+            if result['success'] and measurement is not None:
+                self._last_detected = self._frame
+            self._cond.notify_all()
+
+    def _measurement(self):
+        accumulator = MeasurementAccumulator(adaptive=True, tolerance_cm=self.tolerance_cm)
+        for _, dimensions in self._window:
+            accumulator.add(dimensions)
+        if not accumulator.count:
+            return None
+        summary = accumulator.summary()
+        return {
+            'width': round(summary['width']['mean'], 2),
+            'length': round(summary['length']['mean'], 2),
+            'height': round(summary['length']['mean'], 2),
+            'stable': summary['converged'],
+            'statistics': summary
+        }
+
+    def wait_frame(self, after_seq, timeout=5.0):
+        """
+        Aguarda um frame mais novo que after_seq.
+
+        Returns:
+            dict do frame mais recente, ou None se nada chegou no timeout
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._frame is not None and self._frame['seq'] > after_seq,
+                timeout=timeout
+            )
+            frame = self._frame
+        if frame is None or frame['seq'] <= after_seq:
+            return None
+        return frame
+
+    def _encode(self, frame, level):
+        # Cada escala é codificada uma vez por frame e dividida entre os clientes
+        data = frame['encoded'].get(level)
+        if data is not None:
+            return data
+        image = frame['image']
+        scale = SCALE_LEVELS[level]
+        if scale < 1.0:
+            height, width = image.shape[:2]
+            image = cv2.resize(
+                image, (int(width * scale), int(height * scale)),
+                interpolation=cv2.INTER_AREA
+            )
+        quality = max(40, self.jpeg_quality - 10 * level)
+        _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        data = buffer.tobytes()
+        frame['encoded'][level] = data
+        return data
+
+    def _placeholder(self):
+        # Quadro enviado enquanto a câmera não entrega frames; as escritas
+        # periódicas permitem ao servidor perceber clientes desconectados
+        message = 'Erro na camera' if self.error is not None else 'Aguardando camera'
+        cached = self._placeholder_cache
+        if cached is not None and cached[0] == message:
+            return cached[1]
+        image = np.zeros((240, 320, 3), dtype=np.uint8)
+        cv2.putText(image, message, (20, 125), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                    (255, 255, 255), 2)
+        data = cv2.imencode('.jpg', image)[1].tobytes()
+        self._placeholder_cache = (message, data)
+        return data
+
+    def mjpeg(self):
+        """
+        Gera as partes de uma resposta multipart/x-mixed-replace (boundary
+        'frame') com os frames anotados, adaptando taxa e resolução ao cliente.
+        """
+        self.subscribe()
+        try:
+            controller = BackpressureController(self.max_fps)
+            seq = 0
+            data = None
+            while True:
+                frame = self.wait_frame(seq)
+                if frame is not None:
+                    seq = frame['seq']
+                    data = self._encode(frame, controller.level)
+                elif seq == 0:
+                    data = self._placeholder()
+                # Sem frames novos, o último (ou o quadro de espera) é
+                # reenviado: mantém a conexão e permite detectar clientes que
+                # já desconectaram
+
+                start = time.perf_counter()
+                yield (
+                    b'--frame\r\nContent-Type: image/jpeg\r\n'
+                    + f'Content-Length: {len(data)}\r\n\r\n'.encode()
+                    + data + b'\r\n'
+                )
+                send_time = time.perf_counter() - start
+                controller.update(send_time)
+                time.sleep(max(0.0, controller.interval - send_time))
+        finally:
+            self.unsubscribe()
+
+    def events(self, keepalive=15.0):
+        """
+        Gera eventos Server-Sent Events com a medição de cada frame.
+
+        Clientes lentos recebem apenas a medição mais recente.
+        """
+        self.subscribe()
+        try:
+            seq = 0
+            error = None
+            while True:
+                frame = self.wait_frame(seq, timeout=keepalive)
+                if self.error != error:
+                    error = self.error
+                    if error is not None:
+                        yield f"event: error\ndata: {json.dumps({'message': error})}\n\n"
+                if frame is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                seq = frame['seq']
+                payload = {
+                    'seq': seq,
+                    'timestamp': frame['timestamp'],
+                    'detected': frame['detected'],
+                    'detection': frame['detection'],
+                    'measurement': frame['measurement']
+                }
+                yield f'event: measurement\ndata: {json.dumps(payload)}\n\n'
+        finally:
+            self.unsubscribe()
+
+    def commit(self, async_upload=True):
+        """
+        Persiste a medição atual: a imagem anotada mais recente com medição
+        válida é enviada ao S3 e a medição entra no histórico.
+
+        Returns:
+            dict no formato de MeasurementService.perform_analysis
+        """
+        with self._cond:
+            frame = self._last_detected
+        if frame is None or time.time() - frame['timestamp'] > self.max_measurement_age:
+            return {
+                'success': False,
+                'message': 'Nenhuma medição ao vivo disponível',
+                'measurements': None,
+                'images': []
+            }
+
+        image = save_image(frame['image'], self.camera_id, async_upload, prefix='live')
+        measurement = frame['measurement']
+        statistics = measurement['statistics']
+        result = {
+            'success': True,
+            'message': f"Medição ao vivo registrada com {statistics['frames_used']} frames",
+            'measurements': {
+                'width': measurement['width'],
+                'length': measurement['length'],
+                'height': measurement['height']
+            },
+            'images': [image] if image is not None else [],
+            'num_valid_captures': statistics['frames_used'],
+            'statistics': statistics,
+            'stable': measurement['stable']
+        }
+        record_history(self.camera_id, result, 'live', self.reference_width_cm)
+        return result
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def get_live_stream(camera_id, reference_width_cm=10.0):
+    """
+    Retorna o fluxo ao vivo de uma câmera para uma largura de referência.
+
+    Fluxos da mesma câmera compartilham o buffer de captura. Fluxos parados
+    e sem clientes há mais de idle_grace saem do registro, então larguras
+    informadas uma única vez não ficam em memória.
+    """
+    key = (camera_id, float(reference_width_cm))
+    with _streams_lock:
+        for old_key in [k for k, s in _streams.items() if k != key and s.is_idle()]:
+            del _streams[old_key]
+        stream = _streams.get(key)
+        if stream is None:
+            stream = _streams[key] = LiveStream(camera_id, reference_width_cm)
+        # O cliente só se registra quando a resposta começa
+        stream.hold()
+        return stream
+
+
+def find_live_stream(camera_id, reference_width_cm=None):
+    """
+    Retorna um fluxo ao vivo ativo da câmera (com a largura de referência
+    informada, se houver), ou None.
+    """
+    with _streams_lock:
+        streams = [
+            stream for (cid, width), stream in _streams.items()
+            if cid == camera_id and (
+                reference_width_cm is None or width == float(reference_width_cm)
+            )
+        ]
+    return next((s for s in streams if s.is_running()), None)
@@ -0,0 +1,149 @@
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+DEFAULT_STORAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'storage')
+
+# Arquivos temporários das gravações atômicas (ignorados na listagem)
+_TMP_SUFFIX = '.tmp'
+
+
+def _not_found(operation):
+    return ClientError(
+        {'Error': {'Code': 'NoSuchKey', 'Message': 'The specified key does not exist.'}},
+        operation
+    )
+
+
+class _ListObjectsPaginator:
+    def __init__(self, client):
+        self._client = client
+
+    def paginate(self, Bucket=None, Prefix='', PaginationConfig=None):
+        page_size = (PaginationConfig or {}).get('PageSize', 1000)
+        contents = []
+        for key in self._client.keys(Prefix):
+            try:
+                stat = os.stat(self._client.path(key))
+            except FileNotFoundError:
+                continue
+            contents.append({
+                'Key': key,
+                'Size': stat.st_size,
+                'LastModified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+            })
+            if len(contents) == page_size:
+                yield {'Contents': contents, 'KeyCount': len(contents)}
+                contents = []
+        if contents:
+            yield {'Contents': contents, 'KeyCount': len(contents)}
+
+
+class LocalStorageClient:
+    def __init__(self, root=DEFAULT_STORAGE_DIR, base_url='http://localhost:5000/api/storage'):
+        """
+        Armazenamento em disco local com as operações do cliente boto3 usadas
+        pelo S3Service, para rodar o backend sem acesso à AWS.
+
+        Cada chave vira um arquivo sob root (o bucket é ignorado). As
+        gravações são atômicas: o arquivo é escrito num temporário no mesmo
+        diretório e renomeado, então leitores nunca veem imagens pela metade.
+        Os arquivos são servidos pela rota /api/storage/<chave>.
+
+        Args:
+            root: Diretório raiz dos objetos
+            base_url: URL pública da rota que serve os arquivos
+        """
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        """Caminho local de uma chave (chaves que escapam da raiz são recusadas)."""
+        path = os.path.abspath(os.path.join(self.root, *key.split('/')))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            raise ValueError(f'Chave inválida: {key}')
+        return path
+
+    def object_url(self, key):
+        """URL pública de um objeto."""
+        return f'{self.base_url}/{key}'
+
+    def keys(self, prefix=''):
+        """Chaves com o prefixo informado, em ordem."""
+        keys = []
+        for directory, _, files in os.walk(self.root):
+            relative = os.path.relpath(directory, self.root)
+            base = '' if relative == '.' else relative.replace(os.sep, '/') + '/'
+            if not (base.startswith(prefix) or prefix.startswith(base)):
+                continue
+            keys.extend(
+                base + name for name in files
+                if not name.endswith(_TMP_SUFFIX) and (base + name).startswith(prefix)
+            )
+        return sorted(keys)
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        path = self.path(Key)
+        data = bytes(Body) if isinstance(Body, (bytes, bytearray, memoryview)) else Body.read()
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f'.{uuid.uuid4().hex}{_TMP_SUFFIX}')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket, Key, f, **(ExtraArgs or {}))
+
+    def head_object(self, Bucket, Key):
+        try:
+            stat = os.stat(self.path(Key))
+        except (FileNotFoundError, ValueError):
+            raise _not_found('HeadObject')
+        return {
+            'ContentLength': stat.st_size,
+            'LastModified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        }
+
+    def get_object(self, Bucket, Key):
+        try:
+            f = open(self.path(Key), 'rb')
+        except (FileNotFoundError, ValueError):
+            raise _not_found('GetObject')
+        return {'Body': f}
+
+    def delete_object(self, Bucket, Key):
+        try:
+            os.remove(self.path(Key))
+        except (FileNotFoundError, ValueError):
+            pass
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.delete_object(Bucket, item['Key'])
+        return {}
+
+    def get_paginator(self, operation_name):
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(operation_name)
+        return _ListObjectsPaginator(self)
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        # Sem assinatura: a rota local não exige autenticação
+        return self.object_url(Params['Key'])
@@ -1,10 +1,29 @@
+import os
+import sqlite3
+import time
 import cv2
 import numpy as np
 from datetime import datetime
+from functools import partial
+from itertools import islice
+from calibration_service import get_calibration_store, reference_matches
+from camera_manager import get_camera_manager
+from frame_quality import FrameQualityGate
+from image_encoding import get_image_encoder
+from image_index import get_image_index, is_thumbnail_key, thumbnail_key
+from measurement_stats import MeasurementAccumulator, ObjectTracker
+from measurement_store import get_measurement_store
+from metrics import collect_timings, increment, observe_stage, timed
+from processing_engine import FrameProcessingEngine, combine_stats
 from s3_service import S3Service
+from upload_queue import get_upload_queue
 
 class MeasurementService:
-    def __init__(self, camera_id, reference_width_cm=10.0, num_captures=8):
+    def __init__(self, camera_id, reference_width_cm=10.0, num_captures=8,
+                 max_frame_age=0.5, processing_mode=None, max_workers=None,
+                 use_calibration=True, pyramid_max_width=None, adaptive=False,
+                 tolerance_cm=0.05, max_captures=32, min_captures=3,
+                 quality_gate=None, multi_object=False):
         """
         Inicializa o serviço de medição.
         
@@ -12,102 +31,270 @@ class MeasurementService:
             camera_id: Índice da câmera a ser utilizada
             reference_width_cm: Largura real do objeto de referência em cm
             num_captures: Número de capturas para calcular média
+            max_frame_age: Idade máxima (s) de frames já capturados que podem
+                entrar na análise
+            processing_mode: 'sequential', 'thread' ou 'process'
+            max_workers: Número de workers do processamento paralelo
+            use_calibration: Se True, usa (e mantém) a calibração salva da
+                câmera para processar só a região da referência
+            pyramid_max_width: Largura do frame reduzido usado para localizar
+                a referência (padrão: PYRAMID_MAX_WIDTH ou 640; 0 desativa)
+            adaptive: Se True, descarta frames discrepantes e encerra a captura
+                assim que o intervalo de confiança ficar abaixo de tolerance_cm
+                (num_captures é ignorado)
+            tolerance_cm: Precisão desejada no modo adaptativo (cm)
+            max_captures: Limite de frames no modo adaptativo
+            min_captures: Frames aceitos antes de avaliar a convergência
+            quality_gate: Se True, descarta frames borrados, mal expostos ou
+                com movimento antes do processamento (padrão: QUALITY_GATE=1;
+                desativado, pois os limiares ainda não são calibrados por
+                câmera). Se todos os frames forem reprovados, a análise usa
+                os frames sem filtro
+            multi_object: Se True, mede todos os objetos sobre a referência,
+                mantendo a identidade de cada um entre os frames (resultado
+                em objects); measurements passa a ser o do objeto 1
         """
         self.camera_id = camera_id
         self.reference_width_cm = reference_width_cm
         self.num_captures = num_captures
+        self.max_frame_age = max_frame_age
         self.measurements = []
+        self.use_calibration = use_calibration
+        self.calibration = None
+        if pyramid_max_width is None:
+            pyramid_max_width = int(os.getenv('PYRAMID_MAX_WIDTH', 640))
+        self.pyramid_max_width = pyramid_max_width
+        self.adaptive = adaptive
+        self.tolerance_cm = tolerance_cm
+        self.max_captures = max_captures
+        self.min_captures = min_captures
+        if quality_gate is None:
+            quality_gate = os.getenv('QUALITY_GATE', '0') == '1'
+        self.quality_gate = quality_gate
+        self.multi_object = multi_object
+        self.engine = FrameProcessingEngine(processing_mode, max_workers)
         self.s3_service = S3Service()
         
-    def perform_analysis(self, save_to_s3=True):
+    def perform_analysis(self, save_to_s3=True, async_upload=True, include_timings=False):
         """
         Executa a análise dimensional completa.
         
+        Os tempos de cada etapa alimentam as métricas do processo (/api/metrics)
+        e as análises bem-sucedidas entram no histórico de medições.
+        
         Args:
             save_to_s3: Se True, salva imagens no S3; se False, retorna apenas medições
+            async_upload: Se True, o upload é feito em segundo plano e a imagem
+                volta com status 'pending' (consultar /api/uploads/<upload_id>)
+            include_timings: Se True, inclui no resultado o tempo gasto em cada
+                etapa desta análise
             
         Returns:
             dict com resultados da análise
         """
-        # Abre câmera
-        cap = cv2.VideoCapture(self.camera_id)
-        if not cap.isOpened():
-            return {
-                'success': False,
-                'message': 'Não foi possível acessar a câmera',
-                'measurements': None,
-                'images': []
-            }
+        with collect_timings() as breakdown:
+            with timed('analysis'):
+                result = self._run_analysis(save_to_s3, async_upload)
         
-        measurements = []
+        increment('macrovision_analyses_total', 'Análises executadas',
+                  result='success' if result['success'] else 'failure')
+        record_history(self.camera_id, result, 'analysis', self.reference_width_cm)
+        if include_timings:
+            result['timings'] = breakdown.summary()
+        return result
+    
+    def _run_analysis(self, save_to_s3, async_upload):
         image_urls = []
         best_result = None  # Armazena o melhor resultado para salvar a imagem
+        best_frame = None
         
-        try:
-            for i in range(self.num_captures):
-                ret, img = cap.read()
-                if not ret:
-                    continue
-                
-                # Processamento da imagem
-                result = self._process_frame(img)
-                
-                if result['success']:
-                    measurements.append(result['dimensions'])
-                    
-                    # Guarda o primeiro resultado válido para salvar a imagem
-                    if best_result is None:
-                        best_result = result
-        
-        finally:
-            cap.release()
+        # Médias e dispersão acumuladas frame a frame (Welford)
+        accumulator = MeasurementAccumulator(
+            adaptive=self.adaptive,
+            tolerance_cm=self.tolerance_cm,
+            min_frames=self.min_captures
+        )
         
-        # Salva apenas UMA imagem no S3 se houver medições válidas
-        if save_to_s3 and best_result is not None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'analysis_{timestamp}.jpg'
+        gate = FrameQualityGate() if self.quality_gate else None
+        
+        # Vários objetos: cada um com sua identidade e seu acumulador
+        tracker = None
+        max_objects = 1
+        best_ids = None
+        if self.multi_object:
+            tracker = ObjectTracker(
+                adaptive=self.adaptive,
+                tolerance_cm=self.tolerance_cm,
+                min_frames=self.min_captures
+            )
+            max_objects = None
+        measure = partial(process_frame, max_objects=max_objects)
+        
+        def on_result(img, result):
+            nonlocal best_frame, best_result, best_ids
+            # Tempos medidos no worker (thread ou processo) são registrados aqui
+            for stage, seconds in result['timings'].items():
+                observe_stage(stage, seconds)
+            if not result['success']:
+                _count_frame('no_detection')
+                return
+            if tracker is not None:
+                matches = tracker.update(result['reference_box'], result['objects'])
+                accepted = any(ok for _, ok in matches)
+            else:
+                matches = None
+                accepted = accumulator.add(result['dimensions'])
+            if not accepted:
+                _count_frame('outlier')
+                return
+            _count_frame('measured')
+            # Só o frame do primeiro resultado válido fica em memória
+            if best_result is None:
+                best_frame, best_result = img, result
+                best_ids = [track_id for track_id, _ in matches] if matches else None
+        
+        calibration_store = get_calibration_store()
+        if self.use_calibration:
+            self.calibration = calibration_store.get(self.camera_id)
+        
+        # Empresta a câmera já aberta e aquecida do gerenciador
+        with get_camera_manager().borrow(self.camera_id) as session:
+            if session is None:
+                return {
+                    'success': False,
+                    'message': 'Não foi possível acessar a câmera',
+                    'measurements': None,
+                    'images': []
+                }
             
-            # Converte imagem para bytes
-            _, buffer = cv2.imencode('.jpg', best_result['annotated_image'])
-            image_data = buffer.tobytes()
+            # A thread de captura mantém o buffer cheio enquanto os frames
+            # anteriores são processados
+            grabber = session.start_grabber()
+            limit = self.max_captures if self.adaptive else self.num_captures
             
-            # Upload para S3
-            upload_result = self.s3_service.upload_image_data(
-                image_data,
-                filename
-            )
+            if gate is not None:
+                # Frames reprovados no filtro de qualidade são repostos, até o
+                # dobro do número pedido; se nenhum passar, os reprovados são
+                # medidos mesmo assim
+                frames = islice(
+                    gate.filter(_timed_frames(
+                        grabber.iter_frames(2 * limit, max_age=self.max_frame_age)
+                    ), fallback=limit),
+                    limit
+                )
+            else:
+                frames = _timed_frames(grabber.iter_frames(limit, max_age=self.max_frame_age))
+            
+            if self.adaptive:
+                frames = _until_converged(frames, tracker or accumulator)
+            
+            # Sem calibração, os primeiros frames são processados um a um até a
+            # referência ser encontrada; a região encontrada é reaproveitada
+            # pelos frames seguintes
+            roi = None
+            seed_results = []
+            if self.calibration is None:
+                seed_results, seed_stats = FrameProcessingEngine('sequential').map(
+                    measure, frames, self.reference_width_cm, None, None,
+                    self.pyramid_max_width,
+                    stop_when=lambda result: result['success'],
+                    on_result=on_result
+                )
+                if seed_results and seed_results[-1]['success']:
+                    roi = seed_results[-1]['reference_box']
             
-            if upload_result['success']:
-                image_urls.append({
-                    'url': upload_result['url'],
-                    's3_key': upload_result['s3_key'],
-                    'filename': filename
-                })
-        
-        # Calcula médias
-        if measurements:
-            avg_width = np.mean([m['width'] for m in measurements])
-            avg_length = np.mean([m['length'] for m in measurements])
+            # Processamento dos frames em paralelo, resultados na ordem de captura
+            results, processing_stats = self.engine.map(
+                measure, frames, self.reference_width_cm, self.calibration,
+                roi, self.pyramid_max_width,
+                on_result=on_result
+            )
+            if seed_results:
+                results = seed_results + results
+                processing_stats = combine_stats(seed_stats, processing_stats)
+        
+        calibration_info = self._update_calibration(calibration_store, results)
+        
+        # Salva apenas UMA imagem no S3 se houver medições válidas
+        if save_to_s3 and best_result is not None:
+            # Anota apenas o frame escolhido
+            with timed('annotate'):
+                annotated = render_annotation(best_frame, best_result, best_ids)
+            image = save_image(annotated, self.camera_id, async_upload, self.s3_service)
+            if image is not None:
+                image_urls.append(image)
+        
+        objects = None
+        if tracker is not None:
+            objects = tracker.summary()
+            if objects:
+                accumulator = tracker.accumulator(objects[0]['id'])
+        
+        # Médias das medições aceitas
+        if accumulator.count:
+            avg_width = accumulator.width.mean
+            avg_length = accumulator.length.mean
             
             return {
                 'success': True,
-                'message': f'Análise concluída com {len(measurements)} medições válidas',
+                'message': f'Análise concluída com {accumulator.count} medições válidas',
                 'measurements': {
                     'width': round(float(avg_width), 2),
                     'length': round(float(avg_length), 2),
                     'height': round(float(avg_length), 2)
                 },
                 'images': image_urls,
-                'num_valid_captures': len(measurements)
+                'num_valid_captures': accumulator.count,
+                'statistics': accumulator.summary(),
+                'quality': gate.summary() if gate is not None else None,
+                'processing': processing_stats,
+                'calibration': calibration_info,
+                'objects': objects
             }
         else:
             return {
                 'success': False,
                 'message': 'Nenhuma medição válida foi obtida',
                 'measurements': None,
-                'images': []
+                'images': [],
+                'quality': gate.summary() if gate is not None else None,
+                'processing': processing_stats
             }
     
+    def _update_calibration(self, calibration_store, results):
+        """
+        Recalibra a câmera quando não havia calibração ou a referência mudou.
+        
+        Usa a mediana das referências detectadas no frame inteiro.
+        
+        Returns:
+            dict com o número de frames que usaram a calibração e se ela foi
+            atualizada
+        """
+        valid = [r for r in results if r['success']]
+        used = sum(1 for r in valid if r['calibrated'])
+        full_detections = [r for r in valid if not r['calibrated']]
+        
+        updated = False
+        if self.use_calibration and full_detections and used == 0:
+            boxes = np.array([r['reference_box'] for r in full_detections])
+            reference_box = np.median(boxes, axis=0).round().astype(int).tolist()
+            frame_size = full_detections[0]['frame_size']
+            
+            if not reference_matches(self.calibration, reference_box, frame_size):
+                self.calibration = calibration_store.save(
+                    self.camera_id,
+                    reference_box,
+                    frame_size,
+                    self.reference_width_cm
+                )
+                updated = True
+        
+        return {
+            'frames_calibrated': used,
+            'updated': updated
+        }
+    
     def _process_frame(self, img):
         """
         Processa um frame individual e extrai medidas.
@@ -116,88 +303,636 @@ class MeasurementService:
             img: Imagem capturada
             
         Returns:
-            dict com sucesso, dimensões e imagem anotada
+            dict com sucesso, dimensões e caixas detectadas
         """
-        # Pré-processamento
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (7, 7), 0)
-        edges = cv2.Canny(blur, 50, 150)
-        
-        # Encontrar contornos com hierarquia
-        contornos, hierarquia = cv2.findContours(
-            edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
+        return process_frame(
+            img, self.reference_width_cm, self.calibration,
+            pyramid_max_width=self.pyramid_max_width
         )
-        
-        if not contornos or hierarquia is None:
-            return {'success': False}
-        
-        hierarquia = hierarquia[0]
-        
-        # Selecionar contorno de referência (maior contorno)
-        contornos_area = [
-            (cv2.contourArea(c), i, c) 
-            for i, c in enumerate(contornos) 
-            if cv2.contourArea(c) > 100
-        ]
-        
-        if not contornos_area:
-            return {'success': False}
-        
-        contornos_area.sort(reverse=True, key=lambda x: x[0])
-        area_ref, idx_ref, objeto_referencia = contornos_area[0]
-        
-        # Bounding box do objeto de referência
-        x_ref, y_ref, w_ref, h_ref = cv2.boundingRect(objeto_referencia)
-        pixels_por_cm = w_ref / self.reference_width_cm
-        
-        objetos_medidos = []
-        
-        # Usar hierarquia (filhos do objeto de referência)
-        filho_idx = hierarquia[idx_ref][2]
-        while filho_idx != -1:
-            if filho_idx != idx_ref:
-                c = contornos[filho_idx]
-                if cv2.contourArea(c) > 100:
-                    x, y, w, h = cv2.boundingRect(c)
-                    if w < 0.95 * w_ref and h < 0.95 * h_ref:
-                        objetos_medidos.append(c)
-            filho_idx = hierarquia[filho_idx][0]
-        
-        # Se não encontrou filhos, usar bounding box
-        if not objetos_medidos:
-            for area, idx, c in contornos_area[1:]:
-                if idx == idx_ref:
-                    continue
-                x, y, w, h = cv2.boundingRect(c)
-                if (x >= x_ref and y >= y_ref and 
-                    x + w <= x_ref + w_ref and y + h <= y_ref + h_ref):
-                    if w < 0.95 * w_ref and h < 0.95 * h_ref:
-                        objetos_medidos.append(c)
-        
-        if not objetos_medidos:
-            return {'success': False}
-        
-        # Criar imagem anotada
-        img_resultado = img.copy()
-        cv2.rectangle(
-            img_resultado, 
-            (x_ref, y_ref), 
-            (x_ref + w_ref, y_ref + h_ref), 
-            (0, 255, 0), 2
+
+
+def _timed_frames(frames):
+    # Tempo esperando a thread de captura entregar cada frame
+    frames = iter(frames)
+    while True:
+        start = time.perf_counter()
+        img = next(frames, None)
+        if img is None:
+            return
+        observe_stage('frame_wait', time.perf_counter() - start)
+        yield img
+
+
+def _count_frame(result):
+    increment('macrovision_frames_processed_total',
+              'Frames processados, por resultado', result=result)
+
+
+def _until_converged(frames, accumulator):
+    # Para de pedir frames à câmera assim que a medição convergir
+    for img in frames:
+        if accumulator.is_converged():
+            return
+        yield img
+
+
+def _add_timing(timings, stage, seconds):
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def _edges(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    blur = cv2.GaussianBlur(gray, (7, 7), 0)
+    return cv2.Canny(blur, 50, 150)
+
+
+def _find_contours(img, timings=None, edges=None):
+    # Pré-processamento (pulado quando o mapa de bordas já vem pronto)
+    start = time.perf_counter()
+    if edges is None:
+        edges = _edges(img)
+    preprocessed = time.perf_counter()
+    
+    # Encontrar contornos com hierarquia
+    contornos, hierarquia = cv2.findContours(
+        edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
+    )
+    _add_timing(timings, 'preprocess', preprocessed - start)
+    _add_timing(timings, 'find_contours', time.perf_counter() - preprocessed)
+    
+    if not contornos or hierarquia is None:
+        return None, None
+    
+    return contornos, hierarquia[0]
+
+
+def _contour_geometry(contornos):
+    """
+    Área e bounding box de todos os contornos de uma vez.
+    
+    Equivale a cv2.contourArea e cv2.boundingRect em cada contorno, mas com
+    os pontos concatenados num único array: fórmula do laço (shoelace) e
+    mínimos/máximos por contorno com np.*.reduceat, sem uma chamada ao
+    OpenCV por contorno.
+    
+    Returns:
+        Tupla (áreas, bounding boxes (x, y, w, h) em um array N x 4)
+    """
+    lengths = np.fromiter((len(c) for c in contornos), dtype=np.int64, count=len(contornos))
+    points = np.concatenate(contornos).reshape(-1, 2).astype(np.int64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    # Próximo ponto de cada ponto, voltando ao primeiro no fim do contorno
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    x, y = points[:, 0], points[:, 1]
+    areas = np.abs(np.add.reduceat(x * y[following] - x[following] * y, starts)) / 2
+    x0, y0 = np.minimum.reduceat(x, starts), np.minimum.reduceat(y, starts)
+    x1, y1 = np.maximum.reduceat(x, starts), np.maximum.reduceat(y, starts)
+    return areas, np.column_stack((x0, y0, x1 - x0 + 1, y1 - y0 + 1))
+
+
+def _detect_objects(contornos, hierarquia, min_area=100, max_objects=1):
+    """
+    Localiza o objeto de referência e os objetos medidos entre os contornos.
+    
+    Áreas e bounding boxes de todos os contornos são calculadas de uma vez
+    (_contour_geometry) e os filtros (área, tamanho, contenção) são
+    aplicados com máscaras NumPy.
+    Contornos dentro de outro objeto (a borda interna do próprio objeto,
+    furos, detalhes) não contam como objetos separados.
+    
+    Args:
+        contornos: Contornos retornados por cv2.findContours
+        hierarquia: Hierarquia dos contornos (RETR_TREE)
+        min_area: Área mínima (px²) de um contorno considerado
+        max_objects: Número máximo de objetos, do maior para o menor
+            (None para todos)
+    
+    Returns:
+        Tupla (bounding box da referência, lista de bounding boxes dos
+        objetos) ou None
+    """
+    areas, rects = _contour_geometry(contornos)
+    valid = areas > min_area
+    if not valid.any():
+        return None
+    
+    # Referência: maior contorno
+    idx_ref = int(np.argmax(np.where(valid, areas, -1.0)))
+    x_ref, y_ref, w_ref, h_ref = rects[idx_ref]
+    x, y, w, h = rects.T
+    
+    smaller = valid & (w < 0.95 * w_ref) & (h < 0.95 * h_ref)
+    smaller[idx_ref] = False
+    
+    # Filhos do contorno de referência na hierarquia; se não houver, contornos
+    # cuja bounding box está dentro da referência
+    candidates = smaller & (hierarquia[:, 3] == idx_ref)
+    if not candidates.any():
+        candidates = smaller & (
+            (x >= x_ref) & (y >= y_ref)
+            & (x + w <= x_ref + w_ref) & (y + h <= y_ref + h_ref)
         )
-        cv2.putText(
-            img_resultado, 
-            "Referencia", 
-            (x_ref, y_ref - 10),
-            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2
+    indices = np.flatnonzero(candidates)
+    if not len(indices):
+        return None
+    
+    # inside[i, j]: a caixa i está dentro da caixa j, e j é o contorno maior
+    # (em empates de área, o de menor índice)
+    bx, by, bw, bh = rects[indices].T
+    bx1, by1 = bx + bw, by + bh
+    inside = (
+        (bx[:, None] >= bx[None, :]) & (by[:, None] >= by[None, :])
+        & (bx1[:, None] <= bx1[None, :]) & (by1[:, None] <= by1[None, :])
+    )
+    cand_areas = areas[indices]
+    inside &= (cand_areas[None, :] > cand_areas[:, None]) | (
+        (cand_areas[None, :] == cand_areas[:, None])
+        & (indices[None, :] < indices[:, None])
+    )
+    top = indices[~inside.any(axis=1)]
+    top = top[np.argsort(-areas[top], kind='stable')][:max_objects]
+    
+    return (
+        tuple(int(v) for v in rects[idx_ref]),
+        [tuple(int(v) for v in rects[i]) for i in top]
+    )
+
+
+def _detect_in_region(img, box, margin, extra_pad=4, timings=None, max_objects=1):
+    """
+    Detecta referência e objetos apenas numa região do frame.
+    
+    Args:
+        img: Frame completo
+        box: Bounding box (x, y, w, h) esperada da referência
+        margin: Margem em torno da caixa, como fração do seu tamanho
+        extra_pad: Margem adicional em pixels
+        timings: dict opcional onde os tempos das etapas são acumulados
+        max_objects: Número máximo de objetos (None para todos)
+    
+    Returns:
+        Tupla (bounding box da referência, lista de bounding boxes dos
+        objetos) em coordenadas do frame completo, ou None
+    """
+    height, width = img.shape[:2]
+    x, y, w, h = box
+    pad_x = int(w * margin) + extra_pad
+    pad_y = int(h * margin) + extra_pad
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    
+    contornos, hierarquia = _find_contours(img[y0:y1, x0:x1], timings)
+    if contornos is None:
+        return None
+    
+    detected = _detect_objects(contornos, hierarquia, max_objects=max_objects)
+    if detected is None:
+        return None
+    
+    (xr, yr, wr, hr), objects = detected
+    return (xr + x0, yr + y0, wr, hr), [(xo + x0, yo + y0, wo, ho) for xo, yo, wo, ho in objects]
+
+
+def _boxes_close(box, expected, tolerance, min_shift=2.0):
+    max_shift = max(min_shift, tolerance * expected[2])
+    return all(abs(a - b) <= max_shift for a, b in zip(box, expected))
+
+
+# Margem, em pixels, lida além de cada faixa para que o blur e o Canny
+# vejam a mesma vizinhança que teriam no frame inteiro
+_EDGE_HALO = 8
+
+
+def _paste_edges(gray, edges, origin, rect):
+    """
+    Calcula as bordas de um retângulo do frame e as copia para o mapa edges.
+    
+    Args:
+        gray: Frame completo em tons de cinza
+        edges: Mapa de bordas da região, com origem em origin no frame
+        origin: Canto (x, y) da região no frame
+        rect: Retângulo (x0, y0, x1, y1) em coordenadas da região
+    """
+    ox, oy = origin
+    x0, y0 = max(0, rect[0]), max(0, rect[1])
+    x1, y1 = min(edges.shape[1], rect[2]), min(edges.shape[0], rect[3])
+    if x1 <= x0 or y1 <= y0:
+        return
+    height, width = gray.shape[:2]
+    hx0, hy0 = max(0, ox + x0 - _EDGE_HALO), max(0, oy + y0 - _EDGE_HALO)
+    hx1, hy1 = min(width, ox + x1 + _EDGE_HALO), min(height, oy + y1 + _EDGE_HALO)
+    band = gray[hy0:hy1, hx0:hx1]
+    if band.shape[0] > band.shape[1]:
+        # Faixas altas e estreitas são bem mais rápidas transpostas (blur e
+        # Canny são simétricos, o resultado é o mesmo)
+        band = _edges(np.ascontiguousarray(band.T)).T
+    else:
+        band = _edges(band)
+    bx0, by0 = ox + x0 - hx0, oy + y0 - hy0
+    target = edges[y0:y1, x0:x1]
+    np.maximum(target, band[by0:by0 + y1 - y0, bx0:bx0 + x1 - x0], out=target)
+
+
+def _detect_pyramid(img, max_width, timings=None, max_objects=1):
+    """
+    Localiza referência e objetos numa versão reduzida do frame e refina a
+    detecção em resolução completa só onde há contornos de interesse.
+    
+    As bordas em resolução completa são calculadas apenas numa faixa ao
+    longo do contorno da referência e nas caixas dos objetos candidatos;
+    o interior da referência não é reprocessado. Os contornos finais (e as
+    medidas) continuam vindo de pixels em resolução completa.
+    
+    Returns:
+        Tupla (bounding box da referência, lista de bounding boxes dos
+        objetos) em resolução completa, ou None
+    """
+    scale = img.shape[1] / max_width
+    start = time.perf_counter()
+    # Reduzir em tons de cinza custa bem menos que reduzir o frame colorido
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(
+        gray,
+        (max_width, int(round(img.shape[0] / scale))),
+        interpolation=cv2.INTER_AREA
+    )
+    _add_timing(timings, 'preprocess', time.perf_counter() - start)
+    
+    contornos, hierarquia = _find_contours(small, timings)
+    if contornos is None:
+        return None
+    detected = _detect_objects(
+        contornos, hierarquia, min_area=100 / (scale * scale), max_objects=None
+    )
+    if detected is None:
+        return None
+    
+    start = time.perf_counter()
+    height, width = img.shape[:2]
+    # Erro de posição de uma caixa vinda do frame reduzido, em pixels
+    pad = int(2 * scale) + 4
+    approx_box = [int(round(v * scale)) for v in detected[0]]
+    x, y, w, h = approx_box
+    x0, y0 = max(0, x - pad), max(0, y - pad)
+    x1, y1 = min(width, x + w + pad), min(height, y + h + pad)
+    edges = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    
+    # Faixas sobre as quatro bordas da referência (coordenadas da região)
+    rx0, ry0, rx1, ry1 = x - x0, y - y0, x + w - x0, y + h - y0
+    region_w, region_h = x1 - x0, y1 - y0
+    rects = [
+        (0, 0, region_w, ry0 + pad),
+        (0, ry1 - pad, region_w, region_h),
+        (0, ry0 + pad, rx0 + pad, ry1 - pad),
+        (rx1 - pad, ry0 + pad, region_w, ry1 - pad),
+    ]
+    for ox, oy, ow, oh in detected[1]:
+        bx, by = int(round(ox * scale)) - x0, int(round(oy * scale)) - y0
+        rects.append((bx - pad, by - pad,
+                      bx + int(round(ow * scale)) + pad, by + int(round(oh * scale)) + pad))
+    for rect in rects:
+        _paste_edges(gray, edges, (x0, y0), rect)
+    _add_timing(timings, 'preprocess', time.perf_counter() - start)
+    
+    contornos, hierarquia = _find_contours(None, timings, edges=edges)
+    if contornos is None:
+        return None
+    refined = _detect_objects(contornos, hierarquia, max_objects=max_objects)
+    if refined is None:
+        return None
+    
+    (xr, yr, wr, hr), objects = refined
+    refined_box = (xr + x0, yr + y0, wr, hr)
+    if not _boxes_close(refined_box, approx_box, 0.05, min_shift=2 * scale + 2):
+        return None
+    return refined_box, [(xo + x0, yo + y0, wo, ho) for xo, yo, wo, ho in objects]
+
+
+def detect_frame(img, calibration=None, roi=None, pyramid_max_width=640,
+                 calibration_tolerance=0.02, timings=None, max_objects=1):
+    """
+    Localiza referência e objetos usando o caminho mais barato disponível.
+    
+    Ordem: região calibrada, região (ROI) de um frame anterior, detecção em
+    pirâmide (frame reduzido + refinamento em resolução completa) e, por
+    último, o frame inteiro. As medidas finais sempre vêm de contornos em
+    resolução completa.
+    
+    Args:
+        img: Frame completo
+        calibration: dict de calibração da câmera (opcional)
+        roi: Bounding box da referência num frame anterior (opcional)
+        pyramid_max_width: Largura do frame reduzido (0 desativa a pirâmide)
+        calibration_tolerance: Desvio aceito da referência calibrada
+        timings: dict opcional onde os tempos das etapas são acumulados
+        max_objects: Número máximo de objetos (None para todos)
+    
+    Returns:
+        Tupla (detecção ou None, modo usado); a detecção é (bounding box da
+        referência, lista de bounding boxes dos objetos, do maior ao menor)
+    """
+    frame_size = (img.shape[1], img.shape[0])
+    
+    if calibration is not None:
+        detected = _detect_in_region(
+            img, calibration['reference_box'], margin=0.05, timings=timings,
+            max_objects=max_objects
+        )
+        if detected is not None and reference_matches(
+            calibration, detected[0], frame_size, calibration_tolerance
+        ):
+            return detected, 'calibration'
+    
+    if roi is not None:
+        detected = _detect_in_region(
+            img, roi, margin=0.1, timings=timings, max_objects=max_objects
         )
+        if detected is not None and _boxes_close(detected[0], roi, 0.1):
+            return detected, 'roi'
+    
+    # Pirâmide só compensa em frames bem maiores que o reduzido
+    if pyramid_max_width and img.shape[1] >= 1.5 * pyramid_max_width:
+        detected = _detect_pyramid(img, pyramid_max_width, timings, max_objects)
+        if detected is not None:
+            return detected, 'pyramid'
+    
+    contornos, hierarquia = _find_contours(img, timings)
+    if contornos is None:
+        return None, 'full'
+    return _detect_objects(contornos, hierarquia, max_objects=max_objects), 'full'
+
+
+def process_frame(img, reference_width_cm, calibration=None, roi=None,
+                  pyramid_max_width=640, calibration_tolerance=0.02, max_objects=1):
+    """
+    Processa um frame individual e extrai medidas.
+    
+    Com uma calibração válida, apenas a região da referência é processada e
+    a escala (pixels por cm) vem da calibração; caso contrário a detecção
+    segue detect_frame.
+    Função de módulo para poder ser executada em outro processo.
+    
+    Args:
+        img: Imagem capturada
+        reference_width_cm: Largura real do objeto de referência em cm
+        calibration: dict de calibração da câmera (opcional)
+        roi: Bounding box da referência num frame anterior (opcional)
+        pyramid_max_width: Largura do frame reduzido na detecção em pirâmide
+            (0 desativa)
+        calibration_tolerance: Desvio aceito da referência calibrada, como
+            fração da sua largura
+        max_objects: Número máximo de objetos medidos (None para todos)
         
-        # Medir primeiro objeto
-        obj = objetos_medidos[0]
-        x_obj, y_obj, w_obj, h_obj = cv2.boundingRect(obj)
-        largura_objeto_cm = w_obj / pixels_por_cm
-        comprimento_objeto_cm = h_obj / pixels_por_cm
+    Returns:
+        dict com sucesso, dimensões e caixa do maior objeto, todos os objetos
+        medidos (objects), caixa da referência e tempos das etapas (em
+        segundos, registrados por quem recebe o resultado)
+    """
+    start = time.perf_counter()
+    timings = {}
+    frame_size = (img.shape[1], img.shape[0])
+    detected, detection = detect_frame(
+        img, calibration, roi, pyramid_max_width, calibration_tolerance, timings,
+        max_objects
+    )
+    if detected is None:
+        timings['process_frame'] = time.perf_counter() - start
+        return {'success': False, 'timings': timings}
+    calibrated = detection == 'calibration'
+    
+    reference_box, object_boxes = detected
+    
+    if calibrated:
+        pixels_por_cm = calibration['reference_box'][2] / reference_width_cm
+    else:
+        pixels_por_cm = reference_box[2] / reference_width_cm
+    
+    objects = [
+        {
+            'box': box,
+            'dimensions': {
+                'width': box[2] / pixels_por_cm,
+                'length': box[3] / pixels_por_cm
+            }
+        }
+        for box in object_boxes
+    ]
+    
+    # Apenas geometria: a imagem anotada é gerada sob demanda (render_annotation)
+    return {
+        'success': True,
+        'dimensions': objects[0]['dimensions'],
+        'reference_box': reference_box,
+        'object_box': objects[0]['box'],
+        'objects': objects,
+        'frame_size': frame_size,
+        'calibrated': calibrated,
+        'detection': detection,
+        'timings': dict(timings, process_frame=time.perf_counter() - start)
+    }
+
+
+def record_history(camera_id, result, source, reference_width_cm):
+    """
+    Registra uma análise no histórico de medições (uma linha por objeto nas
+    análises com vários objetos).
+    
+    Falhas do histórico não interrompem a análise; ficam contadas em
+    macrovision_measurement_store_failures_total.
+    """
+    try:
+        store = get_measurement_store()
+        if not result.get('objects'):
+            store.record(
+                camera_id, result, source=source, reference_width_cm=reference_width_cm
+            )
+            return
+        for obj in result['objects']:
+            store.record(
+                camera_id,
+                {'success': True, 'statistics': obj['statistics'], 'images': result['images']},
+                source=source,
+                reference_width_cm=reference_width_cm,
+                object_id=obj['id']
+            )
+    except (OSError, sqlite3.Error):
+        increment('macrovision_measurement_store_failures_total',
+                  'Falhas ao gravar lotes no histórico de medições')
+
+
+def save_image(img, camera_id, async_upload=True, s3_service=None, prefix='analysis',
+               content_key=None):
+    """
+    Codifica uma imagem e sua miniatura (ver ImageEncoder) e envia ao S3.
+    
+    O nome do arquivo traz data/hora (com milissegundos) e câmera, então as
+    chaves de um dia seguem a ordem de captura. A miniatura vai para a chave
+    previsível de thumbnail_key, ao lado da imagem completa.
+    
+    Args:
+        img: Imagem (já anotada); não deve ser alterada depois da chamada
+        camera_id: Câmera de origem, incluída no nome do arquivo
+        async_upload: Se True, a codificação e o upload são feitos em
+            segundo plano e a imagem volta com status 'encoding'
+            (consultar /api/uploads/<upload_id>)
+        s3_service: Instância de S3Service para o upload síncrono
+        prefix: Prefixo do nome do arquivo
+        content_key: Identificação do conteúdo (alfanumérica), para quem
+            reenvia a mesma imagem (por exemplo, ImageEncoder.content_key
+            de um arquivo já analisado). Vai no fim do nome do arquivo; se
+            uma imagem do dia já tem a mesma identificação, ela é devolvida
+            e nada é codificado nem enviado
         
+    Returns:
+        dict com url, s3_key, filename, thumbnail_url e thumbnail_key (e
+        upload_id, thumbnail_upload_id e status no upload em segundo plano),
+        ou None se o upload síncrono falhar
+    """
+    encoder = get_image_encoder()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
+    # Milissegundos e câmera no nome: análises seguidas ou simultâneas
+    # não sobrescrevem a mesma chave
+    stem = f'{prefix}_{timestamp}_cam{camera_id}'
+    if content_key is not None:
+        if not str(content_key).isalnum():
+            raise ValueError(f'Identificação de conteúdo inválida: {content_key}')
+        stem = f'{stem}_{content_key}'
+    filename = encoder.filename(stem)
+    
+    if content_key is not None:
+        s3_service = s3_service or S3Service()
+        stored = _find_stored(s3_service, f'_{content_key}{encoder.extension}')
+        if stored is not None:
+            increment('macrovision_upload_deduplicated_total',
+                      'Imagens já armazenadas que não foram enviadas de novo')
+            return stored
+    
+    if async_upload:
+        # Reserva as chaves (URLs definitivas já conhecidas) e codifica fora
+        # da thread da requisição
+        with timed('upload_enqueue'):
+            upload_queue = get_upload_queue()
+            upload = upload_queue.reserve(filename)
+            thumb_key = encoder.thumbnail_key(upload['s3_key'])
+            thumb = upload_queue.reserve(filename, thumb_key) if thumb_key else None
+            try:
+                encoder.submit(_encode_and_enqueue, encoder, upload_queue, img, upload, thumb)
+            except Exception as e:
+                for reserved in (upload, thumb):
+                    if reserved is not None:
+                        upload_queue.fail(reserved['upload_id'], f'Erro ao preparar imagem: {str(e)}')
+                raise
+        return {
+            'url': upload['url'],
+            's3_key': upload['s3_key'],
+            'filename': filename,
+            'upload_id': upload['upload_id'],
+            'status': upload['status'],
+            'thumbnail_url': thumb['url'] if thumb else None,
+            'thumbnail_key': thumb_key,
+            'thumbnail_upload_id': thumb['upload_id'] if thumb else None
+        }
+    
+    s3_service = s3_service or S3Service()
+    upload_result = s3_service.upload_image_data(
+        encoder.encode_image(img), filename, content_type=encoder.content_type
+    )
+    if not upload_result['success']:
+        return None
+    thumb_key = encoder.thumbnail_key(upload_result['s3_key'])
+    if thumb_key:
+        thumb_result = s3_service.upload_image_data(
+            encoder.encode_thumbnail(img), filename, s3_key=thumb_key,
+            content_type=encoder.content_type
+        )
+        if not thumb_result['success']:
+            thumb_key = None
+    return {
+        'url': upload_result['url'],
+        's3_key': upload_result['s3_key'],
+        'filename': filename,
+        'thumbnail_url': s3_service.build_url(thumb_key) if thumb_key else None,
+        'thumbnail_key': thumb_key
+    }
+
+
+def _find_stored(s3_service, suffix):
+    # Imagem do dia cujo nome termina em suffix, pelo índice em memória
+    # (sem consultar o bucket objeto a objeto)
+    index = get_image_index()
+    if index.bucket_name != s3_service.bucket_name:
+        return None
+    for entry in index.iter_entries(prefix=s3_service.build_key('')):
+        key = entry['key']
+        if key.endswith(suffix) and not is_thumbnail_key(key):
+            thumb_key = thumbnail_key(key)
+            if index.get(thumb_key) is None:
+                thumb_key = None
+            return {
+                'url': s3_service.build_url(key),
+                's3_key': key,
+                'filename': key.rpartition('/')[2],
+                'status': 'completed',
+                'thumbnail_url': s3_service.build_url(thumb_key) if thumb_key else None,
+                'thumbnail_key': thumb_key
+            }
+    return None
+
+
+def _encode_and_enqueue(encoder, upload_queue, img, upload, thumb):
+    # Executado numa thread do ImageEncoder
+    for reserved, encode in ((upload, encoder.encode_image), (thumb, encoder.encode_thumbnail)):
+        if reserved is None:
+            continue
+        # Qualquer erro marca o upload como falho; do contrário ele ficaria
+        # em 'encoding' para sempre
+        try:
+            data = encode(img)
+            upload_queue.submit(
+                data, reserved['filename'], encoder.content_type,
+                upload_id=reserved['upload_id'], s3_key=reserved['s3_key']
+            )
+        except Exception as e:
+            upload_queue.fail(reserved['upload_id'], f'Erro ao preparar imagem: {str(e)}')
+
+
+def render_annotation(img, result, object_ids=None):
+    """
+    Desenha a referência e os objetos medidos sobre uma cópia do frame.
+    
+    Args:
+        img: Frame original
+        result: Resultado de process_frame para esse frame
+        object_ids: Identificação de cada objeto de result['objects'],
+            incluída no rótulo (opcional)
+        
+    Returns:
+        Imagem anotada
+    """
+    x_ref, y_ref, w_ref, h_ref = result['reference_box']
+    
+    # Criar imagem anotada
+    img_resultado = img.copy()
+    cv2.rectangle(
+        img_resultado, 
+        (x_ref, y_ref), 
+        (x_ref + w_ref, y_ref + h_ref), 
+        (0, 255, 0), 2
+    )
+    cv2.putText(
+        img_resultado, 
+        "Referencia", 
+        (x_ref, y_ref - 10),
+        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2
+    )
+    
+    for i, obj in enumerate(result['objects']):
+        x_obj, y_obj, w_obj, h_obj = obj['box']
+        label = f"{obj['dimensions']['width']:.2f}x{obj['dimensions']['length']:.2f} cm"
+        if object_ids is not None and object_ids[i] is not None:
+            label = f"#{object_ids[i]} {label}"
         cv2.rectangle(
             img_resultado,
             (x_obj, y_obj),
@@ -206,16 +941,9 @@ class MeasurementService:
         )
         cv2.putText(
             img_resultado,
-            f"{largura_objeto_cm:.2f}x{comprimento_objeto_cm:.2f} cm",
+            label,
             (x_obj, y_obj - 10),
             cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2
         )
-        
-        return {
-            'success': True,
-            'dimensions': {
-                'width': largura_objeto_cm,
-                'length': comprimento_objeto_cm
-            },
-            'annotated_image': img_resultado
-        }
\ No newline at end of file
+    
+    return img_resultado
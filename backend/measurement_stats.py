@@ -0,0 +1,306 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+
+class RunningStats:
+    def __init__(self):
+        """Média e variância acumuladas em uma passada (algoritmo de Welford)."""
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, value):
+        """Acrescenta uma amostra."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """Variância amostral (0 com menos de duas amostras)."""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        """Desvio padrão amostral."""
+        return math.sqrt(self.variance)
+
+    def ci_half_width(self, z):
+        """Meia largura do intervalo de confiança da média."""
+        if self.count < 2:
+            return math.inf
+        return z * self.std / math.sqrt(self.count)
+
+
+class MeasurementAccumulator:
+    def __init__(self, adaptive=False, tolerance_cm=0.05, confidence=0.95,
+                 min_frames=3, outlier_sigma=3.0):
+        """
+        Acumula as dimensões medidas frame a frame.
+
+        No modo adaptativo, frames discrepantes são descartados e a captura
+        pode parar assim que o intervalo de confiança de largura e comprimento
+        ficar abaixo da tolerância.
+
+        Args:
+            adaptive: Ativa rejeição de outliers e parada antecipada
+            tolerance_cm: Meia largura máxima do intervalo de confiança (cm)
+            confidence: Nível de confiança do intervalo
+            min_frames: Frames aceitos antes de avaliar convergência e outliers
+            outlier_sigma: Distância máxima (em desvios padrão) até a média
+        """
+        self.adaptive = adaptive
+        self.tolerance_cm = tolerance_cm
+        self.confidence = confidence
+        self.min_frames = min_frames
+        self.outlier_sigma = outlier_sigma
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.width = RunningStats()
+        self.length = RunningStats()
+        self.rejected = 0
+
+    @property
+    def count(self):
+        """Número de frames aceitos."""
+        return self.width.count
+
+    def _is_outlier(self, stats, value):
+        if stats.count < self.min_frames:
+            return False
+        # O piso evita rejeitar tudo quando as primeiras medidas são idênticas
+        spread = max(stats.std, self.tolerance_cm)
+        return abs(value - stats.mean) > self.outlier_sigma * spread
+
+    def add(self, dimensions):
+        """
+        Registra as dimensões de um frame.
+
+        Returns:
+            True se o frame foi aceito
+        """
+        width, length = dimensions['width'], dimensions['length']
+        if self.adaptive and (
+            self._is_outlier(self.width, width) or self._is_outlier(self.length, length)
+        ):
+            self.rejected += 1
+            return False
+
+        self.width.push(width)
+        self.length.push(length)
+        return True
+
+    def is_converged(self):
+        """Indica se a precisão desejada já foi atingida."""
+        if not self.adaptive or self.count < self.min_frames:
+            return False
+        return (
+            self.width.ci_half_width(self.z) <= self.tolerance_cm
+            and self.length.ci_half_width(self.z) <= self.tolerance_cm
+        )
+
+    def summary(self):
+        """
+        Resume as estatísticas acumuladas.
+
+        Returns:
+            dict com média, desvio padrão e intervalo de confiança por dimensão,
+            frames usados e rejeitados
+        """
+        def describe(stats):
+            ci = stats.ci_half_width(self.z)
+            return {
+                'mean': round(stats.mean, 4),
+                'std': round(stats.std, 4),
+                'ci': round(ci, 4) if math.isfinite(ci) else None
+            }
+
+        return {
+            'adaptive': self.adaptive,
+            'confidence': self.confidence,
+            'width': describe(self.width),
+            'length': describe(self.length),
+            'frames_used': self.count,
+            'frames_rejected': self.rejected,
+            'converged': self.is_converged()
+        }
+
+
+class _Track:
+    def __init__(self, track_id, center, size, accumulator):
+        self.id = track_id
+        self.center = center
+        self.size = size
+        self.seen = 0
+        self.accumulator = accumulator
+
+
+class ObjectTracker:
+    def __init__(self, max_distance=0.5, min_presence=0.5, **accumulator_options):
+        """
+        Mantém a identidade de vários objetos entre frames e acumula as
+        medidas de cada um.
+
+        As posições são normalizadas pela caixa da referência (origem no seu
+        canto, unidade na sua largura), então pequenos deslocamentos da
+        câmera ou do suporte não trocam as identidades. Cada objeto do frame é
+        associado à trilha mais próxima (menores distâncias primeiro); um
+        objeto sem trilha próxima abre uma nova. No primeiro frame, as
+        identidades seguem a ordem de leitura (linhas de cima para baixo,
+        da esquerda para a direita).
+
+        Args:
+            max_distance: Distância máxima entre um objeto e uma trilha, como
+                fração do maior lado do objeto
+            min_presence: Fração mínima dos frames em que um objeto precisa
+                aparecer para constar do resumo (descarta detecções espúrias)
+            **accumulator_options: Argumentos do MeasurementAccumulator de
+                cada objeto
+        """
+        self.max_distance = max_distance
+        self.min_presence = min_presence
+        self.accumulator_options = accumulator_options
+        self.frames = 0
+        self._tracks = []
+
+    def update(self, reference_box, objects):
+        """
+        Associa os objetos de um frame às trilhas e registra suas medidas.
+
+        Args:
+            reference_box: Bounding box da referência no frame
+            objects: Lista de dicts com box e dimensions (process_frame)
+
+        Returns:
+            Lista, na ordem de objects, de tuplas (id do objeto, True se a
+            medida foi aceita)
+        """
+        self.frames += 1
+        if not objects:
+            return []
+        x_ref, y_ref, w_ref, _ = reference_box
+        boxes = np.array([obj['box'] for obj in objects], dtype=np.float64)
+        centers = np.column_stack((
+            (boxes[:, 0] + boxes[:, 2] / 2 - x_ref) / w_ref,
+            (boxes[:, 1] + boxes[:, 3] / 2 - y_ref) / w_ref
+        ))
+        sizes = boxes[:, 2:].max(axis=1) / w_ref
+
+        assigned = [None] * len(objects)
+        if self._tracks:
+            track_centers = np.array([t.center for t in self._tracks])
+            distances = np.linalg.norm(centers[:, None, :] - track_centers[None, :, :], axis=2)
+            used = set()
+            for flat in np.argsort(distances, axis=None):
+                i, j = divmod(int(flat), len(self._tracks))
+                if assigned[i] is not None or j in used:
+                    continue
+                if distances[i, j] > self.max_distance * sizes[i]:
+                    continue
+                assigned[i] = self._tracks[j]
+                used.add(j)
+
+        new = [i for i, track in enumerate(assigned) if track is None]
+        if new:
+            # Ordem de leitura: faixas da altura típica dos objetos
+            band = float(np.median(boxes[new, 3])) / w_ref or 1.0
+            new.sort(key=lambda i: (round(centers[i, 1] / band), centers[i, 0]))
+            for i in new:
+                track = _Track(
+                    len(self._tracks) + 1, centers[i], sizes[i],
+                    MeasurementAccumulator(**self.accumulator_options)
+                )
+                self._tracks.append(track)
+                assigned[i] = track
+
+        matches = []
+        for i, (obj, track) in enumerate(zip(objects, assigned)):
+            track.seen += 1
+            # Posição suavizada: acompanha deslocamentos lentos da peça
+            track.center = track.center + (centers[i] - track.center) / min(track.seen, 10)
+            matches.append((track.id, track.accumulator.add(obj['dimensions'])))
+        return matches
+
+    def _present(self):
+        return [
+            t for t in self._tracks
+            if t.accumulator.count and t.seen >= self.min_presence * self.frames
+        ]
+
+    def accumulator(self, track_id):
+        """Retorna o MeasurementAccumulator de um objeto."""
+        return self._tracks[track_id - 1].accumulator
+
+    def is_converged(self):
+        """Indica se todos os objetos presentes atingiram a precisão desejada."""
+        tracks = self._present()
+        return bool(tracks) and all(t.accumulator.is_converged() for t in tracks)
+
+    def summary(self):
+        """
+        Resume as medidas de cada objeto presente.
+
+        Returns:
+            Lista ordenada por id de dicts com id, posição (relativa à
+            referência), medidas, estatísticas e frames em que apareceu
+        """
+        objects = []
+        for track in self._present():
+            statistics = track.accumulator.summary()
+            objects.append({
+                'id': track.id,
+                'position': {
+                    'x': round(float(track.center[0]), 3),
+                    'y': round(float(track.center[1]), 3)
+                },
+                'measurements': {
+                    'width': round(statistics['width']['mean'], 2),
+                    'length': round(statistics['length']['mean'], 2),
+                    'height': round(statistics['length']['mean'], 2)
+                },
+                'statistics': statistics,
+                'frames_seen': track.seen
+            })
+        return objects
+
+
+def fuse_estimates(summaries, min_std=0.01):
+    """
+    Combina medições independentes da mesma peça (por exemplo, de câmeras
+    diferentes) pela média ponderada pelo inverso da variância.
+
+    Args:
+        summaries: Lista de MeasurementAccumulator.summary()
+        min_std: Piso do desvio padrão (cm), para que fontes com uma única
+            amostra ou medidas idênticas não recebam peso infinito
+
+    Returns:
+        dict com width e length ({mean, stderr, spread}) e número de fontes,
+        ou None se não houver medições
+    """
+    summaries = [s for s in summaries if s['frames_used'] > 0]
+    if not summaries:
+        return None
+
+    def fuse(dimension):
+        means = [s[dimension]['mean'] for s in summaries]
+        weights = [
+            s['frames_used'] / max(s[dimension]['std'], min_std) ** 2
+            for s in summaries
+        ]
+        total = sum(weights)
+        return {
+            'mean': round(sum(w * m for w, m in zip(weights, means)) / total, 4),
+            'stderr': round(math.sqrt(1 / total), 4),
+            # Diferença entre fontes; muito maior que stderr indica câmera descalibrada
+            'spread': round(max(means) - min(means), 4)
+        }
+
+    return {
+        'method': 'inverse_variance',
+        'sources': len(summaries),
+        'width': fuse('width'),
+        'length': fuse('length')
+    }
@@ -0,0 +1,452 @@
+import atexit
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from metrics import increment, timed
+
+DEFAULT_DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'measurements.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    camera_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    width REAL NOT NULL,
+    length REAL NOT NULL,
+    width_std REAL,
+    length_std REAL,
+    frames INTEGER,
+    reference_width REAL,
+    source TEXT NOT NULL,
+    s3_key TEXT,
+    object_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_measurements_created_at ON measurements (created_at);
+-- Índices de cobertura: as contagens por período leem só o índice, já
+-- ordenado por dia quando não há filtro de câmera
+CREATE INDEX IF NOT EXISTS idx_measurements_camera_created_at
+    ON measurements (camera_id, created_at, day, width, length);
+CREATE INDEX IF NOT EXISTS idx_measurements_day
+    ON measurements (day, created_at, camera_id, width, length);
+
+-- Somatórios diários por câmera, atualizados junto com cada lote de
+-- inserções: relatórios diários não percorrem as medições
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day TEXT NOT NULL,
+    camera_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum_width REAL NOT NULL,
+    sum_length REAL NOT NULL,
+    sumsq_width REAL NOT NULL,
+    sumsq_length REAL NOT NULL,
+    min_width REAL NOT NULL,
+    max_width REAL NOT NULL,
+    min_length REAL NOT NULL,
+    max_length REAL NOT NULL,
+    PRIMARY KEY (day, camera_id)
+) WITHOUT ROWID;
+
+-- Histograma diário por câmera e dimensão (classes de HISTOGRAM_RESOLUTION
+-- cm), usado nos percentis
+CREATE TABLE IF NOT EXISTS daily_histogram (
+    day TEXT NOT NULL,
+    camera_id INTEGER NOT NULL,
+    dimension TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, camera_id, dimension, bin)
+) WITHOUT ROWID;
+"""
+
+_INSERT = """
+INSERT INTO measurements (camera_id, created_at, day, width, length, width_std,
+                          length_std, frames, reference_width, source, s3_key,
+                          object_id)
+VALUES (:camera_id, :created_at, :day, :width, :length, :width_std,
+        :length_std, :frames, :reference_width, :source, :s3_key, :object_id)
+"""
+
+_UPSERT_DAILY = """
+INSERT INTO daily_stats VALUES (?, ?, 1, ?, ?, ? * ?, ? * ?, ?, ?, ?, ?)
+ON CONFLICT (day, camera_id) DO UPDATE SET
+    count = count + 1,
+    sum_width = sum_width + excluded.sum_width,
+    sum_length = sum_length + excluded.sum_length,
+    sumsq_width = sumsq_width + excluded.sumsq_width,
+    sumsq_length = sumsq_length + excluded.sumsq_length,
+    min_width = min(min_width, excluded.min_width),
+    max_width = max(max_width, excluded.max_width),
+    min_length = min(min_length, excluded.min_length),
+    max_length = max(max_length, excluded.max_length)
+"""
+
+_UPSERT_HISTOGRAM = """
+INSERT INTO daily_histogram VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (day, camera_id, dimension, bin) DO UPDATE SET
+    count = count + excluded.count
+"""
+
+DIMENSIONS = ('width', 'length')
+
+# Largura (cm) das classes do histograma diário
+HISTOGRAM_RESOLUTION = 0.01
+
+
+def _day(timestamp):
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+def _day_where(camera_id=None, start=None, end=None):
+    clauses, params = [], []
+    if camera_id is not None:
+        clauses.append('camera_id = ?')
+        params.append(camera_id)
+    if start is not None:
+        clauses.append('day >= ?')
+        params.append(_day(start))
+    if end is not None:
+        clauses.append('day <= ?')
+        params.append(_day(end))
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def _where(camera_id=None, start=None, end=None, by_day=False):
+    clauses, params = [], []
+    if camera_id is not None:
+        clauses.append('camera_id = ?')
+        params.append(camera_id)
+    if start is not None:
+        clauses.append('created_at >= ?')
+        params.append(start)
+        if by_day:
+            # Redundante, mas permite percorrer idx_measurements_day
+            clauses.append('day >= ?')
+            params.append(_day(start))
+    if end is not None:
+        clauses.append('created_at <= ?')
+        params.append(end)
+        if by_day:
+            clauses.append('day <= ?')
+            params.append(_day(end))
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+class MeasurementStore:
+    def __init__(self, path=DEFAULT_DB_FILE, batch_size=100, flush_interval=1.0):
+        """
+        Histórico de medições em SQLite local.
+
+        As medições entram numa fila em memória e são gravadas em lotes (uma
+        transação por lote) por uma thread própria, então registrar uma
+        análise não espera pelo disco. As consultas gravam antes o que estiver
+        pendente, de modo que sempre enxergam todas as medições registradas.
+
+        Args:
+            path: Arquivo do banco (':memory:' não é suportado, pois cada
+                thread usa a própria conexão)
+            batch_size: Medições pendentes que disparam a gravação imediata
+            flush_interval: Atraso máximo (s) até uma medição ser gravada
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._thread = None
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(measurements)')}
+        if 'object_id' not in columns:
+            # Bancos criados antes da medição de vários objetos
+            conn.execute('ALTER TABLE measurements ADD COLUMN object_id INTEGER')
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.row_factory = sqlite3.Row
+            # WAL: leituras não bloqueiam a gravação dos lotes (e vice-versa)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _start(self):
+        # Deve ser chamado com self._cond adquirido
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='measurement-store', daemon=True
+            )
+            self._thread.start()
+
+    def record(self, camera_id, result, source='analysis', reference_width_cm=None,
+               created_at=None, object_id=None):
+        """
+        Agenda o registro de uma análise bem-sucedida.
+
+        Args:
+            camera_id: Câmera de origem
+            result: dict de MeasurementService.perform_analysis (ou no mesmo
+                formato) com success, statistics e images
+            source: Origem da medição ('analysis', 'live', ...)
+            reference_width_cm: Largura da referência usada na análise
+            created_at: Timestamp da medição (padrão: agora)
+            object_id: Identificação do objeto, nas análises com vários objetos
+
+        Returns:
+            True se a medição foi agendada (análises sem sucesso são ignoradas)
+        """
+        if not result.get('success'):
+            return False
+        statistics = result['statistics']
+        images = result.get('images') or []
+        created_at = created_at if created_at is not None else time.time()
+        row = {
+            'camera_id': camera_id,
+            'created_at': created_at,
+            'day': _day(created_at),
+            'width': statistics['width']['mean'],
+            'length': statistics['length']['mean'],
+            'width_std': statistics['width']['std'],
+            'length_std': statistics['length']['std'],
+            'frames': statistics['frames_used'],
+            'reference_width': reference_width_cm,
+            'source': source,
+            's3_key': images[0]['s3_key'] if images else None,
+            'object_id': object_id
+        }
+        with self._cond:
+            self._pending.append(row)
+            self._start()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                increment('macrovision_measurement_store_failures_total',
+                          'Falhas ao gravar lotes no histórico de medições')
+                time.sleep(self.flush_interval)
+
+    def flush(self):
+        """Grava imediatamente as medições pendentes (em uma transação)."""
+        with self._write_lock:
+            with self._cond:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            conn = self._connection()
+            try:
+                with timed('history_write'), conn:
+                    conn.executemany(_INSERT, rows)
+                    conn.executemany(_UPSERT_DAILY, [
+                        (r['day'], r['camera_id'], r['width'], r['length'],
+                         r['width'], r['width'], r['length'], r['length'],
+                         r['width'], r['width'], r['length'], r['length'])
+                        for r in rows
+                    ])
+                    histogram = Counter(
+                        (r['day'], r['camera_id'], dimension,
+                         round(r[dimension] / HISTOGRAM_RESOLUTION))
+                        for r in rows for dimension in DIMENSIONS
+                    )
+                    conn.executemany(_UPSERT_HISTOGRAM, [
+                        key + (count,) for key, count in histogram.items()
+                    ])
+            except sqlite3.Error:
+                # Devolve o lote à fila para a próxima tentativa
+                with self._cond:
+                    self._pending[:0] = rows
+                raise
+            return len(rows)
+
+    def _query(self, sql, params=()):
+        self.flush()
+        return self._connection().execute(sql, params).fetchall()
+
+    def list(self, camera_id=None, start=None, end=None, limit=100, offset=0):
+        """
+        Lista medições, das mais recentes para as mais antigas.
+
+        Args:
+            camera_id: Filtra por câmera (opcional)
+            start, end: Intervalo (timestamps, inclusivo)
+            limit, offset: Paginação
+
+        Returns:
+            dict com total e itens
+        """
+        where, params = _where(camera_id, start, end)
+        total = self._query(f'SELECT COUNT(*) FROM measurements{where}', params)[0][0]
+        rows = self._query(
+            f'SELECT * FROM measurements{where} ORDER BY created_at DESC LIMIT ? OFFSET ?',
+            params + [limit, offset]
+        )
+        return {'total': total, 'items': [dict(row) for row in rows]}
+
+    def daily(self, camera_id=None, start=None, end=None):
+        """
+        Médias diárias (dias em UTC), a partir dos somatórios diários.
+
+        Args:
+            camera_id: Filtra por câmera (opcional; sem filtro, soma todas)
+            start, end: Intervalo (timestamps); os dias são incluídos inteiros
+
+        Returns:
+            Lista de dicts por dia com count e, por dimensão, mean, std, min e max
+        """
+        where, params = _day_where(camera_id, start, end)
+        rows = self._query(
+            'SELECT day, SUM(count) AS count, '
+            'SUM(sum_width) AS sum_width, SUM(sum_length) AS sum_length, '
+            'SUM(sumsq_width) AS sumsq_width, SUM(sumsq_length) AS sumsq_length, '
+            'MIN(min_width) AS min_width, MAX(max_width) AS max_width, '
+            'MIN(min_length) AS min_length, MAX(max_length) AS max_length '
+            f'FROM daily_stats{where} GROUP BY day ORDER BY day',
+            params
+        )
+
+        def describe(row, dimension):
+            count = row['count']
+            mean = row[f'sum_{dimension}'] / count
+            variance = (row[f'sumsq_{dimension}'] - count * mean * mean) / (count - 1) \
+                if count > 1 else 0.0
+            return {
+                'mean': round(mean, 4),
+                'std': round(math.sqrt(max(variance, 0.0)), 4),
+                'min': round(row[f'min_{dimension}'], 4),
+                'max': round(row[f'max_{dimension}'], 4)
+            }
+
+        return [
+            {
+                'day': row['day'],
+                'count': row['count'],
+                'width': describe(row, 'width'),
+                'length': describe(row, 'length')
+            }
+            for row in rows
+        ]
+
+    def percentiles(self, camera_id=None, start=None, end=None,
+                    percentiles=(50, 90, 95, 99)):
+        """
+        Percentis (método do posto mais próximo) das medidas no período.
+
+        Calculados a partir dos histogramas diários, sem percorrer as
+        medições: os dias do intervalo são incluídos inteiros e os valores
+        têm a resolução das classes (HISTOGRAM_RESOLUTION).
+
+        Returns:
+            dict com count e, por dimensão, {percentil: valor}
+        """
+        where, params = _day_where(camera_id, start, end)
+        rows = self._query(
+            f'SELECT dimension, bin, SUM(count) AS count FROM daily_histogram{where} '
+            'GROUP BY dimension, bin ORDER BY dimension, bin',
+            params
+        )
+        histograms = {dimension: [] for dimension in DIMENSIONS}
+        for row in rows:
+            histograms[row['dimension']].append((row['bin'], row['count']))
+
+        total = sum(count for _, count in histograms['width'])
+        result = {'count': total}
+        for dimension, histogram in histograms.items():
+            values = {}
+            cumulative = 0
+            bins = iter(histogram)
+            for p in sorted(percentiles):
+                rank = max(1, math.ceil(p / 100 * total))
+                while cumulative < rank and total:
+                    value, count = next(bins)
+                    cumulative += count
+                values[p] = round(value * HISTOGRAM_RESOLUTION, 4) if total else None
+            result[dimension] = {f'{p:g}': values[p] for p in percentiles}
+        return result
+
+    def out_of_tolerance(self, width=None, length=None, tolerance=0.1,
+                         camera_id=None, start=None, end=None):
+        """
+        Conta medições fora da tolerância em relação às medidas nominais.
+
+        Args:
+            width, length: Medidas nominais (cm); dimensões sem valor não
+                são verificadas
+            tolerance: Desvio aceito (cm) em torno da medida nominal
+            camera_id, start, end: Filtros
+
+        Returns:
+            dict com totais, taxa e contagem por dia
+        """
+        conditions, condition_params = [], []
+        for column, nominal in (('width', width), ('length', length)):
+            if nominal is not None:
+                conditions.append(f'ABS({column} - ?) > ?')
+                condition_params += [nominal, tolerance]
+        out = ' OR '.join(conditions) if conditions else '0'
+
+        where, params = _where(camera_id, start, end, by_day=True)
+        rows = self._query(
+            f'SELECT day, COUNT(*) AS count, SUM({out}) AS out_of_tolerance '
+            f'FROM measurements{where} GROUP BY day ORDER BY day',
+            condition_params + params
+        )
+        total = sum(row['count'] for row in rows)
+        out_total = sum(row['out_of_tolerance'] or 0 for row in rows)
+        return {
+            'nominal': {'width': width, 'length': length},
+            'tolerance': tolerance,
+            'count': total,
+            'out_of_tolerance': out_total,
+            'rate': round(out_total / total, 4) if total else None,
+            'daily': [
+                {
+                    'day': row['day'],
+                    'count': row['count'],
+                    'out_of_tolerance': row['out_of_tolerance'] or 0
+                }
+                for row in rows
+            ]
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_measurement_store():
+    """
+    Retorna o histórico de medições compartilhado pelo processo.
+
+    Configurável pelas variáveis MEASUREMENTS_DB, MEASUREMENTS_BATCH_SIZE e
+    MEASUREMENTS_FLUSH_INTERVAL.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MeasurementStore(
+                os.getenv('MEASUREMENTS_DB', DEFAULT_DB_FILE),
+                batch_size=int(os.getenv('MEASUREMENTS_BATCH_SIZE', 100)),
+                flush_interval=float(os.getenv('MEASUREMENTS_FLUSH_INTERVAL', 1.0))
+            )
+            # Grava o que estiver pendente ao encerrar o processo
+            atexit.register(_store.flush)
+        return _store
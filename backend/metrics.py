@@ -0,0 +1,214 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites (s) dos histogramas de latência, de 0,5 ms a 10 s
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+STAGE_METRIC = 'macrovision_stage_duration_seconds'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, description):
+        """Contador monotônico, separado por rótulos."""
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} counter'
+        ]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        """Histograma cumulativo de latências, separado por rótulos."""
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} histogram'
+        ]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(
+                        f"{self.name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} "
+                        f'{cumulative}'
+                    )
+                lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+                lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+                lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Métricas do processo, exportadas no formato texto do Prometheus."""
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, description, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description, **kwargs)
+            return metric
+
+    def counter(self, name, description):
+        """Retorna (criando se necessário) um contador."""
+        return self._get_or_create(Counter, name, description)
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        """Retorna (criando se necessário) um histograma."""
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def render(self):
+        """Todas as métricas no formato de exposição texto do Prometheus."""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry():
+    """Retorna o registro de métricas compartilhado pelo processo."""
+    return _registry
+
+
+class TimingBreakdown:
+    def __init__(self):
+        """Tempos por etapa acumulados durante uma requisição."""
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def summary(self):
+        """
+        Returns:
+            dict etapa -> {count, total_ms, max_ms}
+        """
+        with self._lock:
+            return {
+                stage: {
+                    'count': count,
+                    'total_ms': round(total * 1000, 3),
+                    'max_ms': round(longest * 1000, 3)
+                }
+                for stage, (count, total, longest) in self._stages.items()
+            }
+
+
+_breakdown = contextvars.ContextVar('timing_breakdown', default=None)
+
+
+def observe_stage(stage, seconds):
+    """
+    Registra a duração de uma etapa no histograma global e, se houver, no
+    detalhamento da requisição atual.
+    """
+    _registry.histogram(
+        STAGE_METRIC, 'Duração das etapas do pipeline em segundos'
+    ).observe(seconds, stage=stage)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    """Mede o bloco como uma etapa (ver observe_stage)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_timings():
+    """
+    Acumula as etapas medidas na thread atual enquanto o bloco executa.
+
+    Etapas executadas em workers (threads ou processos) não entram
+    automaticamente; quem recebe o resultado deve registrá-las com
+    observe_stage.
+
+    Yields:
+        TimingBreakdown da requisição
+    """
+    breakdown = TimingBreakdown()
+    token = _breakdown.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _breakdown.reset(token)
+
+
+def increment(name, description, amount=1, **labels):
+    """Incrementa um contador do registro global."""
+    _registry.counter(name, description).inc(amount, **labels)
@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis_scheduler import CameraBusyError, scheduled_analysis
+from measurement_stats import fuse_estimates
+
+
+def _analyze_camera(camera, options, save_to_s3, async_upload, include_timings):
+    try:
+        result = scheduled_analysis(
+            camera['camera_id'],
+            save_to_s3=save_to_s3,
+            async_upload=async_upload,
+            include_timings=include_timings,
+            reference_width_cm=camera.get('reference_width', 10.0),
+            **options
+        )
+    except CameraBusyError as e:
+        result = {
+            'success': False,
+            'message': str(e),
+            'measurements': None,
+            'images': [],
+            'busy': True,
+            'retry_after': e.retry_after
+        }
+    except Exception as e:
+        result = {
+            'success': False,
+            'message': f'Erro durante análise: {str(e)}',
+            'measurements': None,
+            'images': []
+        }
+    return dict(result, camera_id=camera['camera_id'])
+
+
+def analyze_cameras(cameras, save_to_s3=True, async_upload=True,
+                    include_timings=False, **options):
+    """
+    Analisa a mesma peça com várias câmeras ao mesmo tempo.
+
+    Cada câmera é capturada em sua própria thread; o processamento dos
+    frames divide os pools compartilhados do FrameProcessingEngine, então o
+    tempo total fica próximo ao da câmera mais lenta. As análises passam pelo
+    agendador: uma câmera ocupada (fila cheia) aparece com busy e retry_after.
+
+    Args:
+        cameras: Lista de dicts com camera_id e reference_width (opcional)
+        save_to_s3: Se True, salva a imagem de cada câmera no S3
+        async_upload: Se True, os uploads são feitos em segundo plano
+        include_timings: Se True, inclui os tempos por etapa de cada câmera
+        **options: Demais argumentos de MeasurementService, comuns a todas
+            as câmeras
+
+    Returns:
+        dict com o resultado de cada câmera e a estimativa combinada
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(
+        max_workers=max(1, len(cameras)), thread_name_prefix='camera-analysis'
+    ) as executor:
+        results = list(executor.map(
+            lambda camera: _analyze_camera(
+                camera, options, save_to_s3, async_upload, include_timings
+            ),
+            cameras
+        ))
+    wall_time_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    succeeded = [r for r in results if r['success']]
+    fused = fuse_estimates([r['statistics'] for r in succeeded])
+    if fused is None:
+        return {
+            'success': False,
+            'message': 'Nenhuma câmera obteve medições válidas',
+            'measurements': None,
+            'fused': None,
+            'cameras': results,
+            'wall_time_ms': wall_time_ms
+        }
+
+    return {
+        'success': True,
+        'message': f'Análise concluída com {len(succeeded)} de {len(results)} câmeras',
+        'measurements': {
+            'width': round(fused['width']['mean'], 2),
+            'length': round(fused['length']['mean'], 2),
+            'height': round(fused['length']['mean'], 2)
+        },
+        'fused': fused,
+        'cameras': results,
+        'wall_time_ms': wall_time_ms
+    }
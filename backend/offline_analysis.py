@@ -0,0 +1,326 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+import time
+
+import cv2
+
+from measurement_service import process_frame
+from measurement_stats import MeasurementAccumulator
+from processing_engine import FrameProcessingEngine
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.m4v', '.wmv', '.mpg', '.mpeg'}
+
+RESULT_FIELDS = (
+    'source', 'frame', 'time_s', 'success', 'width_cm', 'length_cm',
+    'detection', 'message'
+)
+
+
+def collect_sources(paths):
+    """
+    Expande arquivos e diretórios (recursivamente) em imagens e vídeos.
+
+    Args:
+        paths: Lista de caminhos
+
+    Returns:
+        Lista ordenada de arquivos com extensão de imagem ou vídeo
+    """
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                sources.extend(os.path.join(root, name) for name in files)
+        else:
+            sources.append(path)
+    return sorted(
+        path for path in sources
+        if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+    )
+
+
+def plan_units(sources, chunk_frames=64, images_per_unit=8):
+    """
+    Divide o trabalho em unidades independentes para os workers.
+
+    Imagens são agrupadas; vídeos são divididos em trechos de chunk_frames
+    frames, de modo que um vídeo longo também ocupa todos os núcleos. Cada
+    worker decodifica a própria unidade, então só os resultados atravessam
+    os processos.
+
+    Yields:
+        ('images', [caminhos]) ou ('video', caminho, primeiro frame,
+        quantidade ou None quando o total de frames é desconhecido)
+    """
+    images = []
+    for path in sources:
+        if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+            images.append(path)
+            if len(images) >= images_per_unit:
+                yield ('images', images)
+                images = []
+            continue
+
+        cap = cv2.VideoCapture(path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        cap.release()
+        if total <= 0:
+            yield ('video', path, 0, None)
+            continue
+        for start in range(0, total, chunk_frames):
+            yield ('video', path, start, min(chunk_frames, total - start))
+
+    if images:
+        yield ('images', images)
+
+
+def _row(source, frame, time_s, result=None, message=None):
+    success = result is not None and result['success']
+    return {
+        'source': source,
+        'frame': frame,
+        'time_s': round(time_s, 3) if time_s is not None else None,
+        'success': success,
+        'width_cm': round(result['dimensions']['width'], 4) if success else None,
+        'length_cm': round(result['dimensions']['length'], 4) if success else None,
+        'detection': result.get('detection') if result is not None else None,
+        'message': message if message is not None else (
+            None if success else 'Referência ou objeto não encontrado'
+        )
+    }
+
+
+def process_unit(unit, reference_width_cm, pyramid_max_width=640, frame_step=1):
+    """
+    Decodifica e mede os frames de uma unidade de trabalho.
+
+    Função de módulo para poder ser executada em outro processo. Dentro de
+    um trecho de vídeo, a região da referência de um frame é reaproveitada
+    no seguinte.
+
+    Returns:
+        Lista de linhas de resultado (ver RESULT_FIELDS)
+    """
+    rows = []
+    if unit[0] == 'images':
+        for path in unit[1]:
+            img = cv2.imread(path, cv2.IMREAD_COLOR)
+            if img is None:
+                rows.append(_row(path, 0, None, message='Imagem ilegível'))
+                continue
+            result = process_frame(img, reference_width_cm, pyramid_max_width=pyramid_max_width)
+            rows.append(_row(path, 0, None, result))
+        return rows
+
+    _, path, start, count = unit
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return [_row(path, start, None, message='Vídeo ilegível')]
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        roi = None
+        index = start
+        while count is None or index < start + count:
+            if not cap.grab():
+                break
+            if index % frame_step == 0:
+                ok, img = cap.retrieve()
+                time_s = index / fps if fps else None
+                if not ok:
+                    rows.append(_row(path, index, time_s, message='Frame ilegível'))
+                else:
+                    result = process_frame(
+                        img, reference_width_cm, roi=roi, pyramid_max_width=pyramid_max_width
+                    )
+                    roi = result['reference_box'] if result['success'] else None
+                    rows.append(_row(path, index, time_s, result))
+            index += 1
+    finally:
+        cap.release()
+    return rows
+
+
+class ResultWriter:
+    def __init__(self, path, output_format=None):
+        """
+        Grava linhas de resultado à medida que ficam prontas.
+
+        Args:
+            path: Arquivo de saída
+            output_format: 'jsonl' ou 'csv' (padrão: pela extensão do arquivo)
+        """
+        if output_format is None:
+            output_format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        if output_format not in ('jsonl', 'csv'):
+            raise ValueError(f'Formato de saída inválido: {output_format}')
+        self.path = path
+        self.output_format = output_format
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._csv = None
+        if output_format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, rows):
+        """Grava um lote de linhas e descarrega no disco."""
+        for row in rows:
+            if self._csv is not None:
+                self._csv.writerow(row)
+            else:
+                self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def analyze_files(paths, output_path, output_format=None, reference_width_cm=10.0,
+                  workers=None, frame_step=1, chunk_frames=64,
+                  pyramid_max_width=None, source_root=None, progress_callback=None):
+    """
+    Mede imagens e vídeos gravados com o mesmo pipeline das câmeras.
+
+    As unidades de trabalho são distribuídas entre processos com no máximo
+    2 * workers unidades em andamento, e os resultados são gravados em ordem
+    assim que ficam prontos, então a memória não cresce com o volume.
+
+    Args:
+        paths: Arquivos ou diretórios
+        output_path: Arquivo de resultados (JSONL ou CSV)
+        output_format: 'jsonl' ou 'csv' (padrão: pela extensão)
+        reference_width_cm: Largura real do objeto de referência em cm
+        workers: Número de processos (padrão: OFFLINE_WORKERS ou núcleos)
+        frame_step: Mede um a cada frame_step frames dos vídeos
+        chunk_frames: Frames de vídeo por unidade de trabalho
+        pyramid_max_width: Largura do frame reduzido na detecção em pirâmide
+        source_root: Se informado, os arquivos aparecem nos resultados com
+            caminho relativo a este diretório
+        progress_callback: Função opcional (processados, total) por unidade
+
+    Returns:
+        dict com totais, estatísticas por arquivo e desempenho
+    """
+    if pyramid_max_width is None:
+        pyramid_max_width = int(os.getenv('PYRAMID_MAX_WIDTH', 640))
+    workers = workers or int(os.getenv('OFFLINE_WORKERS', 0)) or None
+    frame_step = max(1, int(frame_step))
+
+    sources = collect_sources(paths)
+    units = list(plan_units(sources, chunk_frames=chunk_frames))
+    engine = FrameProcessingEngine('process', workers)
+
+    per_source = {}
+    totals = {'frames': 0, 'measured': 0}
+    processed = 0
+    if progress_callback:
+        progress_callback(0, len(units))
+
+    with ResultWriter(output_path, output_format) as writer:
+        def on_result(unit, rows):
+            nonlocal processed
+            if source_root is not None:
+                for row in rows:
+                    row['source'] = os.path.relpath(row['source'], source_root)
+            writer.write(rows)
+            for row in rows:
+                accumulator = per_source.setdefault(row['source'], MeasurementAccumulator())
+                totals['frames'] += 1
+                if row['success']:
+                    totals['measured'] += 1
+                    accumulator.add({'width': row['width_cm'], 'length': row['length_cm']})
+            processed += 1
+            if progress_callback:
+                progress_callback(processed, len(units))
+
+        _, processing = engine.map(
+            process_unit, units, reference_width_cm, pyramid_max_width, frame_step,
+            on_result=on_result, keep_results=False
+        )
+
+    wall = processing['wall_time_ms'] / 1000
+    return {
+        'success': totals['measured'] > 0,
+        'message': (
+            f"{totals['measured']} de {totals['frames']} frames medidos "
+            f'em {len(sources)} arquivos'
+        ),
+        'output': output_path,
+        'format': writer.output_format,
+        'sources': len(sources),
+        'frames': totals['frames'],
+        'measured': totals['measured'],
+        'fps': round(totals['frames'] / wall, 2) if wall > 0 else None,
+        'statistics': {
+            source: accumulator.summary()
+            for source, accumulator in per_source.items()
+            if accumulator.count
+        },
+        'processing': processing
+    }
+
+
+def analyze_uploaded(directory, output_path, output_format=None,
+                     reference_width_cm=10.0, frame_step=1, progress_callback=None):
+    """
+    Analisa arquivos enviados pela API e remove o diretório temporário.
+
+    Returns:
+        dict de analyze_files
+    """
+    try:
+        return analyze_files(
+            [directory], output_path, output_format, reference_width_cm,
+            frame_step=frame_step, source_root=directory,
+            progress_callback=progress_callback
+        )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Mede imagens, diretórios e vídeos gravados em lote.'
+    )
+    parser.add_argument('paths', nargs='+', help='Arquivos ou diretórios')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Arquivo de resultados (.jsonl ou .csv)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'])
+    parser.add_argument('--reference-width', type=float, default=10.0)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--frame-step', type=int, default=1,
+                        help='Mede um a cada N frames dos vídeos')
+    parser.add_argument('--chunk-frames', type=int, default=64)
+    args = parser.parse_args(argv)
+
+    start = time.monotonic()
+
+    def progress(done, total):
+        print(f'\r{done}/{total} unidades', end='', file=sys.stderr, flush=True)
+
+    summary = analyze_files(
+        args.paths, args.output, args.format, args.reference_width,
+        workers=args.workers, frame_step=args.frame_step,
+        chunk_frames=args.chunk_frames, progress_callback=progress
+    )
+    print(file=sys.stderr)
+    print(summary['message'])
+    print(f"{summary['fps']} frames/s, {time.monotonic() - start:.1f} s; "
+          f"resultados em {summary['output']}")
+    return 0 if summary['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
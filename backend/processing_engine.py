@@ -0,0 +1,166 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+PROCESSING_MODES = ('sequential', 'thread', 'process')
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _timed_call(func, item, args):
+    # Executado no worker: mede apenas o tempo de processamento do frame
+    start = time.perf_counter()
+    result = func(item, *args)
+    return result, time.perf_counter() - start
+
+
+def _get_executor(mode, max_workers):
+    key = (mode, max_workers)
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            if mode == 'process':
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+            else:
+                executor = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix='frame-processing'
+                )
+            _executors[key] = executor
+        return executor
+
+
+def shutdown_executors():
+    """Encerra os pools de processamento compartilhados."""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_executors)
+
+
+class FrameProcessingEngine:
+    def __init__(self, mode=None, max_workers=None):
+        """
+        Distribui o processamento de frames entre threads ou processos.
+
+        Args:
+            mode: 'sequential', 'thread' ou 'process' (padrão: PROCESSING_MODE
+                ou 'thread')
+            max_workers: Número de workers (padrão: PROCESSING_WORKERS ou
+                número de núcleos)
+        """
+        mode = mode or os.getenv('PROCESSING_MODE', 'thread')
+        if mode not in PROCESSING_MODES:
+            raise ValueError(f'Modo de processamento inválido: {mode}')
+
+        self.mode = mode
+        self.max_workers = max_workers or int(
+            os.getenv('PROCESSING_WORKERS', os.cpu_count() or 1)
+        )
+        if self.mode == 'sequential':
+            self.max_workers = 1
+
+    def map(self, func, items, *args, stop_when=None, on_result=None,
+            keep_results=True):
+        """
+        Aplica func(item, *args) a cada item, preservando a ordem de entrada.
+
+        Os itens são consumidos à medida que chegam (por exemplo, frames de
+        uma câmera), com no máximo 2 * max_workers itens em processamento
+        para limitar o uso de memória. Em modo 'process', func e os
+        argumentos precisam ser serializáveis (funções de módulo).
+
+        Args:
+            func: Função aplicada a cada item
+            items: Iterável de itens
+            *args: Argumentos adicionais repassados a func
+            stop_when: Predicado opcional sobre o resultado; no modo
+                sequencial, interrompe o consumo dos itens quando verdadeiro
+            on_result: Função opcional on_result(item, resultado), chamada em
+                ordem assim que cada resultado fica pronto; o item é liberado
+                logo depois, então quem precisar dele deve guardá-lo
+            keep_results: Se False, os resultados não são acumulados (apenas
+                entregues a on_result), para fluxos longos com memória limitada
+
+        Returns:
+            Tupla (resultados em ordem, dict com estatísticas de execução)
+        """
+        start = time.perf_counter()
+        results = []
+        count = 0
+        busy_time = 0.0
+
+        if self.mode == 'sequential':
+            for item in items:
+                result, elapsed = _timed_call(func, item, args)
+                count += 1
+                if keep_results:
+                    results.append(result)
+                busy_time += elapsed
+                if on_result is not None:
+                    on_result(item, result)
+                if stop_when is not None and stop_when(result):
+                    break
+        else:
+            executor = _get_executor(self.mode, self.max_workers)
+            in_flight = deque()
+            max_in_flight = 2 * self.max_workers
+
+            def collect():
+                nonlocal count
+                item, future = in_flight.popleft()
+                result, elapsed = future.result()
+                count += 1
+                if keep_results:
+                    results.append(result)
+                if on_result is not None:
+                    on_result(item, result)
+                return elapsed
+
+            for item in items:
+                in_flight.append((item, executor.submit(_timed_call, func, item, args)))
+                while len(in_flight) >= max_in_flight:
+                    busy_time += collect()
+
+            while in_flight:
+                busy_time += collect()
+
+        return results, _build_stats(
+            self.mode, self.max_workers, count,
+            time.perf_counter() - start, busy_time
+        )
+
+
+def _build_stats(mode, workers, frames, wall_time, busy_time):
+    return {
+        'mode': mode,
+        'workers': workers,
+        'frames': frames,
+        'wall_time_ms': round(wall_time * 1000, 2),
+        'processing_time_ms': round(busy_time * 1000, 2),
+        # Tempo que o processamento sequencial levaria / tempo real
+        'speedup': round(busy_time / wall_time, 2) if wall_time > 0 else 1.0
+    }
+
+
+def combine_stats(first, second):
+    """
+    Soma as estatísticas de duas execuções consecutivas de map.
+
+    O modo e o número de workers reportados são os da segunda execução.
+    """
+    return _build_stats(
+        second['mode'],
+        second['workers'],
+        first['frames'] + second['frames'],
+        (first['wall_time_ms'] + second['wall_time_ms']) / 1000,
+        (first['processing_time_ms'] + second['processing_time_ms']) / 1000
+    )
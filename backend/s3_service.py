@@ -1,22 +1,178 @@
-import boto3
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 from dotenv import load_dotenv
 
+from image_index import is_thumbnail_key, peek_image_index, thumbnail_key
+from metrics import increment, timed
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
+# Limite de chaves por chamada de delete_objects no S3
+DELETE_BATCH_SIZE = 1000
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def storage_backend():
+    """
+    Armazenamento configurado em STORAGE_BACKEND: 's3' (padrão) ou 'local'
+    (disco local, ver LocalStorageClient).
+    """
+    return os.getenv('STORAGE_BACKEND', 's3').lower()
+
+
+def get_s3_client():
+    """
+    Retorna o cliente de armazenamento compartilhado pelo processo.
+    
+    Todo o acesso ao armazenamento passa pelas operações do cliente boto3
+    (put_object, head_object, delete_objects, list_objects_v2...); com
+    STORAGE_BACKEND=local, o cliente é um LocalStorageClient com as mesmas
+    operações, configurável por STORAGE_LOCAL_DIR e STORAGE_PUBLIC_URL.
+    
+    O cliente é criado na primeira chamada (boto3 só é importado nesse
+    momento) e reaproveita o pool de conexões entre requisições; clientes
+    boto3 podem ser usados por várias threads. Configurável pelas variáveis
+    S3_MAX_POOL_CONNECTIONS, S3_MAX_ATTEMPTS, S3_CONNECT_TIMEOUT e
+    S3_READ_TIMEOUT.
+    """
+    global _s3_client
+    if _s3_client is not None:
+        return _s3_client
+    
+    with _s3_client_lock:
+        if _s3_client is None and storage_backend() == 'local':
+            from local_storage import DEFAULT_STORAGE_DIR, LocalStorageClient
+            
+            _s3_client = LocalStorageClient(
+                root=os.getenv('STORAGE_LOCAL_DIR', DEFAULT_STORAGE_DIR),
+                base_url=os.getenv('STORAGE_PUBLIC_URL', 'http://localhost:5000/api/storage')
+            )
+        if _s3_client is None:
+            import boto3
+            from botocore.config import Config
+            
+            config = Config(
+                max_pool_connections=int(os.getenv('S3_MAX_POOL_CONNECTIONS', 50)),
+                tcp_keepalive=True,
+                connect_timeout=float(os.getenv('S3_CONNECT_TIMEOUT', 5)),
+                read_timeout=float(os.getenv('S3_READ_TIMEOUT', 30)),
+                retries={
+                    'max_attempts': int(os.getenv('S3_MAX_ATTEMPTS', 3)),
+                    'mode': 'standard'
+                }
+            )
+            _s3_client = boto3.client(
+                's3',
+                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                region_name=os.getenv('AWS_REGION', 'us-east-1'),
+                config=config
+            )
+        return _s3_client
+
+
+def set_s3_client(client):
+    """
+    Substitui o cliente S3 compartilhado (por exemplo, por um simulado em
+    memória). Afeta apenas instâncias de S3Service que ainda não acessaram
+    o cliente.
+    """
+    global _s3_client
+    with _s3_client_lock:
+        _s3_client = client
+
+
+class PresignedUrlCache:
+    def __init__(self, max_size=5000, min_remaining=0.2):
+        """
+        Cache LRU de URLs assinadas com expiração.
+        
+        Uma URL é reaproveitada enquanto restar pelo menos min_remaining da
+        validade original; depois disso é assinada novamente.
+        
+        Args:
+            max_size: Número máximo de URLs em cache
+            min_remaining: Fração mínima da validade que ainda deve restar
+        """
+        self.max_size = max_size
+        self.min_remaining = min_remaining
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Retorna a URL em cache, ou None se ausente ou perto de expirar."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            url, refresh_at = entry
+            if time.monotonic() >= refresh_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return url
+    
+    def put(self, key, url, expiration):
+        """Guarda uma URL assinada válida por expiration segundos."""
+        refresh_at = time.monotonic() + expiration * (1 - self.min_remaining)
+        with self._lock:
+            self._entries[key] = (url, refresh_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def discard(self, bucket_name, s3_key):
+        """Remove do cache todas as URLs de um objeto."""
+        self.discard_many(bucket_name, [s3_key])
+    
+    def discard_many(self, bucket_name, s3_keys):
+        """Remove do cache todas as URLs dos objetos informados (uma só passada)."""
+        s3_keys = set(s3_keys)
+        if not s3_keys:
+            return
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == bucket_name and k[1] in s3_keys]:
+                del self._entries[key]
+
+
+_presigned_cache = PresignedUrlCache(
+    max_size=int(os.getenv('PRESIGNED_CACHE_SIZE', 5000))
+)
+
+
 class S3Service:
-    def __init__(self):
-        """Inicializa o cliente S3 com as credenciais do ambiente."""
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION', 'us-east-1')
-        )
+    def __init__(self, s3_client=None):
+        """
+        Inicializa o serviço S3 com as credenciais do ambiente.
+        
+        Args:
+            s3_client: Cliente boto3 a ser usado (padrão: cliente compartilhado,
+                criado apenas no primeiro acesso)
+        """
+        self._s3_client = s3_client
         self.bucket_name = os.getenv('AWS_BUCKET_NAME')
+        self.storage_backend = storage_backend()
+    
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            self._s3_client = get_s3_client()
+        return self._s3_client
+    
+    def _shared_index(self):
+        # Índice de imagens do processo, se já carregado para este bucket
+        index = peek_image_index()
+        if index is not None and index.bucket_name == self.bucket_name:
+            return index
+        return None
         
     def upload_image(self, file_path, object_name=None):
         """
@@ -38,24 +194,27 @@ class S3Service:
         
         try:
             # Upload do arquivo
-            self.s3_client.upload_file(
-                file_path,
-                self.bucket_name,
-                s3_key,
-                ExtraArgs={'ContentType': 'image/jpeg'}
-            )
+            with timed('s3_put'):
+                self.s3_client.upload_file(
+                    file_path,
+                    self.bucket_name,
+                    s3_key,
+                    ExtraArgs={'ContentType': 'image/jpeg'}
+                )
             
-            # Gera URL da imagem
-            url = f"https://{self.bucket_name}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{s3_key}"
+            index = self._shared_index()
+            if index is not None:
+                index.add(s3_key, os.path.getsize(file_path))
             
             return {
                 'success': True,
-                'url': url,
+                'url': self.build_url(s3_key),
                 's3_key': s3_key,
                 'message': 'Upload realizado com sucesso'
             }
             
         except ClientError as e:
+            increment('macrovision_upload_failures_total', 'Uploads para o S3 que falharam')
             return {
                 'success': False,
                 'message': f'Erro ao fazer upload: {str(e)}'
@@ -66,38 +225,63 @@ class S3Service:
                 'message': f'Arquivo não encontrado: {file_path}'
             }
     
-    def upload_image_data(self, image_data, filename):
+    def build_key(self, filename):
+        """
+        Monta a chave S3 de um arquivo, com prefixo de data.
+        
+        Args:
+            filename: Nome do arquivo
+            
+        Returns:
+            Chave do objeto no S3
+        """
+        timestamp = datetime.now().strftime('%Y/%m/%d')
+        return f'macrovision/{timestamp}/{filename}'
+    
+    def build_url(self, s3_key):
+        """Retorna a URL pública de um objeto do bucket."""
+        if self.storage_backend == 'local':
+            return self.s3_client.object_url(s3_key)
+        return f"https://{self.bucket_name}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{s3_key}"
+    
+    def upload_image_data(self, image_data, filename, s3_key=None, content_type='image/jpeg'):
         """
         Faz upload de dados de imagem diretamente (sem salvar localmente).
         
         Args:
             image_data: Dados da imagem em bytes
             filename: Nome do arquivo
+            s3_key: Chave já definida do objeto (opcional)
+            content_type: Tipo MIME do objeto
             
         Returns:
             dict com sucesso e URL da imagem
         """
-        timestamp = datetime.now().strftime('%Y/%m/%d')
-        s3_key = f'macrovision/{timestamp}/{filename}'
+        if s3_key is None:
+            s3_key = self.build_key(filename)
         
         try:
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=image_data,
-                ContentType='image/jpeg'
-            )
+            with timed('s3_put'):
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    Body=image_data,
+                    ContentType=content_type
+                )
             
-            url = f"https://{self.bucket_name}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{s3_key}"
+            index = self._shared_index()
+            if index is not None:
+                index.add(s3_key, len(image_data))
             
             return {
                 'success': True,
-                'url': url,
+                'url': self.build_url(s3_key),
                 's3_key': s3_key,
                 'message': 'Upload realizado com sucesso'
             }
             
         except ClientError as e:
+            increment('macrovision_upload_failures_total', 'Uploads para o S3 que falharam')
             return {
                 'success': False,
                 'message': f'Erro ao fazer upload: {str(e)}'
@@ -105,7 +289,7 @@ class S3Service:
     
     def delete_image(self, s3_key):
         """
-        Remove uma imagem do S3.
+        Remove uma imagem do S3, junto com a miniatura, se houver.
         
         Args:
             s3_key: Chave do objeto no S3
@@ -113,23 +297,55 @@ class S3Service:
         Returns:
             dict com status da operação
         """
+        keys = [s3_key] if is_thumbnail_key(s3_key) else [s3_key, thumbnail_key(s3_key)]
         try:
             self.s3_client.delete_object(
                 Bucket=self.bucket_name,
                 Key=s3_key
             )
+            if len(keys) > 1:
+                # Remover uma chave inexistente não é erro no S3
+                self.s3_client.delete_object(
+                    Bucket=self.bucket_name,
+                    Key=keys[1]
+                )
+            
+            index = self._shared_index()
+            if index is not None:
+                index.remove(keys)
+            for key in keys:
+                _presigned_cache.discard(self.bucket_name, key)
             
             return {
                 'success': True,
                 'message': 'Imagem removida com sucesso'
             }
             
-        except ClientError as e:
+        except (ClientError, BotoCoreError) as e:
             return {
                 'success': False,
                 'message': f'Erro ao remover imagem: {str(e)}'
             }
     
+    def iter_objects(self, prefix='macrovision/'):
+        """
+        Percorre todos os objetos de um prefixo, página a página.
+        
+        Args:
+            prefix: Prefixo para filtrar objetos
+            
+        Yields:
+            dict com key, size e last_modified (datetime) de cada objeto
+        """
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield {
+                    'key': obj['Key'],
+                    'size': obj['Size'],
+                    'last_modified': obj['LastModified']
+                }
+    
     def list_images(self, prefix='macrovision/'):
         """
         Lista todas as imagens em um prefixo específico.
@@ -141,15 +357,7 @@ class S3Service:
             Lista de chaves de objetos
         """
         try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix
-            )
-            
-            if 'Contents' not in response:
-                return []
-            
-            return [obj['Key'] for obj in response['Contents']]
+            return [obj['key'] for obj in self.iter_objects(prefix)]
             
         except ClientError as e:
             print(f'Erro ao listar imagens: {str(e)}')
@@ -159,6 +367,8 @@ class S3Service:
         """
         Gera uma URL assinada temporária para acesso à imagem.
         
+        URLs já assinadas são reaproveitadas até perto de expirar.
+        
         Args:
             s3_key: Chave do objeto no S3
             expiration: Tempo de expiração em segundos (padrão: 1 hora)
@@ -166,6 +376,11 @@ class S3Service:
         Returns:
             URL assinada ou None em caso de erro
         """
+        cache_key = (self.bucket_name, s3_key, expiration)
+        url = _presigned_cache.get(cache_key)
+        if url is not None:
+            return url
+        
         try:
             url = self.s3_client.generate_presigned_url(
                 'get_object',
@@ -175,48 +390,148 @@ class S3Service:
                 },
                 ExpiresIn=expiration
             )
+            _presigned_cache.put(cache_key, url, expiration)
             return url
             
         except ClientError as e:
             print(f'Erro ao gerar URL assinada: {str(e)}')
             return None
     
-    def clear_old_images(self, days=30):
+    def generate_presigned_urls(self, s3_keys, expiration=3600):
+        """
+        Gera URLs assinadas para várias imagens de uma vez.
+        
+        Args:
+            s3_keys: Lista de chaves no S3
+            expiration: Tempo de expiração em segundos
+            
+        Returns:
+            dict chave -> URL assinada (None para chaves com erro)
+        """
+        return {
+            s3_key: self.generate_presigned_url(s3_key, expiration)
+            for s3_key in s3_keys
+        }
+    
+    def delete_images(self, s3_keys, max_workers=4, progress_callback=None):
+        """
+        Remove várias imagens usando delete_objects em lotes de 1000 chaves.
+        
+        Os lotes são enviados em paralelo.
+        
+        Args:
+            s3_keys: Lista de chaves a remover
+            max_workers: Número de lotes enviados simultaneamente
+            progress_callback: Função opcional progress_callback(processadas, total)
+            
+        Returns:
+            dict com sucesso, quantidade removida e erros por chave
+        """
+        s3_keys = list(s3_keys)
+        total = len(s3_keys)
+        chunks = [
+            s3_keys[i:i + DELETE_BATCH_SIZE]
+            for i in range(0, total, DELETE_BATCH_SIZE)
+        ]
+        deleted = []
+        errors = []
+        processed = 0
+        
+        def delete_chunk(chunk):
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={
+                    'Objects': [{'Key': key} for key in chunk],
+                    'Quiet': True
+                }
+            )
+            failed = response.get('Errors', [])
+            failed_keys = {error['Key'] for error in failed}
+            return [key for key in chunk if key not in failed_keys], failed
+        
+        if progress_callback:
+            progress_callback(0, total)
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {executor.submit(delete_chunk, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    chunk_deleted, chunk_errors = future.result()
+                except (ClientError, BotoCoreError) as e:
+                    chunk_deleted = []
+                    chunk_errors = [
+                        {'Key': key, 'Message': str(e)} for key in chunk
+                    ]
+                
+                deleted.extend(chunk_deleted)
+                # URLs em cache de objetos removidos apontariam para 404
+                _presigned_cache.discard_many(self.bucket_name, chunk_deleted)
+                errors.extend(
+                    {'key': error['Key'], 'message': error.get('Message', '')}
+                    for error in chunk_errors
+                )
+                processed += len(chunk)
+                if progress_callback:
+                    progress_callback(processed, total)
+        
+        index = self._shared_index()
+        if index is not None:
+            index.remove(deleted)
+        
+        return {
+            'success': not errors,
+            'deleted_count': len(deleted),
+            'errors': errors,
+            'message': f'{len(deleted)} imagens removidas'
+        }
+    
+    def clear_old_images(self, days=30, progress_callback=None):
         """
         Remove imagens antigas do bucket.
         
+        Usa o LastModified retornado pela própria listagem, sem consultar
+        cada objeto, e remove em lotes.
+        
         Args:
             days: Número de dias para considerar imagem como antiga
+            progress_callback: Função opcional progress_callback(processadas, total)
             
         Returns:
             dict com status da operação
         """
         try:
-            images = self.list_images()
-            deleted_count = 0
-            
             cutoff_date = datetime.now().timestamp() - (days * 86400)
             
-            for s3_key in images:
-                response = self.s3_client.head_object(
-                    Bucket=self.bucket_name,
-                    Key=s3_key
-                )
-                
-                last_modified = response['LastModified'].timestamp()
-                
-                if last_modified < cutoff_date:
-                    self.delete_image(s3_key)
-                    deleted_count += 1
+            old_keys = [
+                obj['key'] for obj in self.iter_objects()
+                if obj['last_modified'].timestamp() < cutoff_date
+            ]
             
-            return {
-                'success': True,
-                'message': f'{deleted_count} imagens antigas removidas'
-            }
+            result = self.delete_images(old_keys, progress_callback=progress_callback)
+            result['message'] = f"{result['deleted_count']} imagens antigas removidas"
+            return result
             
         except ClientError as e:
             return {
                 'success': False,
                 'message': f'Erro ao limpar imagens antigas: {str(e)}'
             }
-        
\ No newline at end of file
+
+
+_s3_service = None
+_s3_service_lock = threading.Lock()
+
+
+def get_s3_service():
+    """
+    Retorna o S3Service compartilhado pelo processo, criado no primeiro uso.
+    
+    O cliente de armazenamento (e o boto3) só é carregado quando o serviço
+    acessa o bucket pela primeira vez.
+    """
+    global _s3_service
+    with _s3_service_lock:
+        if _s3_service is None:
+            _s3_service = S3Service()
+        return _s3_service
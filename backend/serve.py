@@ -0,0 +1,87 @@
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+
+def _configure_worker_processes():
+    # Workers de processamento (PROCESSING_MODE=process, análise offline)
+    # partem de um processo limpo: não herdam câmeras abertas, threads de
+    # captura nem o socket do servidor, que ficam só neste processo
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        multiprocessing.set_start_method('forkserver', force=True)
+        multiprocessing.set_forkserver_preload(['measurement_service'])
+
+
+def preload():
+    """
+    Carrega em segundo plano o que a primeira análise usaria (OpenCV e
+    serviços de medição) e retoma os uploads pendentes no spool.
+
+    O servidor já atende enquanto isso acontece.
+    """
+    # Importar measurement_service carrega cv2 e numpy; o codificador de
+    # imagens também fica pronto antes da primeira análise
+    import measurement_service
+    from upload_queue import get_upload_queue
+
+    measurement_service.get_image_encoder()
+    get_upload_queue().start()
+
+
+def _serve_waitress(app, host, port, threads):
+    from waitress import serve
+
+    # Cada cliente ao vivo (MJPEG/SSE) ocupa uma thread enquanto assiste
+    serve(app, host=host, port=port, threads=threads, ident='MacroVision')
+
+
+def _serve_werkzeug(app, host, port, threads):
+    from werkzeug.serving import make_server
+
+    # Sem waitress: servidor do werkzeug com uma thread por requisição,
+    # sem modo debug nem reloader
+    make_server(host, port, app, threaded=True).serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Inicia o backend em modo de produção (um processo, várias threads).'
+    )
+    parser.add_argument('--host', default=os.getenv('SERVER_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('SERVER_PORT', 5000)))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('SERVER_THREADS', 16)),
+                        help='Requisições atendidas simultaneamente')
+    parser.add_argument('--no-preload', action='store_true',
+                        default=os.getenv('SERVER_PRELOAD', '1') == '0',
+                        help='Não carrega o OpenCV antes da primeira análise')
+    args = parser.parse_args(argv)
+
+    _configure_worker_processes()
+
+    from app import app
+
+    if not args.no_preload:
+        threading.Thread(target=preload, name='preload', daemon=True).start()
+
+    if importlib.util.find_spec('waitress') is not None:
+        server, run = 'waitress', _serve_waitress
+    else:
+        server, run = 'werkzeug', _serve_werkzeug
+
+    detail = f'{args.threads} threads' if server == 'waitress' else 'uma thread por requisição'
+    print(f'Backend MacroVision em http://{args.host}:{args.port} ({server}, {detail})',
+          file=sys.stderr)
+    run(app, args.host, args.port, args.threads)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
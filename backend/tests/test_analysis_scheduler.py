@@ -0,0 +1,185 @@
+import threading
+import time
+
+import pytest
+
+import analysis_scheduler
+from analysis_scheduler import AnalysisScheduler, CameraBusyError
+
+
+def run_in_thread(func):
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func()
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            pytest.fail('condição não atingida')
+        time.sleep(0.005)
+
+
+def test_identical_requests_share_one_run():
+    scheduler = AnalysisScheduler(max_queue=4, wait_timeout=5)
+    release = threading.Event()
+    calls = []
+
+    def analysis():
+        calls.append(1)
+        release.wait(2)
+        return {'success': True}
+
+    owner, owner_outcome = run_in_thread(lambda: scheduler.run(0, 'k', analysis))
+    wait_until(lambda: calls)
+    follower, follower_outcome = run_in_thread(lambda: scheduler.run(0, 'k', analysis))
+    time.sleep(0.05)
+    release.set()
+    owner.join(2)
+    follower.join(2)
+
+    assert len(calls) == 1
+    assert owner_outcome['result'] == ({'success': True}, False)
+    assert follower_outcome['result'] == ({'success': True}, True)
+
+
+def test_errors_are_shared_with_coalesced_requests():
+    scheduler = AnalysisScheduler(max_queue=4, wait_timeout=5)
+    release = threading.Event()
+
+    def analysis():
+        release.wait(2)
+        raise RuntimeError('câmera desconectada')
+
+    owner, owner_outcome = run_in_thread(lambda: scheduler.run(0, 'k', analysis))
+    wait_until(lambda: scheduler.status(0)['busy'])
+    follower, follower_outcome = run_in_thread(lambda: scheduler.run(0, 'k', analysis))
+    time.sleep(0.05)
+    release.set()
+    owner.join(2)
+    follower.join(2)
+
+    assert isinstance(owner_outcome['error'], RuntimeError)
+    assert follower_outcome['error'] is owner_outcome['error']
+
+
+def test_full_queue_is_refused_immediately():
+    scheduler = AnalysisScheduler(max_queue=1, wait_timeout=5, default_duration=2.0)
+    release = threading.Event()
+
+    owner, _ = run_in_thread(lambda: scheduler.run(0, 'a', lambda: release.wait(2)))
+    wait_until(lambda: scheduler.status(0)['busy'])
+    queued, queued_outcome = run_in_thread(lambda: scheduler.run(0, 'b', lambda: 'b'))
+    wait_until(lambda: scheduler.status(0)['queued'] == 1)
+
+    start = time.monotonic()
+    with pytest.raises(CameraBusyError) as excinfo:
+        scheduler.run(0, 'c', lambda: 'c')
+    assert time.monotonic() - start < 0.5
+    # Um em execução e um na fila, 2 s cada
+    assert excinfo.value.retry_after == 4
+
+    release.set()
+    owner.join(2)
+    queued.join(2)
+    assert queued_outcome['result'] == ('b', False)
+
+
+def test_queued_request_gives_up_after_wait_timeout():
+    scheduler = AnalysisScheduler(max_queue=4, wait_timeout=0.2)
+    release = threading.Event()
+
+    owner, _ = run_in_thread(lambda: scheduler.run(0, 'a', lambda: release.wait(2)))
+    wait_until(lambda: scheduler.status(0)['busy'])
+
+    with pytest.raises(CameraBusyError):
+        scheduler.run(0, 'b', lambda: 'b')
+    assert scheduler.status(0)['queued'] == 0
+
+    release.set()
+    owner.join(2)
+
+
+def test_cameras_are_scheduled_independently():
+    scheduler = AnalysisScheduler(max_queue=0, wait_timeout=1)
+    release = threading.Event()
+
+    owner, _ = run_in_thread(lambda: scheduler.run(0, 'k', lambda: release.wait(2)))
+    wait_until(lambda: scheduler.status(0)['busy'])
+
+    assert scheduler.run(1, 'k', lambda: 'outra câmera') == ('outra câmera', False)
+    release.set()
+    owner.join(2)
+
+
+def test_coalesced_request_waits_for_a_run_longer_than_wait_timeout():
+    scheduler = AnalysisScheduler(max_queue=4, wait_timeout=0.2, default_duration=1.0)
+
+    owner, _ = run_in_thread(lambda: scheduler.run(0, 'k', lambda: time.sleep(0.6) or 'ok'))
+    wait_until(lambda: scheduler.status(0)['busy'])
+
+    assert scheduler.run(0, 'k', lambda: 'outro') == ('ok', True)
+    owner.join(2)
+
+
+def test_coalesced_request_gives_up_on_a_stuck_run():
+    scheduler = AnalysisScheduler(max_queue=4, wait_timeout=5, default_duration=0.1)
+    release = threading.Event()
+
+    owner, _ = run_in_thread(lambda: scheduler.run(0, 'k', lambda: release.wait(2)))
+    wait_until(lambda: scheduler.status(0)['busy'])
+
+    start = time.monotonic()
+    with pytest.raises(CameraBusyError):
+        scheduler.run(0, 'k', lambda: 'outro')
+    # 3x a duração esperada, não o wait_timeout
+    assert time.monotonic() - start < 1.0
+
+    release.set()
+    owner.join(2)
+
+
+class FakeMeasurementService:
+    calls = []
+    release = threading.Event()
+
+    def __init__(self, camera_id=0, **options):
+        self.options = options
+
+    def perform_analysis(self, save_to_s3=True, async_upload=True, include_timings=False):
+        FakeMeasurementService.calls.append(include_timings)
+        FakeMeasurementService.release.wait(2)
+        return {'success': True, 'timings': {} if include_timings else None}
+
+
+def test_include_timings_is_part_of_the_coalescing_key(monkeypatch):
+    FakeMeasurementService.calls = []
+    FakeMeasurementService.release = threading.Event()
+    monkeypatch.setattr(analysis_scheduler, 'MeasurementService', FakeMeasurementService)
+    monkeypatch.setattr(analysis_scheduler, '_scheduler', AnalysisScheduler(max_queue=4))
+
+    plain, plain_outcome = run_in_thread(
+        lambda: analysis_scheduler.scheduled_analysis(0, num_captures=3)
+    )
+    wait_until(lambda: FakeMeasurementService.calls)
+    timed, timed_outcome = run_in_thread(
+        lambda: analysis_scheduler.scheduled_analysis(0, include_timings=True, num_captures=3)
+    )
+    time.sleep(0.05)
+    FakeMeasurementService.release.set()
+    plain.join(2)
+    timed.join(2)
+
+    assert FakeMeasurementService.calls == [False, True]
+    assert timed_outcome['result']['timings'] == {}
+    assert 'coalesced' not in timed_outcome['result']
+    assert plain_outcome['result']['timings'] is None
@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from benchmarks.fakes import InMemoryS3Client
+from image_index import ImageIndex, parse_date_filter, thumbnail_key
+from s3_service import S3Service
+
+BUCKET = 'bucket-teste'
+
+
+@pytest.fixture
+def index():
+    client = InMemoryS3Client()
+    service = S3Service(s3_client=client)
+    service.bucket_name = BUCKET
+    for day in (17, 18, 19):
+        for i in range(4):
+            key = f'macrovision/2025/01/{day}/img_{i}.jpg'
+            client.put_object(Bucket=BUCKET, Key=key, Body=b'x' * (i + 1))
+            client.objects[(BUCKET, key)]['LastModified'] = datetime(
+                2025, 1, day, 12, i, tzinfo=timezone.utc
+            )
+    # Miniatura só da primeira imagem de cada dia
+    for day in (17, 18, 19):
+        key = thumbnail_key(f'macrovision/2025/01/{day}/img_0.jpg')
+        client.put_object(Bucket=BUCKET, Key=key, Body=b't')
+    return ImageIndex(service.iter_objects, bucket_name=BUCKET)
+
+
+def all_pages(index, **kwargs):
+    keys, token, pages = [], None, 0
+    while True:
+        page = index.query(continuation_token=token, **kwargs)
+        keys.extend(item['key'] for item in page['items'])
+        pages += 1
+        token = page['next_token']
+        if token is None:
+            return keys, pages
+
+
+def test_pages_cover_every_image_once_in_order(index):
+    keys, pages = all_pages(index, page_size=5)
+
+    assert len(keys) == 12
+    assert keys == sorted(keys)
+    assert pages == 3
+
+
+def test_descending_pages_are_reversed(index):
+    ascending, _ = all_pages(index, page_size=5)
+    descending, _ = all_pages(index, page_size=5, descending=True)
+
+    assert descending == ascending[::-1]
+
+
+def test_last_full_page_has_no_next_token(index):
+    page = index.query(page_size=12)
+
+    assert len(page['items']) == 12
+    assert page['next_token'] is None
+
+
+def test_thumbnails_are_attached_not_listed(index):
+    page = index.query(page_size=100)
+
+    assert all('/thumbs/' not in item['key'] for item in page['items'])
+    with_thumb = {item['key'] for item in page['items'] if item['thumbnail_key']}
+    assert with_thumb == {f'macrovision/2025/01/{day}/img_0.jpg' for day in (17, 18, 19)}
+
+
+def test_prefix_pages_stay_inside_the_prefix(index):
+    prefix = 'macrovision/2025/01/18/'
+    keys, pages = all_pages(index, prefix=prefix, page_size=3)
+
+    assert keys == [f'{prefix}img_{i}.jpg' for i in range(4)]
+    assert pages == 2
+
+    descending, _ = all_pages(index, prefix=prefix, page_size=3, descending=True)
+    assert descending == keys[::-1]
+
+
+def test_date_filters_span_whole_days(index):
+    keys, _ = all_pages(
+        index,
+        start=parse_date_filter('2025-01-18'),
+        end=parse_date_filter('2025-01-18', end=True),
+        page_size=2
+    )
+
+    assert keys == [f'macrovision/2025/01/18/img_{i}.jpg' for i in range(4)]
+
+
+def test_page_size_is_clamped(index):
+    assert len(index.query(page_size=0)['items']) == 1
+    assert len(index.query(page_size=10 ** 6)['items']) == 12
+
+
+def test_incremental_updates_are_paginated(index):
+    index.query()
+    index.add('macrovision/2025/01/18/img_9.jpg', 10)
+    index.remove(['macrovision/2025/01/17/img_0.jpg'])
+
+    keys, _ = all_pages(index, page_size=4)
+
+    assert 'macrovision/2025/01/18/img_9.jpg' in keys
+    assert 'macrovision/2025/01/17/img_0.jpg' not in keys
+    assert len(keys) == 12
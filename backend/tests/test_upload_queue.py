@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from benchmarks.fakes import InMemoryS3Client
+from s3_service import S3Service
+from upload_queue import UploadQueue
+
+
+class FlakyS3Client(InMemoryS3Client):
+    def __init__(self, failures=0):
+        """S3 em memória cujos primeiros `failures` put_object falham."""
+        super().__init__()
+        self.failures = failures
+        self.put_attempts = 0
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        with self._lock:
+            self.put_attempts += 1
+            fail = self.put_attempts <= self.failures
+        if fail:
+            raise ClientError(
+                {'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'}},
+                'PutObject'
+            )
+        return super().put_object(Bucket, Key, Body, ContentType=ContentType, **kwargs)
+
+
+def client_bucket(queue):
+    return queue.s3_service.bucket_name
+
+
+def wait_for_status(queue, upload_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = queue.get_status(upload_id)
+        if status is not None and status['status'] in statuses:
+            return status
+        time.sleep(0.01)
+    pytest.fail(f'upload {upload_id} não chegou a {statuses}: {queue.get_status(upload_id)}')
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(client, **kwargs):
+        kwargs.setdefault('num_workers', 1)
+        kwargs.setdefault('backoff_base', 0.01)
+        kwargs.setdefault('backoff_max', 0.02)
+        queue = UploadQueue(
+            s3_service=S3Service(s3_client=client), spool_dir=str(tmp_path / 'spool'), **kwargs
+        )
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop(timeout=0.1)
+
+
+def test_upload_is_retried_until_it_succeeds(make_queue):
+    client = FlakyS3Client(failures=2)
+    queue = make_queue(client, max_retries=5)
+
+    upload = queue.submit(b'imagem', 'a.jpg', s3_key='macrovision/a.jpg')
+    status = wait_for_status(queue, upload['upload_id'], ('completed', 'failed'))
+
+    assert status['status'] == 'completed'
+    assert status['attempts'] == 3
+    assert client.objects[(client_bucket(queue), 'macrovision/a.jpg')]['Body'] == b'imagem'
+    assert queue.pending_count() == 0
+
+
+def test_upload_fails_after_max_retries_and_stays_in_spool(make_queue):
+    client = FlakyS3Client(failures=10)
+    queue = make_queue(client, max_retries=3)
+
+    upload = queue.submit(b'imagem', 'a.jpg', s3_key='macrovision/a.jpg')
+    status = wait_for_status(queue, upload['upload_id'], ('completed', 'failed'))
+
+    assert status['status'] == 'failed'
+    assert status['attempts'] == 3
+    assert client.put_attempts == 3
+    assert 'SlowDown' in status['message']
+    assert queue.pending_count() == 1
+
+
+def test_spool_is_recovered_by_a_new_queue(make_queue):
+    failing = make_queue(FlakyS3Client(failures=10), max_retries=1)
+    upload = failing.submit(b'imagem', 'a.jpg', s3_key='macrovision/a.jpg')
+    wait_for_status(failing, upload['upload_id'], ('failed',))
+    failing.stop(timeout=0.1)
+
+    # Outro processo (servidor reiniciado) com o mesmo spool
+    client = InMemoryS3Client()
+    queue = make_queue(client)
+    queue.start()
+    status = wait_for_status(queue, upload['upload_id'], ('completed', 'failed'))
+
+    assert status['status'] == 'completed'
+    assert status['s3_key'] == 'macrovision/a.jpg'
+    assert client.objects[(client_bucket(queue), 'macrovision/a.jpg')]['Body'] == b'imagem'
+    assert queue.pending_count() == 0
+
+
+def test_reserved_upload_is_delivered_under_the_reserved_key(make_queue):
+    client = InMemoryS3Client()
+    queue = make_queue(client)
+
+    reserved = queue.reserve('a.jpg', s3_key='macrovision/reservada.jpg')
+    assert reserved['status'] == 'encoding'
+
+    queue.submit(b'imagem', 'a.jpg', upload_id=reserved['upload_id'])
+    status = wait_for_status(queue, reserved['upload_id'], ('completed', 'failed'))
+
+    assert status['status'] == 'completed'
+    assert (client_bucket(queue), 'macrovision/reservada.jpg') in client.objects
+
+
+def test_concurrent_start_spawns_one_set_of_workers(make_queue):
+    queue = make_queue(InMemoryS3Client(), num_workers=2)
+    barrier = threading.Barrier(8)
+    threads = [
+        threading.Thread(target=lambda: (barrier.wait(), queue.start())) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(queue._workers) == 2
+
+
+def test_unexpected_encoding_error_fails_the_reservation(make_queue):
+    from measurement_service import _encode_and_enqueue
+
+    class BrokenEncoder:
+        content_type = 'image/jpeg'
+
+        def encode_image(self, img):
+            raise MemoryError('sem memória')
+
+        def encode_thumbnail(self, img):
+            return b'miniatura'
+
+    queue = make_queue(InMemoryS3Client())
+    upload = queue.reserve('a.jpg')
+    thumb = queue.reserve('a.jpg', 'macrovision/thumbs/a.jpg')
+
+    _encode_and_enqueue(BrokenEncoder(), queue, None, upload, thumb)
+
+    status = queue.get_status(upload['upload_id'])
+    assert status['status'] == 'failed'
+    assert 'sem memória' in status['message']
+    assert wait_for_status(queue, thumb['upload_id'], ('completed',))
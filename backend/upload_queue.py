@@ -0,0 +1,340 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from metrics import increment
+from s3_service import S3Service
+
+DEFAULT_SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload_spool')
+
+
+class UploadQueue:
+    def __init__(self, s3_service=None, spool_dir=DEFAULT_SPOOL_DIR, max_size=100,
+                 num_workers=2, max_retries=5, backoff_base=1.0, backoff_max=60.0,
+                 max_tracked=1000):
+        """
+        Fila de uploads em segundo plano com spool local em disco.
+
+        Cada imagem é gravada no spool antes de entrar na fila e só é removida
+        após o upload ser confirmado, então nada se perde se o servidor
+        reiniciar no meio do caminho.
+
+        Args:
+            s3_service: Instância de S3Service (criada sob demanda se None)
+            spool_dir: Diretório onde as imagens pendentes são guardadas
+            max_size: Capacidade máxima da fila em memória
+            num_workers: Número de threads de upload
+            max_retries: Tentativas por upload antes de marcá-lo como falho
+            backoff_base: Espera inicial (s) entre tentativas, dobrada a cada falha
+            backoff_max: Espera máxima (s) entre tentativas
+            max_tracked: Número de uploads mantidos na consulta de status
+        """
+        self._s3_service = s3_service
+        self.spool_dir = spool_dir
+        self.num_workers = num_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_tracked = max_tracked
+        self._queue = queue.Queue(maxsize=max_size)
+        self._status = OrderedDict()
+        self._queued_ids = set()
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._workers = []
+
+    @property
+    def s3_service(self):
+        if self._s3_service is None:
+            self._s3_service = S3Service()
+        return self._s3_service
+
+    def start(self):
+        """Recupera uploads pendentes do spool e inicia os workers."""
+        # Verificação e criação dos workers sob o lock: chamadas simultâneas
+        # (preload e primeira requisição) não iniciam dois conjuntos
+        with self._lock:
+            if self._workers:
+                return
+            self._workers = [
+                threading.Thread(target=self._run, name=f's3-upload-{i}', daemon=True)
+                for i in range(self.num_workers)
+            ]
+            workers = list(self._workers)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._recover_spool()
+        for worker in workers:
+            worker.start()
+
+    def stop(self, timeout=5.0):
+        """Interrompe os workers; uploads pendentes continuam no spool."""
+        self._stop.set()
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            if worker.is_alive():
+                worker.join(timeout=timeout)
+
+    def _spool_paths(self, upload_id):
+        base = os.path.join(self.spool_dir, upload_id)
+        return base + '.bin', base + '.json'
+
+    def _write_atomic(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _set_status(self, upload_id, **fields):
+        with self._lock:
+            entry = self._status.setdefault(upload_id, {'upload_id': upload_id})
+            entry.update(fields)
+            self._status.move_to_end(upload_id)
+            while len(self._status) > self.max_tracked:
+                self._status.popitem(last=False)
+
+    def _enqueue(self, upload_id, timeout=0):
+        with self._lock:
+            if upload_id in self._queued_ids:
+                return True
+            self._queued_ids.add(upload_id)
+        try:
+            self._queue.put(upload_id, timeout=timeout) if timeout else self._queue.put_nowait(upload_id)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._queued_ids.discard(upload_id)
+            return False
+
+    def reserve(self, filename, s3_key=None):
+        """
+        Reserva um upload cujos dados ainda estão sendo preparados (por
+        exemplo, codificados em outra thread).
+
+        A chave e a URL definitivas já ficam disponíveis; o upload fica com
+        status 'encoding' até ser entregue com submit(..., upload_id=...) ou
+        marcado como falho com fail().
+
+        Returns:
+            dict com upload_id, s3_key, url definitiva e status 'encoding'
+        """
+        upload_id = uuid.uuid4().hex
+        if s3_key is None:
+            s3_key = self.s3_service.build_key(filename)
+        self._set_status(
+            upload_id,
+            status='encoding',
+            s3_key=s3_key,
+            url=self.s3_service.build_url(s3_key),
+            filename=filename,
+            attempts=0
+        )
+        return self.get_status(upload_id)
+
+    def fail(self, upload_id, message):
+        """Marca como falho um upload reservado que não pôde ser preparado."""
+        increment('macrovision_upload_queue_failed_total',
+                  'Uploads em segundo plano que esgotaram as tentativas')
+        self._set_status(upload_id, status='failed', message=message)
+
+    def submit(self, image_data, filename, content_type='image/jpeg', upload_id=None,
+               s3_key=None):
+        """
+        Agenda o upload de uma imagem e retorna imediatamente.
+
+        Args:
+            image_data: Dados da imagem em bytes
+            filename: Nome do arquivo
+            content_type: Tipo MIME do objeto
+            upload_id: Upload reservado com reserve() (opcional)
+            s3_key: Chave já definida do objeto (opcional)
+
+        Returns:
+            dict com upload_id, s3_key, url definitiva e status 'pending'
+        """
+        self.start()
+
+        if upload_id is None:
+            upload_id = uuid.uuid4().hex
+        if s3_key is None:
+            status = self.get_status(upload_id)
+            s3_key = status['s3_key'] if status else self.s3_service.build_key(filename)
+        meta = {
+            'upload_id': upload_id,
+            's3_key': s3_key,
+            'filename': filename,
+            'content_type': content_type,
+            'created_at': time.time()
+        }
+
+        data_path, meta_path = self._spool_paths(upload_id)
+        with self._spool_lock:
+            self._write_atomic(data_path, image_data)
+            # Metadados por último: só uploads completos no disco são recuperados
+            self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+            self._set_status(
+                upload_id,
+                status='pending',
+                s3_key=s3_key,
+                url=self.s3_service.build_url(s3_key),
+                filename=filename,
+                attempts=0
+            )
+
+        # Fila cheia: a imagem fica no spool e é retomada quando houver folga
+        self._enqueue(upload_id)
+
+        return self.get_status(upload_id)
+
+    def get_status(self, upload_id):
+        """
+        Consulta o status de um upload.
+
+        Returns:
+            dict com status ('encoding', 'pending', 'uploading', 'completed'
+            ou 'failed') ou None se o upload não for conhecido
+        """
+        with self._lock:
+            entry = self._status.get(upload_id)
+            return dict(entry) if entry is not None else None
+
+    def pending_count(self):
+        """Número de uploads aguardando no spool."""
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        return sum(1 for name in os.listdir(self.spool_dir) if name.endswith('.json'))
+
+    def _recover_spool(self):
+        with self._spool_lock:
+            self._recover_spool_locked()
+
+    def _recover_spool_locked(self):
+        if not os.path.isdir(self.spool_dir):
+            return
+        entries = []
+        for name in os.listdir(self.spool_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                entries.append((os.path.getmtime(os.path.join(self.spool_dir, name)), name))
+            except FileNotFoundError:
+                continue
+
+        for _, name in sorted(entries):
+            upload_id = name[:-len('.json')]
+            status = self.get_status(upload_id)
+            if status is not None and status['status'] != 'pending':
+                # Em andamento, concluído, ou já esgotou as tentativas
+                # (uploads falhos são retomados ao reiniciar)
+                continue
+            if status is None:
+                try:
+                    with open(os.path.join(self.spool_dir, name), 'rb') as f:
+                        meta = json.loads(f.read())
+                except (OSError, ValueError):
+                    continue
+                self._set_status(
+                    upload_id,
+                    status='pending',
+                    s3_key=meta['s3_key'],
+                    url=self.s3_service.build_url(meta['s3_key']),
+                    filename=meta['filename'],
+                    attempts=0
+                )
+            if not self._enqueue(upload_id):
+                break
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                upload_id = self._queue.get(timeout=5.0)
+            except queue.Empty:
+                # Ociosos: retoma uploads que ficaram só no spool
+                self._recover_spool()
+                continue
+
+            with self._lock:
+                self._queued_ids.discard(upload_id)
+            try:
+                self._upload(upload_id)
+            finally:
+                self._queue.task_done()
+
+    def _upload(self, upload_id):
+        data_path, meta_path = self._spool_paths(upload_id)
+        try:
+            with open(meta_path, 'rb') as f:
+                meta = json.loads(f.read())
+            with open(data_path, 'rb') as f:
+                image_data = f.read()
+        except (OSError, ValueError) as e:
+            self._set_status(upload_id, status='failed', message=f'Spool inválido: {str(e)}')
+            return
+
+        for attempt in range(1, self.max_retries + 1):
+            if self._stop.is_set():
+                return
+            self._set_status(upload_id, status='uploading', attempts=attempt)
+            try:
+                result = self.s3_service.upload_image_data(
+                    image_data,
+                    meta['filename'],
+                    s3_key=meta['s3_key'],
+                    content_type=meta.get('content_type', 'image/jpeg')
+                )
+            except Exception as e:
+                increment('macrovision_upload_failures_total', 'Uploads para o S3 que falharam')
+                result = {'success': False, 'message': f'Erro ao fazer upload: {str(e)}'}
+
+            if result['success']:
+                for path in (meta_path, data_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                self._set_status(
+                    upload_id,
+                    status='completed',
+                    url=result['url'],
+                    message=result['message']
+                )
+                return
+
+            self._set_status(upload_id, message=result['message'])
+            if attempt < self.max_retries:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+                self._stop.wait(delay)
+
+        # Mantém o arquivo no spool para nova tentativa após reiniciar
+        increment('macrovision_upload_queue_failed_total',
+                  'Uploads em segundo plano que esgotaram as tentativas')
+        self._set_status(upload_id, status='failed')
+
+
+_upload_queue = None
+_upload_queue_lock = threading.Lock()
+
+
+def get_upload_queue():
+    """
+    Retorna a fila de uploads compartilhada pelo processo.
+
+    Configurável pelas variáveis UPLOAD_SPOOL_DIR, UPLOAD_QUEUE_SIZE,
+    UPLOAD_WORKERS e UPLOAD_MAX_RETRIES.
+    """
+    global _upload_queue
+    with _upload_queue_lock:
+        if _upload_queue is None:
+            _upload_queue = UploadQueue(
+                spool_dir=os.getenv('UPLOAD_SPOOL_DIR', DEFAULT_SPOOL_DIR),
+                max_size=int(os.getenv('UPLOAD_QUEUE_SIZE', 100)),
+                num_workers=int(os.getenv('UPLOAD_WORKERS', 2)),
+                max_retries=int(os.getenv('UPLOAD_MAX_RETRIES', 5))
+            )
+        return _upload_queue
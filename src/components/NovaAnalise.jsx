@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import '../styles/NovaAnalise.css';
-import { getCameras, testCamera, performAnalysis, getImageUrl } from '../services/api';
+import { getCameras, testCamera, performAnalysis, getImageUrl, waitForUpload } from '../services/api';
 import { analysisService } from '../services/supabaseClient';
 
 function NovaAnalise({ navigateTo }) {
@@ -10,6 +10,9 @@ function NovaAnalise({ navigateTo }) {
   const [cameraStatus, setCameraStatus] = useState(null);
   const [isAnalyzing, setIsAnalyzing] = useState(false);
   const [analysisResult, setAnalysisResult] = useState(null);
+  // 'ready', 'uploading' ou 'failed': a imagem é enviada em segundo plano
+  const [imageStatus, setImageStatus] = useState('ready');
+  const pendingUploadRef = useRef(null);
   const [error, setError] = useState(null);
   const [isSaving, setIsSaving] = useState(false);
 
@@ -94,6 +97,20 @@ function NovaAnalise({ navigateTo }) {
 
     if (result.success) {
       setAnalysisResult(result);
+      const image = result.images && result.images[0];
+      if (image && image.upload_id && image.status !== 'completed') {
+        // A URL já é a definitiva, mas o arquivo só existe após o upload
+        pendingUploadRef.current = image.upload_id;
+        setImageStatus('uploading');
+        waitForUpload(image.upload_id).then((status) => {
+          // Ignora uploads de análises anteriores
+          if (pendingUploadRef.current !== image.upload_id) return;
+          setImageStatus(status === 'completed' ? 'ready' : 'failed');
+        });
+      } else {
+        pendingUploadRef.current = null;
+        setImageStatus('ready');
+      }
       setDimensions({
         width: result.measurements.width,
         length: result.measurements.length,
@@ -174,6 +191,8 @@ function NovaAnalise({ navigateTo }) {
     }
   };
 
+  const resultImage = analysisResult && analysisResult.images && analysisResult.images[0];
+
   return (
     <main className="new-analysis-main">
       <div className="form-section">
@@ -279,9 +298,13 @@ function NovaAnalise({ navigateTo }) {
         <h3>Análise dimensional</h3>
         <div className="image-analysis-container">
           <div className="image-placeholder">
-            {analysisResult && analysisResult.images && analysisResult.images[0] ? (
+            {resultImage && imageStatus === 'uploading' ? (
+              <span>Enviando imagem...</span>
+            ) : resultImage && imageStatus === 'failed' ? (
+              <span>Falha ao enviar a imagem</span>
+            ) : resultImage ? (
               <img 
-                src={getImageUrl(analysisResult.images[0])} 
+                src={getImageUrl(resultImage)} 
                 alt="Foto 1 Análise" 
                 onError={(e) => {
                   console.error('Erro ao carregar imagem 1:', analysisResult.images[0]);
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import '../styles/Relatorios.css';
 import { analysisService } from '../services/supabaseClient';
+import { getThumbnailUrl } from '../services/api';
 
 function Relatorios() {
   const [analyses, setAnalyses] = useState([]);
@@ -241,12 +242,18 @@ function Relatorios() {
                               <strong>Imagens:</strong>
                               <div className="analysis-images">
                                 {analysis.image_urls.map((url, idx) => (
-                                  <img 
-                                    key={idx} 
-                                    src={url} 
-                                    alt={`Análise ${idx + 1}`}
-                                    style={{ width: '200px', margin: '10px', borderRadius: '8px' }}
-                                  />
+                                  <a key={idx} href={url} target="_blank" rel="noopener noreferrer">
+                                    <img 
+                                      src={getThumbnailUrl(url)} 
+                                      alt={`Análise ${idx + 1}`}
+                                      loading="lazy"
+                                      style={{ width: '200px', margin: '10px', borderRadius: '8px' }}
+                                      onError={(e) => {
+                                        // Imagens antigas não têm miniatura
+                                        if (e.target.src !== url) e.target.src = url;
+                                      }}
+                                    />
+                                  </a>
                                 ))}
                               </div>
                             </div>
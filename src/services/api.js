@@ -56,6 +56,10 @@ export const performAnalysis = async (cameraId, options = {}) => {
         camera_id: cameraId,
         reference_width: options.referenceWidth || 10.0,
         num_captures: options.numCaptures || 8,
+        adaptive: options.adaptive || false,
+        tolerance: options.tolerance || 0.05,
+        timings: options.timings || false,
+        multi_object: options.multiObject || false,
       }),
     });
     
@@ -72,11 +76,149 @@ export const performAnalysis = async (cameraId, options = {}) => {
 };
 
 /**
- * Lista todas as imagens armazenadas no S3
+ * Executa a análise com várias câmeras ao mesmo tempo
+ * cameras: [{ cameraId, referenceWidth }]
  */
-export const listImages = async () => {
+export const performBatchAnalysis = async (cameras, options = {}) => {
   try {
-    const response = await fetch(`${API_BASE_URL}/images`);
+    const response = await fetch(`${API_BASE_URL}/analyze/batch`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        cameras: cameras.map((camera) => ({
+          camera_id: camera.cameraId,
+          reference_width: camera.referenceWidth || 10.0,
+        })),
+        num_captures: options.numCaptures || 8,
+        adaptive: options.adaptive || false,
+        tolerance: options.tolerance || 0.05,
+      }),
+    });
+    
+    return await response.json();
+  } catch (error) {
+    console.error('Erro ao executar análise em lote:', error);
+    return { 
+      success: false, 
+      message: error.message,
+      measurements: null,
+      cameras: []
+    };
+  }
+};
+
+/**
+ * URL do vídeo ao vivo (MJPEG) com os frames anotados, para uso em <img src>
+ */
+export const getLiveVideoUrl = (cameraId, referenceWidth = 10.0) =>
+  `${API_BASE_URL}/live/${cameraId}/video?reference_width=${referenceWidth}`;
+
+/**
+ * Assina as medições ao vivo (Server-Sent Events); retorna o EventSource
+ */
+export const subscribeLiveMeasurements = (cameraId, onMeasurement, referenceWidth = 10.0) => {
+  const source = new EventSource(
+    `${API_BASE_URL}/live/${cameraId}/events?reference_width=${referenceWidth}`
+  );
+  source.addEventListener('measurement', (event) => onMeasurement(JSON.parse(event.data)));
+  return source;
+};
+
+/**
+ * Registra a medição ao vivo atual e salva a imagem
+ */
+export const commitLiveMeasurement = async (cameraId, referenceWidth = 10.0) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/live/${cameraId}/commit`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ reference_width: referenceWidth }),
+    });
+    return await response.json();
+  } catch (error) {
+    console.error('Erro ao registrar medição ao vivo:', error);
+    return { success: false, message: error.message, measurements: null, images: [] };
+  }
+};
+
+/**
+ * Envia imagens/vídeos gravados para análise offline em segundo plano
+ * (acompanhe com getJobStatus e baixe os resultados com getOfflineResultsUrl)
+ */
+export const startOfflineAnalysis = async (files, options = {}) => {
+  try {
+    const form = new FormData();
+    Array.from(files).forEach((file) => form.append('files', file));
+    form.append('reference_width', options.referenceWidth ?? 10.0);
+    form.append('frame_step', options.frameStep ?? 1);
+    form.append('format', options.format ?? 'jsonl');
+
+    const response = await fetch(`${API_BASE_URL}/offline/analyze`, {
+      method: 'POST',
+      body: form,
+    });
+    return await response.json();
+  } catch (error) {
+    console.error('Erro ao iniciar análise offline:', error);
+    return { success: false, message: error.message };
+  }
+};
+
+/**
+ * URL completa para baixar os resultados de uma análise offline
+ */
+export const getOfflineResultsUrl = (resultsUrl) =>
+  `${API_BASE_URL.replace(/\/api$/, '')}${resultsUrl}`;
+
+/**
+ * Consulta o status do upload em segundo plano de uma imagem da análise
+ */
+export const getUploadStatus = async (uploadId) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/uploads/${uploadId}`);
+    return await response.json();
+  } catch (error) {
+    console.error('Erro ao consultar upload:', error);
+    return { success: false, message: error.message };
+  }
+};
+
+/**
+ * Aguarda o upload em segundo plano de uma imagem terminar
+ * Retorna o status final ('completed' ou 'failed'), ou 'timeout'
+ */
+export const waitForUpload = async (uploadId, options = {}) => {
+  const interval = options.interval ?? 500;
+  const deadline = Date.now() + (options.timeout ?? 30000);
+  while (Date.now() < deadline) {
+    const result = await getUploadStatus(uploadId);
+    const status = result.success ? result.upload.status : null;
+    if (status === 'completed' || status === 'failed') return status;
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
+  return 'timeout';
+};
+
+/**
+ * Lista as imagens armazenadas no S3, página a página
+ * Opções: prefix, startDate, endDate, pageSize, continuationToken, order
+ */
+export const listImages = async (options = {}) => {
+  try {
+    const params = new URLSearchParams();
+    if (options.prefix) params.append('prefix', options.prefix);
+    if (options.startDate) params.append('start_date', options.startDate);
+    if (options.endDate) params.append('end_date', options.endDate);
+    if (options.pageSize) params.append('page_size', options.pageSize);
+    if (options.continuationToken) params.append('continuation_token', options.continuationToken);
+    if (options.order) params.append('order', options.order);
+
+    const query = params.toString();
+    const response = await fetch(`${API_BASE_URL}/images${query ? `?${query}` : ''}`);
     return await response.json();
   } catch (error) {
     console.error('Erro ao listar imagens:', error);
@@ -84,6 +226,35 @@ export const listImages = async () => {
   }
 };
 
+/**
+ * Consulta o histórico de medições
+ * report: '' (medições individuais), 'daily', 'percentiles' ou 'out-of-tolerance'
+ * Opções: cameraId, startDate, endDate, limit, offset, percentiles (lista),
+ * width, length e tolerance (para 'out-of-tolerance')
+ */
+export const getMeasurementHistory = async (report = '', options = {}) => {
+  try {
+    const params = new URLSearchParams();
+    if (options.cameraId !== undefined) params.append('camera_id', options.cameraId);
+    if (options.startDate) params.append('start_date', options.startDate);
+    if (options.endDate) params.append('end_date', options.endDate);
+    if (options.limit) params.append('limit', options.limit);
+    if (options.offset) params.append('offset', options.offset);
+    if (options.percentiles) params.append('p', options.percentiles.join(','));
+    if (options.width !== undefined) params.append('width', options.width);
+    if (options.length !== undefined) params.append('length', options.length);
+    if (options.tolerance !== undefined) params.append('tolerance', options.tolerance);
+
+    const query = params.toString();
+    const path = report ? `/measurements/${report}` : '/measurements';
+    const response = await fetch(`${API_BASE_URL}${path}${query ? `?${query}` : ''}`);
+    return await response.json();
+  } catch (error) {
+    console.error('Erro ao consultar histórico de medições:', error);
+    return { success: false, message: error.message };
+  }
+};
+
 /**
  * Remove uma imagem específica do S3
  */
@@ -102,9 +273,9 @@ export const deleteImage = async (s3Key) => {
 /**
  * Limpa todas as imagens do S3
  */
-export const clearImages = async () => {
+export const clearImages = async (background = false) => {
   try {
-    const response = await fetch(`${API_BASE_URL}/images/clear`, {
+    const response = await fetch(`${API_BASE_URL}/images/clear${background ? '?background=true' : ''}`, {
       method: 'DELETE',
     });
     return await response.json();
@@ -117,14 +288,14 @@ export const clearImages = async () => {
 /**
  * Remove imagens antigas do S3
  */
-export const cleanupOldImages = async (days = 30) => {
+export const cleanupOldImages = async (days = 30, background = false) => {
   try {
     const response = await fetch(`${API_BASE_URL}/images/cleanup`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ days }),
+      body: JSON.stringify({ days, background }),
     });
     return await response.json();
   } catch (error) {
@@ -133,6 +304,19 @@ export const cleanupOldImages = async (days = 30) => {
   }
 };
 
+/**
+ * Consulta o progresso de uma tarefa em segundo plano (ex.: limpeza de imagens)
+ */
+export const getJobStatus = async (jobId) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+    return await response.json();
+  } catch (error) {
+    console.error('Erro ao consultar tarefa:', error);
+    return { success: false, message: error.message };
+  }
+};
+
 /**
  * Gera URL assinada temporária para uma imagem
  */
@@ -146,6 +330,25 @@ export const getPresignedUrl = async (s3Key) => {
   }
 };
 
+/**
+ * Gera URLs assinadas para várias imagens em uma única chamada
+ */
+export const getPresignedUrls = async (s3Keys, expiration = 3600) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/images/presigned`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ keys: s3Keys, expiration }),
+    });
+    return await response.json();
+  } catch (error) {
+    console.error('Erro ao gerar URLs assinadas:', error);
+    return { success: false, urls: {}, message: error.message };
+  }
+};
+
 /**
  * Retorna URL direta de uma imagem no S3
  * Nota: As imagens agora vêm com URL completa do S3
@@ -162,4 +365,20 @@ export const getImageUrl = (imageData) => {
   
   // Fallback
   return null;
-};
\ No newline at end of file
+};
+
+/**
+ * Retorna a URL da miniatura de uma imagem
+ * Aceita o item de `images` da análise (com thumbnail_url) ou a URL da imagem
+ * completa; nesse caso a miniatura fica em thumbs/ ao lado do arquivo
+ */
+export const getThumbnailUrl = (imageData) => {
+  if (typeof imageData === 'object' && imageData) {
+    return imageData.thumbnail_url || imageData.url || null;
+  }
+  if (typeof imageData === 'string') {
+    const index = imageData.lastIndexOf('/');
+    return `${imageData.slice(0, index + 1)}thumbs/${imageData.slice(index + 1)}`;
+  }
+  return null;
+};